@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""
+CustomVPN CLI - Single entry point for generate, upload, images, deploy, swap, shape, verify, clients, monitor, history and bench
+
+Every subcommand imports what it needs inside its handler, so quick commands
+like `verify --ports` don't load jinja2, qrcode or requests. Check the cost
+of any command with `cli.py startup -- <command> [args]`.
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# Add scripts directory to path
+PROJECT_DIR = Path(__file__).parent
+sys.path.insert(0, str(PROJECT_DIR / 'scripts'))
+
+from env_config import load_env_file
+
+
+STARTUP_BUDGET_MS = 100
+GENERATED_DIR = PROJECT_DIR / 'generated'
+
+
+def load_config(path):
+    """Load config.env, exiting if it is missing"""
+    try:
+        return load_env_file(path)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+def require(config, *keys):
+    missing = [key for key in keys if not config.get(key)]
+    if missing:
+        print(f"Error: Missing required config: {', '.join(missing)}")
+        sys.exit(1)
+
+
+# -- subcommands ----------------------------------------------------------------
+
+def load_shaping(config):
+    """ShapingPlan from config.env (None without SHAPING_TIERS), exiting if malformed"""
+    from shaping import shaping_from_config
+
+    try:
+        return shaping_from_config(config)
+    except ValueError as e:
+        print(f"Error: SHAPING_TIERS: {e}")
+        sys.exit(1)
+
+
+def open_history(args, config):
+    """HistoryStore at --history or HISTORY_DIR (relative to the project), or None"""
+    directory = getattr(args, 'history', None) or config.get('HISTORY_DIR')
+    if not directory:
+        return None
+    from history import HistoryStore
+
+    return HistoryStore(PROJECT_DIR / directory)
+
+
+def cmd_generate(args, config):
+    """Render the Xray config (per shard when USER_DB is set)"""
+    from config_generator import ConfigGenerator
+    from config_validator import ConfigValidationError
+    from geo_data import GeoDataError
+    from env_config import config_flag
+
+    generator = ConfigGenerator(config_dir=PROJECT_DIR / 'configs', output_dir=GENERATED_DIR)
+    if args.precompile:
+        for name in generator.precompile_templates():
+            print(f"  ✓ Compiled {name}")
+        return 0
+    if args.nginx:
+        return generate_nginx(args, config, generator)
+
+    require(config, 'ADMIN_UUID', 'REALITY_DEST', 'REALITY_SERVER_NAMES', 'REALITY_PRIVATE_KEY')
+    server_names = [config['REALITY_SERVER_NAMES']]
+    enable_stats = config_flag(config, 'ENABLE_STATS')
+    shaping = load_shaping(config)
+
+    try:
+        if config.get('USER_DB'):
+            from user_store import UserStore
+
+            store = UserStore(PROJECT_DIR / config['USER_DB'])
+            written = generator.generate_from_store(
+                store, config['REALITY_DEST'], server_names, config['REALITY_PRIVATE_KEY'],
+                enable_stats=enable_stats, force=args.force, geo_source_dir=config.get('GEO_SOURCE_DIR'),
+                shaping=shaping
+            )
+            generator.copy_static_files(shaping)
+            print(f"  ✓ {store.count()} users, {len(written)} shard config(s) regenerated")
+        else:
+            generator.generate_all(
+                config['ADMIN_UUID'], config['REALITY_DEST'], server_names, config['REALITY_PRIVATE_KEY'],
+                [config.get('REALITY_SHORT_IDS', '')], enable_stats=enable_stats,
+                geo_source_dir=config.get('GEO_SOURCE_DIR'), shaping=shaping
+            )
+            print("  ✓ Xray Reality config")
+    except ConfigValidationError as e:
+        print(f"  ✗ Generated config is invalid, not deploying it\n{e}")
+        return 1
+    except GeoDataError as e:
+        print(f"  ✗ Geo data: {e}")
+        return 1
+    except ValueError as e:
+        # e.g. a user store with no enabled users
+        print(f"  ✗ {e}")
+        return 1
+    stats = generator.render_cache.stats
+    print(f"  Output: {GENERATED_DIR} ({stats['rendered']} rendered, {stats['skipped']} unchanged)")
+    return 0
+
+
+def generate_nginx(args, config, generator):
+    """Render nginx.conf sized for the VPS (or this machine with --this-host) and build the site it serves"""
+    require(config, 'DOMAIN', 'WEBSOCKET_PATH')
+    if args.this_host:
+        host = None
+    else:
+        from deployer import Deployer
+
+        require(config, 'VPS_USER')
+        host = Deployer(ssh_alias=args.ssh_alias, remote_user=config['VPS_USER']).probe_host_resources()
+    output = generator.render_nginx_config(config['DOMAIN'], config['WEBSOCKET_PATH'], host=host)
+    print(f"  ✓ {output} ({output.read_text().splitlines()[1].lstrip('# ')})")
+    stats = generator.build_site(force=args.force)
+    print(f"  ✓ Site: {stats['built']} built, {stats['skipped']} unchanged, {stats['removed']} removed")
+    return 0
+
+
+def cmd_upload(args, config):
+    """Copy generated/ to the VPS"""
+    from uploader import Uploader
+    from env_config import config_flag
+
+    require(config, 'VPS_USER')
+    uploader = Uploader(ssh_alias=args.ssh_alias, remote_user=config['VPS_USER'],
+                        delta=args.delta or config_flag(config, 'DELTA_UPLOAD'))
+    results = uploader.upload_configs(generated_dir=GENERATED_DIR, remote_base_dir=args.remote_dir)
+    print(f"\n  ✓ Uploaded {sum(results.values())}/{len(results)} files")
+    return 0 if all(results.values()) else 1
+
+
+def cmd_images(args, config):
+    """Send the container images over SSH, skipping layers the VPS already has"""
+    from image_transfer import ImageTransferError
+
+    try:
+        if args.store:
+            from image_transfer import DirectoryImageStore, ImageArchive, transfer, print_transfer
+
+            if not args.archive:
+                print("Error: --store needs --archive")
+                return 1
+            print_transfer(transfer(ImageArchive(args.archive), DirectoryImageStore(args.store), full=args.full))
+            return 0
+
+        from deployer import Deployer
+
+        require(config, 'VPS_USER')
+        Deployer(ssh_alias=args.ssh_alias, remote_user=config['VPS_USER']).transfer_docker_images(
+            images=args.image or None, archive=args.archive, full=args.full)
+    except ImageTransferError as e:
+        print(f"  ✗ {e}")
+        return 1
+    return 0
+
+
+def cmd_deploy(args, config):
+    """Run the full deployment (remote by default, --local on the VPS itself)"""
+    if args.local:
+        import deploy_local
+
+        deploy_local.main(config)
+    else:
+        import deploy
+
+        deploy.main(config, ssh_alias=args.ssh_alias)
+    return 0
+
+
+def cmd_swap(args, config):
+    """Blue/green xray swap on the VPS (or the local process stand-in)"""
+    if args.stand_in:
+        from blue_green import stand_in_demo, print_swap
+
+        for result, gap in stand_in_demo(args.drain_timeout):
+            print_swap(result, gap)
+        return 0
+
+    from deployer import Deployer
+
+    require(config, 'VPS_USER')
+    deployer = Deployer(ssh_alias=args.ssh_alias, remote_user=config['VPS_USER'], remote_base_dir=args.remote_dir)
+    sni = (config.get('REALITY_SERVER_NAMES') or '').split(',')[0] or None
+    try:
+        result = deployer.blue_green_swap(drain_timeout=args.drain_timeout,
+                                          probe_host=config.get('DOMAIN') if args.probe else None, server_name=sni)
+    except RuntimeError as e:
+        print(f"  ✗ {e}")
+        return 1
+    return 0 if not result['gap'] or result['gap']['failures'] == 0 else 1
+
+
+def cmd_shape(args, config):
+    """Install the SHAPING_TIERS tc rules on the VPS (or print them with --dry-run)"""
+    shaping = load_shaping(config)
+    if not shaping:
+        print("Error: SHAPING_TIERS is not set (e.g. SHAPING_TIERS=1=50mbit:100mbit:512k,2=10mbit)")
+        return 1
+    if args.dry_run:
+        from shaping import RecordingRunner
+
+        runner = RecordingRunner()
+        shaping.apply(runner)
+        print('\n'.join(runner.commands))
+        return 0
+
+    from deployer import Deployer
+
+    require(config, 'VPS_USER')
+    deployer = Deployer(ssh_alias=args.ssh_alias, remote_user=config['VPS_USER'])
+    return 0 if deployer.apply_shaping(shaping) else 1
+
+
+def cmd_verify(args, config):
+    """Health checks; with no check flags every check runs"""
+    from verifier import Verifier
+
+    domain = args.domain or config.get('DOMAIN')
+    if not domain:
+        print("Error: DOMAIN missing (set it in config.env or pass --domain)")
+        return 1
+    verifier = Verifier(ssh_alias=args.ssh_alias, domain=domain, remote_base_dir=args.remote_dir)
+
+    checks = {
+        'containers': verifier.check_docker_containers,
+        'ports': verifier.check_ports,
+        'ssl': verifier.check_ssl_certificate,
+        'website': verifier.check_website,
+        'redirect': verifier.check_http_redirect,
+    }
+    shaping = load_shaping(config)
+    if shaping:
+        checks['shaping'] = lambda: verifier.check_shaping(shaping)
+    elif args.shaping:
+        print("Error: SHAPING_TIERS is not set")
+        return 1
+    # UDP echo on the VPS (verifier.py --udp-echo PORT), optionally reached through a local XUDP client
+    udp_port = args.udp_port or int(config.get('UDP_CHECK_PORT') or 0)
+    udp_socks = None
+    if config.get('UDP_CHECK_SOCKS'):
+        socks_host, _, socks_port = config['UDP_CHECK_SOCKS'].rpartition(':')
+        udp_socks = (socks_host or '127.0.0.1', int(socks_port))
+    if udp_port:
+        checks['udp'] = lambda: verifier.check_udp(udp_port, socks=udp_socks)
+    elif args.udp:
+        print("Error: no UDP echo port (set UDP_CHECK_PORT or pass --udp-port)")
+        return 1
+    history = open_history(args, config)
+    selected = [name for name in checks if getattr(args, name)]
+    if not selected:
+        results = verifier.verify_all(shaping=shaping, udp_port=udp_port, udp_socks=udp_socks, history=history)
+    else:
+        from history import run_checks
+
+        results = run_checks({name: checks[name] for name in selected}, history)
+    return 0 if all(results.values()) else 1
+
+
+def cmd_clients(args, config):
+    """Admin client link/QR, plus bulk profile export for USER_DB users"""
+    from client_config import ClientConfigGenerator
+
+    require(config, 'ADMIN_UUID', 'DOMAIN', 'REALITY_SERVER_NAMES', 'REALITY_PUBLIC_KEY')
+    sni = config['REALITY_SERVER_NAMES'].split(',')[0]
+    generator = ClientConfigGenerator(output_dir=PROJECT_DIR / 'client_configs', qr_format=args.qr_format)
+    xudp = int(config.get('XUDP_CONCURRENCY') or 0)
+    results = generator.generate_all_configs(
+        config['ADMIN_UUID'], config['DOMAIN'], sni, config['REALITY_PUBLIC_KEY'],
+        config.get('REALITY_SHORT_IDS', ''), xudp_concurrency=xudp
+    )
+    print(f"  ✓ {results['vless_link']}")
+    print(f"  ✓ QR: {results['vless_qr']}")
+    if args.qr_format == 'terminal':
+        print('\n' + results['vless_qr'].read_text())
+
+    if args.export:
+        require(config, 'USER_DB')
+        from client_formats import ServerProfile
+        from exporters import export_profiles
+        from user_store import UserStore
+
+        store = UserStore(PROJECT_DIR / config['USER_DB'])
+        server = ServerProfile(config['DOMAIN'], sni, config['REALITY_PUBLIC_KEY'], xudp_concurrency=xudp)
+        result = export_profiles(store.active_users(), server, args.export)
+        print(f"  ✓ Exported {result['uri']['users']} users in {result['seconds']:.2f}s → {args.export}")
+    return 0
+
+
+def cmd_monitor(args, config):
+    """Continuous probes with a Prometheus /metrics endpoint"""
+    import asyncio
+    from verifier import Verifier
+
+    domain = args.domain or config.get('DOMAIN')
+    if not domain:
+        print("Error: DOMAIN missing (set it in config.env or pass --domain)")
+        return 1
+    monitor = Verifier(ssh_alias=args.ssh_alias, domain=domain, remote_base_dir=args.remote_dir).create_monitor(
+        interval=args.interval, history=open_history(args, config))
+    try:
+        asyncio.run(monitor.serve_forever(args.listen, args.port))
+    except KeyboardInterrupt:
+        print("\nMonitor stopped.")
+    return 0
+
+
+def cmd_history(args, config):
+    """Summaries of recorded check results and latencies"""
+    from history import parse_since, print_summaries
+
+    history = open_history(args, config)
+    if history is None:
+        print("Error: no history directory (set HISTORY_DIR or pass --history)")
+        return 1
+    try:
+        since = parse_since(args.since)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"\n  Last {args.since} ({history.disk_usage() / 1024:.0f} KiB on disk):")
+    print_summaries(history, since, args.metrics)
+    return 0
+
+
+def cmd_bench(args, config):
+    """Benchmark suite; with --baseline, exits 1 on a regression"""
+    from benchmark import run_suite, compare, print_result, print_comparison, load_results, save_results
+
+    try:
+        results = run_suite(args.workloads, args.repeat, args.quick, on_result=print_result)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    if args.output:
+        save_results(results, args.output)
+        print(f"\n  ✓ Results: {args.output}")
+    if not args.baseline:
+        return 0
+    rows = compare(results, load_results(args.baseline), args.threshold)
+    print(f"\n  Against {args.baseline}:")
+    print_comparison(rows)
+    return 1 if any(row['regressed'] for row in rows) else 0
+
+
+def cmd_startup(args, config):
+    """
+    Run a command under `python -X importtime` and report where startup goes
+
+    Only imports are counted (not the command's own network or disk work),
+    so the number is comparable across runs and machines.
+    """
+    import subprocess
+
+    command = [a for a in args.target if a != '--']
+    if not command:
+        command = ['--help']
+    proc = subprocess.run([sys.executable, '-X', 'importtime', __file__, *command],
+                          capture_output=True, text=True)
+
+    # "import time: self [us] | cumulative | imported package"; top-level
+    # modules have no indentation, so their cumulative times add up to the total
+    top_level = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            top_level.append((int(cumulative) / 1000, name.strip()))
+
+    total = sum(ms for ms, _ in top_level)
+    print(f"\n  Import time for: cli.py {' '.join(command)}")
+    for ms, name in sorted(top_level, reverse=True)[:args.top]:
+        print(f"    {ms:>8.1f} ms  {name}")
+    status = "✓" if total <= args.budget else "✗"
+    print(f"\n  {status} Total {total:.1f} ms (budget {args.budget} ms)")
+    return 0 if total <= args.budget else 1
+
+
+# -- argument parsing -------------------------------------------------------------
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='CustomVPN V2 command line')
+    parser.add_argument('--config', default=str(PROJECT_DIR.parent / 'config.env'), help='config.env path')
+    parser.add_argument('--ssh-alias', default='customvpn')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Write a Chrome trace / Perfetto JSON of all spans to FILE')
+    parser.add_argument('--profile', nargs='?', const='deploy.prof', metavar='FILE',
+                        help='Profile the local Python side with cProfile (default: deploy.prof)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    generate = sub.add_parser('generate', help='Render server configs into generated/')
+    generate.add_argument('--force', action='store_true', help='Rebuild every shard')
+    generate.add_argument('--precompile', action='store_true',
+                          help='Only compile templates into the bytecode cache')
+    generate.add_argument('--nginx', action='store_true', help='Only render nginx.conf (sized for the VPS) and build the site')
+    generate.add_argument('--this-host', action='store_true',
+                          help='With --nginx, size for this machine instead of probing the VPS')
+    generate.set_defaults(handler=cmd_generate)
+
+    upload = sub.add_parser('upload', help='Upload generated/ to the VPS')
+    upload.add_argument('--remote-dir', default='/home/shaun/vpn')
+    upload.add_argument('--delta', action='store_true',
+                        help='Send only changed blocks of large files (default: DELTA_UPLOAD)')
+    upload.set_defaults(handler=cmd_upload)
+
+    images = sub.add_parser('images', help='Transfer Docker images to the VPS (only missing layers)')
+    images.add_argument('image', nargs='*', help='Images to docker save (default: the deployed ones)')
+    images.add_argument('--archive', help='Send an existing docker save archive instead')
+    images.add_argument('--store', metavar='DIR', help='Load into a directory image store instead (testing)')
+    images.add_argument('--full', action='store_true', help='Send every layer')
+    images.set_defaults(handler=cmd_images)
+
+    deploy = sub.add_parser('deploy', help='Full deployment')
+    deploy.add_argument('--local', action='store_true', help='Deploy on this machine (run on the VPS)')
+    deploy.set_defaults(handler=cmd_deploy)
+
+    swap = sub.add_parser('swap', help='Blue/green xray swap after uploading a new config')
+    swap.add_argument('--remote-dir', default='/home/shaun/vpn')
+    swap.add_argument('--drain-timeout', type=float, default=60.0,
+                      help='Seconds existing tunnels get on the old container')
+    swap.add_argument('--probe', action='store_true', help='Measure the service gap on DOMAIN:443')
+    swap.add_argument('--stand-in', action='store_true', help='Demo on local processes instead of the VPS')
+    swap.set_defaults(handler=cmd_swap)
+
+    shape = sub.add_parser('shape', help='Apply per-level bandwidth tiers (SHAPING_TIERS) on the VPS')
+    shape.add_argument('--dry-run', action='store_true', help='Print the tc/iptables commands instead')
+    shape.set_defaults(handler=cmd_shape)
+
+    verify = sub.add_parser('verify', help='Health checks (all unless some are selected)')
+    verify.add_argument('--domain', help='Override DOMAIN from config.env')
+    verify.add_argument('--remote-dir', default='/home/shaun/vpn')
+    for check in ('containers', 'ports', 'ssl', 'website', 'redirect', 'shaping', 'udp'):
+        verify.add_argument(f'--{check}', action='store_true', help=f'Run the {check} check')
+    verify.add_argument('--udp-port', type=int, help='UDP echo port for the udp check (default: UDP_CHECK_PORT)')
+    verify.add_argument('--history', metavar='DIR', help='Record results to this history (default: HISTORY_DIR)')
+    verify.set_defaults(handler=cmd_verify)
+
+    clients = sub.add_parser('clients', help='Client links, QR codes and profile export')
+    clients.add_argument('--qr-format', choices=('png', 'svg', 'terminal', 'pil'), default='png')
+    clients.add_argument('--export', metavar='DIR', help='Export profiles for every USER_DB user')
+    clients.set_defaults(handler=cmd_clients)
+
+    monitor = sub.add_parser('monitor', help='Continuous health probes with Prometheus metrics')
+    monitor.add_argument('--domain', help='Override DOMAIN from config.env')
+    monitor.add_argument('--remote-dir', default='/home/shaun/vpn')
+    monitor.add_argument('--interval', type=float, default=30.0)
+    monitor.add_argument('--listen', default='127.0.0.1')
+    monitor.add_argument('--port', type=int, default=9477)
+    monitor.add_argument('--history', metavar='DIR', help='Record every round to this history (default: HISTORY_DIR)')
+    monitor.set_defaults(handler=cmd_monitor)
+
+    history = sub.add_parser('history', help='Summaries of recorded verify/monitor results')
+    history.add_argument('metrics', nargs='*', help='Metrics to summarise (default: all)')
+    history.add_argument('--since', default='7d', help='Window, e.g. 12h, 7d, 2w')
+    history.add_argument('--history', metavar='DIR', help='History directory (default: HISTORY_DIR)')
+    history.set_defaults(handler=cmd_history)
+
+    bench = sub.add_parser('bench', help='Benchmark render/links/QR/upload/verify workloads')
+    bench.add_argument('workloads', nargs='*', help='Workloads to run (default: all)')
+    bench.add_argument('--quick', action='store_true', help='Smaller workloads, no 100k render')
+    bench.add_argument('--repeat', type=int, default=5)
+    bench.add_argument('--output', help='Write results JSON here (e.g. to keep as a baseline)')
+    bench.add_argument('--baseline', help='Compare against an earlier results JSON')
+    bench.add_argument('--threshold', type=float, help='Allowed slowdown for every workload (e.g. 0.2)')
+    bench.set_defaults(handler=cmd_bench)
+
+    startup = sub.add_parser('startup', help='Import-time report for a command')
+    startup.add_argument('--budget', type=float, default=STARTUP_BUDGET_MS, help='Budget in ms')
+    startup.add_argument('--top', type=int, default=15)
+    startup.add_argument('target', nargs=argparse.REMAINDER, help='Command to measure, e.g. -- verify --ports')
+    startup.set_defaults(handler=cmd_startup)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # startup, bench, stand-in and image-store runs need no config; verify/monitor can run from --domain
+    # alone, history from --history
+    if (args.command in ('startup', 'bench') or getattr(args, 'stand_in', False) or getattr(args, 'store', None)
+            or getattr(args, 'domain', None) or (args.command == 'history' and args.history)):
+        config = {}
+    else:
+        config = load_config(args.config)
+
+    try:
+        if args.profile:
+            from tracing import profiled
+
+            with profiled(args.profile):
+                return args.handler(args, config)
+        return args.handler(args, config)
+    finally:
+        if args.trace:
+            from tracing import report
+            report(args.trace)
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\nCancelled.")
+        sys.exit(1)
@@ -3,40 +3,29 @@
 Main Deployment Script - Orchestrates entire VPN deployment
 """
 
-import os
 import sys
+import argparse
+from contextlib import contextmanager
 from pathlib import Path
 
 # Add scripts directory to path
 script_dir = Path(__file__).parent / 'scripts'
 sys.path.insert(0, str(script_dir))
 
-from config_generator import ConfigGenerator
-from uploader import Uploader
-from deployer import Deployer
-from verifier import Verifier
-from client_config import ClientConfigGenerator
+# The deployment modules are imported in main(), so `cli.py deploy` is the only
+# command that pays for them
+from env_config import load_env_file, config_flag
+from tracing import span, profiled, add_trace_arguments, report
 
 
-def load_env_file(env_file='../config.env'):
-    """Load environment variables from config file"""
-    env_vars = {}
-    env_path = Path(__file__).parent / env_file
-
-    if not env_path.exists():
-        print(f"Error: Config file not found: {env_path}")
+def load_config(env_file='../config.env'):
+    """Load config.env next to the project, exiting if it is missing"""
+    try:
+        return load_env_file(Path(__file__).parent / env_file)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
         sys.exit(1)
 
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#'):
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    env_vars[key.strip()] = value.strip()
-
-    return env_vars
-
 
 def print_banner(text):
     """Print a formatted banner"""
@@ -45,127 +34,174 @@ def print_banner(text):
     print("=" * 70 + "\n")
 
 
-def main():
+@contextmanager
+def stage(text):
+    """Print a stage banner and record the stage as a trace span"""
+    print_banner(text)
+    with span(text, 'stage'):
+        yield
+
+
+def main(config=None, ssh_alias='customvpn'):
+    """
+    Run every deployment step
+
+    Args:
+        config: Parsed config.env (default: load ../config.env)
+        ssh_alias: SSH config alias of the VPS
+    """
+    from config_generator import ConfigGenerator
+    from uploader import Uploader
+    from deployer import Deployer
+    from verifier import Verifier
+    from client_config import ClientConfigGenerator
+    from user_store import UserStore
+    from shaping import shaping_from_config
+
     print_banner("CustomVPN V2 - Automated Deployment")
 
     # Step 1: Load configuration
     print("Step 1: Loading configuration...")
-    config = load_env_file()
+    with span("Step 1: Loading configuration", 'stage'):
+        if config is None:
+            config = load_config()
 
     # Required config values
     required_keys = [
-        'VPS_IP', 'VPS_USER', 'DOMAIN',
-        'ADMIN_UUID', 'WEBSOCKET_PATH',
-        'SHADOWSOCKS_PORT'
+        'VPS_USER', 'DOMAIN', 'ADMIN_UUID',
+        'REALITY_DEST', 'REALITY_SERVER_NAMES', 'REALITY_PRIVATE_KEY', 'REALITY_PUBLIC_KEY'
     ]
 
     for key in required_keys:
-        if key not in config:
+        if not config.get(key):
             print(f"Error: Missing required config: {key}")
             sys.exit(1)
 
+    server_names = [config['REALITY_SERVER_NAMES']]
+    short_id = config.get('REALITY_SHORT_IDS', '')
+    enable_stats = config_flag(config, 'ENABLE_STATS')
+    shaping = shaping_from_config(config)
+
     print(f"  ✓ Domain: {config['DOMAIN']}")
-    print(f"  ✓ VPS: {config['VPS_IP']}")
+    print(f"  ✓ VPS: {ssh_alias}")
     print(f"  ✓ UUID: {config['ADMIN_UUID']}")
-    print(f"  ✓ WebSocket Path: {config['WEBSOCKET_PATH']}")
+    print(f"  ✓ Reality Dest: {config['REALITY_DEST']}")
 
     # Step 2: Generate configurations
-    print_banner("Step 2: Generating Configurations")
-
-    project_dir = Path(__file__).parent
-    config_dir = project_dir / 'configs'
-    generated_dir = project_dir / 'generated'
-
-    generator = ConfigGenerator(
-        config_dir=config_dir,
-        output_dir=generated_dir
-    )
-
-    result = generator.generate_all(
-        uuid=config['ADMIN_UUID'],
-        domain=config['DOMAIN'],
-        ws_path=config['WEBSOCKET_PATH'],
-        ss_port=int(config['SHADOWSOCKS_PORT'])
-    )
-
-    print("  ✓ Xray config")
-    print("  ✓ Shadowsocks config")
-    print("  ✓ Nginx config")
-    print("  ✓ Static files")
-    print(f"\n  Shadowsocks Password: {result['ss_password'][:40]}...")
+    with stage("Step 2: Generating Configurations"):
+        project_dir = Path(__file__).parent
+        config_dir = project_dir / 'configs'
+        generated_dir = project_dir / 'generated'
+
+        generator = ConfigGenerator(
+            config_dir=config_dir,
+            output_dir=generated_dir
+        )
+
+        if config.get('USER_DB'):
+            store = UserStore(project_dir / config['USER_DB'])
+            if store.count() == 0:
+                store.add_user(config['ADMIN_UUID'], short_id=short_id or None)
+            try:
+                written = generator.generate_from_store(
+                    store, config['REALITY_DEST'], server_names, config['REALITY_PRIVATE_KEY'],
+                    enable_stats=enable_stats, geo_source_dir=config.get('GEO_SOURCE_DIR'), shaping=shaping
+                )
+            except ValueError as e:
+                print(f"  ✗ {e}")
+                sys.exit(1)
+            generator.copy_static_files(shaping)
+            print(f"  ✓ {store.count()} users, {len(written)} shard config(s) regenerated")
+        else:
+            generator.generate_all(
+                config['ADMIN_UUID'], config['REALITY_DEST'], server_names, config['REALITY_PRIVATE_KEY'],
+                [short_id], enable_stats=enable_stats, geo_source_dir=config.get('GEO_SOURCE_DIR'),
+                shaping=shaping
+            )
+
+        # nginx sized for the VPS, and the site it serves (docker-compose.yml mounts both)
+        host = Deployer(ssh_alias=ssh_alias, remote_user=config['VPS_USER']).probe_host_resources()
+        generator.render_nginx_config(config['DOMAIN'], config.get('WEBSOCKET_PATH') or '/ws', host=host)
+        site = generator.build_site()
+
+        print("  ✓ Xray Reality config")
+        print("  ✓ Geo data")
+        print("  ✓ Static files")
+        print(f"  ✓ nginx.conf ({host.summary()}), site: {site['built']} built, {site['skipped']} unchanged")
 
     # Step 3: Upload to VPS
-    print_banner("Step 3: Uploading Files to VPS")
-
-    uploader = Uploader(
-        ssh_alias='customvpn',
-        remote_user=config['VPS_USER']
-    )
-
-    upload_results = uploader.upload_configs(
-        generated_dir=generated_dir,
-        remote_base_dir='/home/shaun/vpn'
-    )
-
-    success_count = sum(1 for v in upload_results.values() if v)
-    print(f"\n  ✓ Uploaded {success_count}/{len(upload_results)} files")
-
-    if not all(upload_results.values()):
-        print("\n  ⚠ Some files failed to upload. Check errors above.")
-        response = input("  Continue anyway? [y/N]: ")
-        if response.lower() != 'y':
-            sys.exit(1)
+    with stage("Step 3: Uploading Files to VPS"):
+        uploader = Uploader(
+            ssh_alias=ssh_alias,
+            remote_user=config['VPS_USER'],
+            delta=config_flag(config, 'DELTA_UPLOAD')
+        )
+
+        upload_results = uploader.upload_configs(
+            generated_dir=generated_dir,
+            remote_base_dir='/home/shaun/vpn'
+        )
+
+        # Files this setup doesn't generate (e.g. nginx.conf before `generate --nginx`) were skipped
+        failed = [name for name, ok in upload_results.items()
+                  if not ok and (generated_dir / name.rstrip('/')).exists()]
+        print(f"\n  ✓ Uploaded {sum(upload_results.values())}/{len(upload_results)} files")
+
+        if failed:
+            print(f"\n  ⚠ Some files failed to upload: {', '.join(failed)}. Check errors above.")
+            response = input("  Continue anyway? [y/N]: ")
+            if response.lower() != 'y':
+                sys.exit(1)
 
     # Step 4: Deploy on VPS
-    print_banner("Step 4: Deploying on VPS")
-
-    # Use a default email or get from config
-    email = config.get('ADMIN_EMAIL', f"{config['VPS_USER']}@{config['DOMAIN']}")
-
-    deployer = Deployer(
-        ssh_alias='customvpn',
-        remote_user=config['VPS_USER']
-    )
-
-    deploy_success = deployer.deploy(
-        domain=config['DOMAIN'],
-        email=email
-    )
+    with stage("Step 4: Deploying on VPS"):
+        # Use a default email or get from config
+        email = config.get('ADMIN_EMAIL', f"{config['VPS_USER']}@{config['DOMAIN']}")
+
+        deployer = Deployer(
+            ssh_alias=ssh_alias,
+            remote_user=config['VPS_USER']
+        )
+
+        deploy_success = deployer.deploy(
+            domain=config['DOMAIN'],
+            email=email,
+            offline_images=config_flag(config, 'OFFLINE_IMAGES')
+        )
+
+        if not deploy_success:
+            print("\n✗ Deployment failed!")
+            sys.exit(1)
 
-    if not deploy_success:
-        print("\n✗ Deployment failed!")
-        sys.exit(1)
+        if shaping and not deployer.apply_shaping(shaping):
+            print("\n⚠ Bandwidth shaping could not be applied; users run unshaped.")
 
     # Step 5: Verify deployment
-    print_banner("Step 5: Verifying Deployment")
-
-    verifier = Verifier(
-        ssh_alias='customvpn',
-        domain=config['DOMAIN']
-    )
+    with stage("Step 5: Verifying Deployment"):
+        verifier = Verifier(
+            ssh_alias=ssh_alias,
+            domain=config['DOMAIN']
+        )
 
-    verify_results = verifier.verify_all()
+        verify_results = verifier.verify_all(shaping=shaping)
 
-    if not all(verify_results.values()):
-        print("\n⚠ Some verification checks failed!")
-        print("   VPN may still work, but some features might be unavailable.")
+        if not all(verify_results.values()):
+            print("\n⚠ Some verification checks failed!")
+            print("   VPN may still work, but some features might be unavailable.")
 
     # Step 6: Generate client configs
-    print_banner("Step 6: Generating Client Configurations")
+    with stage("Step 6: Generating Client Configurations"):
+        client_gen = ClientConfigGenerator(
+            output_dir=project_dir / 'client_configs',
+            qr_format=config.get('QR_FORMAT', 'png')
+        )
 
-    client_gen = ClientConfigGenerator(
-        output_dir=project_dir / 'client_configs'
-    )
+        client_results = client_gen.generate_all_configs(
+            config['ADMIN_UUID'], config['DOMAIN'], server_names[0], config['REALITY_PUBLIC_KEY'], short_id,
+            xudp_concurrency=int(config.get('XUDP_CONCURRENCY') or 0)
+        )
 
-    client_results = client_gen.generate_all_configs(
-        uuid=config['ADMIN_UUID'],
-        domain=config['DOMAIN'],
-        ws_path=config['WEBSOCKET_PATH'],
-        ss_password=result['ss_password'],
-        ss_port=int(config['SHADOWSOCKS_PORT'])
-    )
-
-    client_gen.print_client_instructions(client_results)
+        client_gen.print_client_instructions(client_results)
 
     # Final summary
     print_banner("Deployment Complete!")
@@ -181,8 +217,16 @@ def main():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CustomVPN V2 automated deployment')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+
     try:
-        main()
+        if args.profile:
+            with profiled(args.profile):
+                main()
+        else:
+            main()
     except KeyboardInterrupt:
         print("\n\nDeployment cancelled by user.")
         sys.exit(1)
@@ -191,3 +235,5 @@ if __name__ == '__main__':
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        report(args.trace)
@@ -3,59 +3,73 @@
 Local Deployment Script - Run this ON the VPS server
 """
 
-import os
 import sys
 import subprocess
 import time
+import argparse
+from contextlib import contextmanager
 from pathlib import Path
 
 # Add scripts directory to path
 script_dir = Path(__file__).parent / 'scripts'
 sys.path.insert(0, str(script_dir))
 
-from config_generator import ConfigGenerator
+from config_generator import ConfigGenerator, COMPOSE_OVERRIDE
 from client_config import ClientConfigGenerator
+from endpoints import parse_endpoints
+from env_config import load_env_file, config_flag
+from user_store import UserStore
+from shaping import shaping_from_config
+from tracing import span, profiled, add_trace_arguments, report
 
 
-def load_env_file(env_file='../config.env'):
-    """Load environment variables from config file"""
-    env_vars = {}
-    env_path = Path(__file__).parent / env_file
-
-    if not env_path.exists():
-        print(f"Error: Config file not found: {env_path}")
+def load_config(env_file='../config.env'):
+    """Load config.env next to the project, exiting if it is missing"""
+    try:
+        return load_env_file(Path(__file__).parent / env_file)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
         sys.exit(1)
 
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#'):
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    env_vars[key.strip()] = value.strip()
-
-    return env_vars
-
 
 def run_command(cmd, shell=False):
     """Run command and return output"""
-    result = subprocess.run(
-        cmd if shell else cmd.split(),
-        capture_output=True,
-        text=True,
-        shell=shell
-    )
+    with span(cmd, 'local') as sp:
+        result = subprocess.run(
+            cmd if shell else cmd.split(),
+            capture_output=True,
+            text=True,
+            shell=shell
+        )
+        sp.set(returncode=result.returncode)
     return result.stdout, result.stderr, result.returncode
 
 
-def main():
+@contextmanager
+def stage(text):
+    """Print a stage banner and record the stage as a trace span"""
+    print("\n" + "=" * 70)
+    print(f"  {text}")
+    print("=" * 70 + "\n")
+    with span(text, 'stage'):
+        yield
+
+
+def main(config=None):
+    """
+    Run every deployment step on this machine
+
+    Args:
+        config: Parsed config.env (default: load ../config.env)
+    """
     print("\n" + "=" * 70)
     print("  CustomVPN V2 - Local Server Deployment")
     print("=" * 70 + "\n")
 
     # Step 1: Load configuration
     print("Step 1: Loading configuration...")
-    config = load_env_file()
+    if config is None:
+        config = load_config()
 
     domain = config['DOMAIN']
     uuid = config['ADMIN_UUID']
@@ -63,6 +77,8 @@ def main():
     reality_server_names = [config['REALITY_SERVER_NAMES']]
     reality_private_key = config.get('REALITY_PRIVATE_KEY', '')
     reality_short_ids = [config.get('REALITY_SHORT_IDS', '')]
+    enable_stats = config_flag(config, 'ENABLE_STATS')
+    user_db = config.get('USER_DB', '')
 
     # Generate keys if not provided
     if not reality_private_key:
@@ -90,93 +106,164 @@ def main():
     print(f"  ✓ Reality Dest: {reality_dest}")
 
     # Step 2: Generate configurations
-    print("\n" + "=" * 70)
-    print("  Step 2: Generating Configurations")
-    print("=" * 70 + "\n")
-
-    project_dir = Path(__file__).parent
-    config_dir = project_dir / 'configs'
-    generated_dir = project_dir / 'generated'
-    deploy_dir = Path.home() / 'vpn'
+    with stage("Step 2: Generating Configurations"):
+        project_dir = Path(__file__).parent
+        config_dir = project_dir / 'configs'
+        generated_dir = project_dir / 'generated'
+        deploy_dir = Path.home() / 'vpn'
+
+        generator = ConfigGenerator(config_dir=config_dir, output_dir=generated_dir)
+        shaping = shaping_from_config(config)
+        store = None
+        if user_db:
+            # Multi-user mode: users live in SQLite, seeded with the admin user
+            store = UserStore(project_dir / user_db)
+            if store.count() == 0:
+                store.add_user(uuid, short_id=reality_short_ids[0])
+            try:
+                written = generator.generate_from_store(
+                    store, reality_dest, reality_server_names, reality_private_key,
+                    enable_stats=enable_stats, geo_source_dir=config.get('GEO_SOURCE_DIR'),
+                    shaping=shaping
+                )
+            except ValueError as e:
+                print(f"  ✗ {e}")
+                sys.exit(1)
+            generator.copy_static_files(shaping)
+            print(f"  ✓ {store.count()} users, {len(written)} shard config(s) regenerated")
+        else:
+            generator.generate_all(
+                uuid, reality_dest, reality_server_names, reality_private_key, reality_short_ids,
+                enable_stats=enable_stats, geo_source_dir=config.get('GEO_SOURCE_DIR'),
+                shaping=shaping
+            )
 
-    generator = ConfigGenerator(config_dir=config_dir, output_dir=generated_dir)
-    result = generator.generate_all(uuid, reality_dest, reality_server_names, reality_private_key, reality_short_ids)
+        # nginx and the site it serves; sized for this machine when host is None
+        generator.render_nginx_config(domain, config.get('WEBSOCKET_PATH') or '/ws')
+        site = generator.build_site()
 
-    print("  ✓ Xray Reality config")
+        print("  ✓ Xray Reality config")
+        print(f"  ✓ nginx.conf, site: {site['built']} built, {site['skipped']} unchanged")
+        if enable_stats:
+            print("  ✓ Traffic stats API on 127.0.0.1:10085")
 
     # Step 3: Create deployment directory
-    print("\n" + "=" * 70)
-    print("  Step 3: Setting up deployment directory")
-    print("=" * 70 + "\n")
-
-    deploy_dir.mkdir(exist_ok=True)
-    (deploy_dir / 'configs').mkdir(exist_ok=True)
-
-    # Copy files to deployment directory
-    import shutil
-    shutil.copy(generated_dir / 'xray-config.json', deploy_dir / 'configs/')
-    shutil.copy(generated_dir / 'docker-compose.yml', deploy_dir)
-
-    print(f"  ✓ Files copied to {deploy_dir}")
+    with stage("Step 3: Setting up deployment directory"):
+        deploy_dir.mkdir(exist_ok=True)
+        (deploy_dir / 'configs').mkdir(exist_ok=True)
+
+        # Copy files to deployment directory
+        import shutil
+        # One config per shard in multi-user mode (xray-config.json when there is one shard)
+        configs = generator.shard_configs(store) if store is not None else [generated_dir / 'xray-config.json']
+        for path in configs:
+            shutil.copy(path, deploy_dir / 'configs/')
+        for stale in (deploy_dir / 'configs').glob('xray-config.shard-*.json'):
+            if stale.name not in {path.name for path in configs}:
+                stale.unlink()
+        shutil.copy(generated_dir / 'docker-compose.yml', deploy_dir)
+        # Host-networking override exists only while shaping is on
+        if (generated_dir / COMPOSE_OVERRIDE).exists():
+            shutil.copy(generated_dir / COMPOSE_OVERRIDE, deploy_dir)
+        else:
+            (deploy_dir / COMPOSE_OVERRIDE).unlink(missing_ok=True)
+        shutil.copytree(generated_dir / 'geo', deploy_dir / 'geo', dirs_exist_ok=True)
+        shutil.copy(generated_dir / 'nginx.conf', deploy_dir / 'configs/')
+        # Replaced, not merged: old content-hashed assets must not linger
+        shutil.rmtree(deploy_dir / 'www', ignore_errors=True)
+        shutil.copytree(generated_dir / 'www', deploy_dir / 'www')
+
+        # nginx's TLS server needs the certbot certificate (see Deployer.obtain_ssl_certificate)
+        (deploy_dir / 'ssl').mkdir(exist_ok=True)
+        live = f"/etc/letsencrypt/live/{domain}"
+        _, stderr, code = run_command(
+            f"sudo cp {live}/fullchain.pem {live}/privkey.pem {deploy_dir}/ssl/ && "
+            f"sudo chown $(id -u):$(id -g) {deploy_dir}/ssl/*.pem", shell=True
+        )
+        if code != 0:
+            print(f"  ⚠ No certificate in {live}; nginx won't start until one is in {deploy_dir / 'ssl'}")
+
+        print(f"  ✓ Files copied to {deploy_dir}")
 
     # Step 4: Stop any existing containers
-    print("\n" + "=" * 70)
-    print("  Step 4: Stopping old containers")
-    print("=" * 70 + "\n")
-
-    run_command(f"docker compose -f {deploy_dir}/docker-compose.yml down", shell=True)
-    print("  ✓ Old containers stopped")
+    with stage("Step 4: Stopping old containers"):
+        run_command(f"cd {deploy_dir} && docker compose down", shell=True)
+        print("  ✓ Old containers stopped")
 
     # Step 5: Pull Docker images
-    print("\n" + "=" * 70)
-    print("  Step 5: Pulling Docker images")
-    print("=" * 70 + "\n")
-
-    images = [
-        "ghcr.io/xtls/xray-core:latest"
-    ]
+    with stage("Step 5: Pulling Docker images"):
+        images = [
+            "ghcr.io/xtls/xray-core:latest",
+            "nginx:alpine"
+        ]
 
-    for image in images:
-        stdout, stderr, code = run_command(f"docker pull {image}")
-        if code == 0:
-            print(f"  ✓ {image}")
+        for image in images:
+            stdout, stderr, code = run_command(f"docker pull {image}")
+            if code == 0:
+                print(f"  ✓ {image}")
 
     # Step 6: Start containers
-    print("\n" + "=" * 70)
-    print("  Step 6: Starting containers")
-    print("=" * 70 + "\n")
-
-    stdout, stderr, code = run_command(f"docker compose -f {deploy_dir}/docker-compose.yml up -d", shell=True)
-    if code == 0:
-        print("  ✓ Containers started")
-        time.sleep(3)
-
-        # Show status
-        stdout, _, _ = run_command("docker ps --format '{{.Names}}\t{{.Status}}'", shell=True)
-        print("\n  Container Status:")
-        for line in stdout.strip().split('\n'):
-            print(f"    {line}")
-    else:
-        print(f"  ✗ Failed: {stderr}")
+    with stage("Step 6: Starting containers"):
+        stdout, stderr, code = run_command(f"cd {deploy_dir} && docker compose up -d", shell=True)
+        if code == 0:
+            print("  ✓ Containers started")
+            time.sleep(3)
+
+            # Show status
+            stdout, _, _ = run_command("docker ps --format '{{.Names}}\t{{.Status}}'", shell=True)
+            print("\n  Container Status:")
+            for line in stdout.strip().split('\n'):
+                print(f"    {line}")
+
+            if shaping:
+                failed = shaping.apply(lambda command: run_command(command, shell=True))
+                for command, error in failed:
+                    print(f"  ✗ {command}: {error}")
+                if not failed:
+                    print(f"  ✓ Bandwidth shaping: {len(shaping.tiers)} tiers on {shaping.interface}")
+        else:
+            print(f"  ✗ Failed: {stderr}")
 
     # Step 7: Generate client configs
-    print("\n" + "=" * 70)
-    print("  Step 7: Generating Client Configurations")
-    print("=" * 70 + "\n")
-
-    # Get public key from config or generate
-    reality_public_key = config.get('REALITY_PUBLIC_KEY', '')
-    if not reality_public_key and reality_private_key:
-        # Try to extract from generated keys
-        _, reality_public_key = ConfigGenerator.generate_reality_keypair()
-
-    client_gen = ClientConfigGenerator(output_dir=project_dir / 'client_configs')
-    client_results = client_gen.generate_all_configs(
-        uuid, domain, reality_server_names[0], reality_public_key, reality_short_ids[0]
-    )
-
-    print(f"\n  📋 Config files saved to: {project_dir / 'client_configs'}")
-    print(f"\n  🔗 VLESS Reality Link:\n  {client_results['vless_link']}")
+    with stage("Step 7: Generating Client Configurations"):
+        # Get public key from config or generate
+        reality_public_key = config.get('REALITY_PUBLIC_KEY', '')
+        if not reality_public_key and reality_private_key:
+            # Try to extract from generated keys
+            _, reality_public_key = ConfigGenerator.generate_reality_keypair()
+
+        # QR_FORMAT: png (default), svg, terminal (printed below, for headless servers) or pil
+        qr_format = config.get('QR_FORMAT', 'png')
+        client_gen = ClientConfigGenerator(output_dir=project_dir / 'client_configs', qr_format=qr_format)
+        # XUDP_CONCURRENCY > 0: UDP mode (games, VoIP) in the JSON client configs
+        xudp = int(config.get('XUDP_CONCURRENCY') or 0)
+        client_results = client_gen.generate_all_configs(
+            uuid, domain, reality_server_names[0], reality_public_key, reality_short_ids[0],
+            xudp_concurrency=xudp
+        )
+
+        if store is not None:
+            user_results = client_gen.generate_user_configs(
+                store, domain, reality_server_names[0], reality_public_key
+            )
+            print(f"  ✓ Per-user configs: {len(user_results['written'])} written, "
+                  f"{len(user_results['removed'])} removed")
+
+        if config.get('SERVER_ENDPOINTS'):
+            # Extra nodes sharing this server's Reality keys, e.g. "tokyo=1.2.3.4,sg=5.6.7.8:8443"
+            multi = client_gen.generate_multi_endpoint_configs(
+                uuid, parse_endpoints(config['SERVER_ENDPOINTS']), reality_server_names[0],
+                reality_public_key, reality_short_ids[0], xudp_concurrency=xudp
+            )
+            for node in multi['ranking']:
+                latency = f"{node['handshake_ms']:.1f} ms" if node['reachable'] else node['error']
+                print(f"  {'✓' if node['reachable'] else '✗'} {node['label']:<16} {latency}")
+            print(f"  ✓ Multi-endpoint profiles: {multi['files']['singbox'].parent}")
+
+        print(f"\n  📋 Config files saved to: {project_dir / 'client_configs'}")
+        print(f"\n  🔗 VLESS Reality Link:\n  {client_results['vless_link']}")
+        if qr_format == 'terminal':
+            print('\n' + client_results['vless_qr'].read_text())
 
     print("\n" + "=" * 70)
     print("  Deployment Complete!")
@@ -186,8 +273,16 @@ def main():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CustomVPN V2 local (on-server) deployment')
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+
     try:
-        main()
+        if args.profile:
+            with profiled(args.profile):
+                main()
+        else:
+            main()
     except KeyboardInterrupt:
         print("\n\nDeployment cancelled.")
         sys.exit(1)
@@ -196,3 +291,5 @@ if __name__ == '__main__':
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        report(args.trace)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Timed workloads for the generate/clients/upload/verify toolchain, with baseline comparison
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import socket
+import shutil
+import platform
+import tempfile
+import statistics
+import contextlib
+import threading
+import uuid as uuid_lib
+from pathlib import Path
+
+from tracing import tracer
+
+
+CONFIG_DIR = Path(__file__).resolve().parent.parent / 'configs'
+# Slower than this fraction over the baseline's best run counts as a regression
+DEFAULT_THRESHOLD = 0.25
+# Subprocess- and socket-bound workloads are noisier than pure Python ones
+THRESHOLDS = {'upload_small_files': 0.5, 'delta_upload': 0.5, 'verify_stand_in': 0.5}
+
+
+# -- fakes -----------------------------------------------------------------------
+
+_SSH = '''import os, sys
+os.execvp('sh', ['sh', '-c', sys.argv[2]])
+'''
+
+# scp [-r] SRC... ALIAS:DST -> cp [-r] SRC... DST
+_SCP = '''import os, sys
+args = [a.split(':', 1)[1] if ':' in a and not a.startswith('/') else a for a in sys.argv[1:]]
+os.execvp('cp', ['cp'] + args)
+'''
+
+_DOCKER = '''import sys
+if sys.argv[1:2] == ['ps']:
+    for name in ('xray', 'shadowsocks', 'nginx'):
+        print(f"{name}\\tUp 2 hours")
+'''
+
+
+@contextlib.contextmanager
+def ssh_shim():
+    """
+    Put fake ssh/scp/docker first on PATH for the duration of the block
+
+    ssh runs the command locally and scp copies locally, so Uploader and
+    Verifier take their real subprocess paths against a directory on this
+    machine; remote paths are used as local ones.
+    """
+    bin_dir = Path(tempfile.mkdtemp(prefix='ssh-shim-'))
+    for name, source in (('ssh', _SSH), ('scp', _SCP), ('docker', _DOCKER)):
+        path = bin_dir / name
+        path.write_text(f"#!{sys.executable}\n{source}")
+        path.chmod(0o755)
+    old_path = os.environ.get('PATH', '')
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{old_path}"
+    try:
+        yield bin_dir
+    finally:
+        os.environ['PATH'] = old_path
+        shutil.rmtree(bin_dir, ignore_errors=True)
+
+
+class _Listener:
+    """TCP server that accepts and closes, standing in for a service port"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+def fake_users(count):
+    return [{'uuid': str(uuid_lib.UUID(int=i + 1)), 'email': f"user{i}@bench", 'short_id': f"{i:016x}"}
+            for i in range(count)]
+
+
+# -- workloads -------------------------------------------------------------------
+# Each factory prepares its inputs in `work_dir` and returns (run, items, cleanup);
+# only run() is timed.
+
+def render_workload(users):
+    def factory(work_dir):
+        from config_generator import ConfigGenerator
+
+        generator = ConfigGenerator(CONFIG_DIR, work_dir / 'generated')
+        clients = generator.build_clients(fake_users(users))
+        output = generator.output_dir / 'xray-config.json'
+
+        def run():
+            # A missing output defeats the render cache, so every run renders
+            if output.exists():
+                output.unlink()
+            generator.render_xray_config(None, 'www.microsoft.com:443', ['www.microsoft.com'], 'k' * 43,
+                                         [''], clients=clients)
+        return run, users, None
+    return factory
+
+
+def links_workload(count):
+    def factory(work_dir):
+        from client_config import ClientConfigGenerator
+
+        generator = ClientConfigGenerator(output_dir=work_dir / 'clients')
+        users = fake_users(count)
+
+        def run():
+            for user in users:
+                generator.generate_vless_link(user['uuid'], 'vpn.example.com', sni='www.microsoft.com',
+                                              public_key='k' * 43, short_id=user['short_id'])
+        return run, count, None
+    return factory
+
+
+def qr_workload(count, fmt='png'):
+    def factory(work_dir):
+        from client_config import ClientConfigGenerator
+        from qr_render import qr_matrix
+
+        generator = ClientConfigGenerator(output_dir=work_dir / 'clients', qr_format=fmt)
+        links = [generator.generate_vless_link(u['uuid'], 'vpn.example.com', sni='www.microsoft.com',
+                                               public_key='k' * 43, short_id=u['short_id'])
+                 for u in fake_users(count)]
+
+        def run():
+            # Distinct links and a cleared matrix cache: every run encodes from scratch
+            qr_matrix.cache_clear()
+            for i, link in enumerate(links):
+                generator.generate_qr_code(link, f"user{i}")
+        return run, count, None
+    return factory
+
+
+def upload_workload(files):
+    def factory(work_dir):
+        from uploader import Uploader
+
+        generated = work_dir / 'generated'
+        for name in ('xray-config.json', 'shadowsocks-config.json', 'docker-compose.yml', 'nginx.conf'):
+            (generated / name).parent.mkdir(parents=True, exist_ok=True)
+            (generated / name).write_text('{}\n')
+        for i in range(files):
+            page = generated / 'www' / f"d{i % 20}" / f"asset{i}.css"
+            page.parent.mkdir(parents=True, exist_ok=True)
+            page.write_text(f".c{i}{{color:#{i % 4096:03x}}}\n" * 20)
+
+        shim = ssh_shim()
+        shim.__enter__()
+        uploader = Uploader(ssh_alias='bench', remote_user='bench')
+
+        def run():
+            shutil.rmtree(work_dir / 'remote', ignore_errors=True)
+            results = uploader.upload_configs(generated, remote_base_dir=str(work_dir / 'remote'))
+            if not all(results.values()):
+                raise RuntimeError(f"upload through the ssh shim failed: {results}")
+        return run, files + 4, lambda: shim.__exit__(None, None, None)
+    return factory
+
+
+def delta_upload_workload(clients):
+    def factory(work_dir):
+        from uploader import Uploader
+        from delta_sync import _large_config
+
+        # Two versions one line apart; every run turns the remote copy into the other one
+        old = _large_config(clients)
+        middle = old.index(b'\n', len(old) // 2) + 1
+        versions = [work_dir / 'a.json', work_dir / 'b.json']
+        versions[0].write_bytes(old)
+        versions[1].write_bytes(old[:middle] + b'        {"id": "new", "email": "new@bench"},\n' + old[middle:])
+        remote = work_dir / 'remote.json'
+        remote.write_bytes(old)
+
+        shim = ssh_shim()
+        shim.__enter__()
+        uploader = Uploader(ssh_alias='bench', remote_user='bench', delta=True)
+        turn = [1]
+
+        def run():
+            if not uploader.upload_file_delta(versions[turn[0]], str(remote)):
+                raise RuntimeError('delta upload through the ssh shim failed')
+            turn[0] ^= 1
+        return run, 1, lambda: shim.__exit__(None, None, None)
+    return factory
+
+
+def verify_workload(rounds):
+    def factory(work_dir):
+        from verifier import Verifier
+
+        shim = ssh_shim()
+        shim.__enter__()
+        listener = _Listener()
+        verifier = Verifier(ssh_alias='bench', domain='127.0.0.1')
+
+        def run():
+            for _ in range(rounds):
+                if not (verifier.check_docker_containers() and verifier.check_port(listener.port)):
+                    raise RuntimeError('stand-in verification failed')
+
+        def cleanup():
+            listener.close()
+            shim.__exit__(None, None, None)
+        return run, rounds * 2, cleanup
+    return factory
+
+
+def workloads(quick=False):
+    """name -> factory; quick drops the 100k render and shrinks the loops"""
+    scale = 0.1 if quick else 1
+    suite = {
+        'render_1k': render_workload(1000),
+        'render_10k': render_workload(10000),
+        'render_100k': render_workload(100000),
+        'vless_links': links_workload(int(100000 * scale)),
+        'qr_png': qr_workload(int(200 * scale)),
+        'upload_small_files': upload_workload(int(500 * scale)),
+        'delta_upload': delta_upload_workload(int(100000 * scale)),
+        'verify_stand_in': verify_workload(int(50 * scale)),
+    }
+    if quick:
+        del suite['render_100k']
+    return suite
+
+
+# -- running and comparing -------------------------------------------------------
+
+def run_suite(names=None, repeat=5, quick=False, on_result=None):
+    """
+    Run workloads, each once untimed (warm-up) and then `repeat` times
+
+    Workload output (✓ lines from Verifier, etc.) is swallowed.
+
+    Returns:
+        dict: {'meta': {...}, 'results': name -> {'items', 'runs', 'min_s', 'median_s', 'items_per_s'}}
+    """
+    suite = workloads(quick)
+    unknown = set(names or []) - set(suite)
+    if unknown:
+        raise ValueError(f"Unknown workload(s): {', '.join(sorted(unknown))} (choose from {', '.join(suite)})")
+
+    results = {}
+    for name, factory in suite.items():
+        if names and name not in names:
+            continue
+        with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as work_dir:
+            run, items, cleanup = factory(Path(work_dir))
+            try:
+                times = []
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for i in range(repeat + 1):
+                        started = time.perf_counter()
+                        run()
+                        if i:
+                            times.append(time.perf_counter() - started)
+                        # Spans from traced functions would pile up over the runs
+                        tracer.reset()
+            finally:
+                if cleanup:
+                    cleanup()
+        best = min(times)
+        results[name] = {
+            'items': items,
+            'runs': repeat,
+            'min_s': best,
+            'median_s': statistics.median(times),
+            'items_per_s': items / best if best else None,
+        }
+        if on_result:
+            on_result(name, results[name])
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=None):
+    """
+    Compare each workload's best time with the baseline's
+
+    Args:
+        current: run_suite() output
+        baseline: run_suite() output from an earlier run
+        threshold: Allowed slowdown fraction for every workload (default:
+            THRESHOLDS, else DEFAULT_THRESHOLD)
+
+    Returns:
+        list: dicts with name, baseline_s, current_s, change, threshold, regressed
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or before['items'] != result['items']:
+            continue
+        limit = threshold if threshold is not None else THRESHOLDS.get(name, DEFAULT_THRESHOLD)
+        change = result['min_s'] / before['min_s'] - 1
+        rows.append({'name': name, 'baseline_s': before['min_s'], 'current_s': result['min_s'],
+                     'change': change, 'threshold': limit, 'regressed': change > limit})
+    return rows
+
+
+def print_result(name, result):
+    rate = f"{result['items_per_s']:>12,.0f}/s" if result['items_per_s'] else ''
+    print(f"  {name:<20} {result['min_s'] * 1000:>10.1f} ms  (median {result['median_s'] * 1000:.1f} ms, "
+          f"{result['items']} items) {rate}")
+
+
+def print_comparison(rows):
+    for row in rows:
+        status = '✗' if row['regressed'] else '✓'
+        print(f"  {status} {row['name']:<20} {row['baseline_s'] * 1000:>10.1f} → {row['current_s'] * 1000:.1f} ms "
+              f"({row['change']:+.0%}, limit +{row['threshold']:.0%})")
+
+
+def load_results(path):
+    return json.loads(Path(path).read_text())
+
+
+def save_results(results, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the generation/deployment toolchain')
+    parser.add_argument('workloads', nargs='*', help='Workloads to run (default: all)')
+    parser.add_argument('--quick', action='store_true', help='Smaller workloads, no 100k render')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--baseline', help='Compare against this results JSON')
+    parser.add_argument('--threshold', type=float, help='Allowed slowdown for every workload (e.g. 0.2)')
+    args = parser.parse_args()
+
+    try:
+        results = run_suite(args.workloads, args.repeat, args.quick, on_result=print_result)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.output:
+        save_results(results, args.output)
+        print(f"\n  ✓ Results: {args.output}")
+    if args.baseline:
+        rows = compare(results, load_results(args.baseline), args.threshold)
+        print(f"\n  Against {args.baseline}:")
+        print_comparison(rows)
+        sys.exit(1 if any(row['regressed'] for row in rows) else 0)
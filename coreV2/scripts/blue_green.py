@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+"""
+Blue/Green - Swap the xray container for a new config without cutting live tunnels
+"""
+
+import time
+import shlex
+import socket
+import threading
+import subprocess
+
+
+COLORS = ('blue', 'green')
+# Each color listens on its own host port; port 443 is redirected to the active one
+COLOR_PORTS = {'blue': 4431, 'green': 4432}
+# Both colors run during a drain, so the stats API needs a port per color too; neither
+# may be 10085, which the compose-managed xray still holds during the first swap
+COLOR_API_PORTS = {'blue': 10086, 'green': 10087}
+
+
+# Run with python3 on the Docker host (certbot, which the deploy installs, needs it too):
+# copy the config with the public inbound on the color's port and the API inbound on its API port
+_COLOR_CONFIG_SCRIPT = """
+import json, sys
+source, target = sys.argv[1:3]
+front_port, port, api_port = map(int, sys.argv[3:6])
+with open(source) as f:
+    config = json.load(f)
+public = 0
+for inbound in config.get('inbounds', []):
+    if inbound.get('tag') == 'api':
+        inbound['port'] = api_port
+    elif inbound.get('port') == front_port:
+        inbound['port'] = port
+        public += 1
+if not public:
+    sys.exit(f"no inbound on port {front_port} in {source}")
+with open(target, 'w') as f:
+    json.dump(config, f, indent=2)
+"""
+
+
+def other_color(color):
+    return 'green' if color == 'blue' else 'blue'
+
+
+def active_xray_shell(base_dir, api_port=10085):
+    """
+    Shell snippet setting $XRAY to the container serving xray and $XRAY_API to its stats API port
+
+    Read from the state file the last swap wrote, so it stays right across
+    swaps; before the first one it is compose's `xray` on api_port.
+    """
+    return (
+        f"case \"$(cat {base_dir}/{DockerBackend.STATE_FILE} 2>/dev/null)\" in "
+        + ''.join(f"{color}) XRAY=xray-{color} XRAY_API={COLOR_API_PORTS[color]} ;; " for color in COLORS)
+        + f"*) XRAY=xray XRAY_API={api_port} ;; esac"
+    )
+
+
+def container_status_command(base_dir):
+    """
+    `docker ps` name<TAB>status lines with the container serving xray listed as `xray`
+
+    Lets health checks keep expecting `xray` whichever color is active; the
+    other xray containers (a color still draining) are left out.
+    """
+    return (
+        f"{active_xray_shell(base_dir)}; "
+        "docker ps --format '{{.Names}}\t{{.Status}}' | "
+        "awk -F '\\t' -v active=\"$XRAY\" '$1 == active { print \"xray\\t\" $2; next } $1 !~ /^xray(-|$)/'"
+    )
+
+
+def run_local(command, check=False):
+    """Runner for a Docker daemon on this machine; same shape as Deployer.run_remote_command"""
+    result = subprocess.run(command, shell=True, capture_output=True, text=True)
+    if check and result.returncode != 0:
+        raise RuntimeError(f"Command failed: {command}\nError: {result.stderr}")
+    return result.stdout, result.stderr, result.returncode
+
+
+class GapProbe:
+    def __init__(self, host, port, interval=0.02, timeout=1.0, mode='tls', server_name=None):
+        """
+        Measure how long a service stops answering while something happens
+
+        A background thread connects every `interval` seconds; the gap is
+        the longest time between two successful probes, so with nothing
+        going on it stays close to the interval.
+
+        Args:
+            host, port: Public endpoint to probe
+            interval: Seconds between probes
+            timeout: Per-probe timeout
+            mode: 'tls' (handshake completes; Reality relays it to its dest)
+                  or 'echo' (one byte round trip, for the stand-in)
+            server_name: SNI for 'tls' mode
+        """
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.timeout = timeout
+        self.mode = mode
+        self.server_name = server_name or host
+        self.successes = []
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _probe_once(self):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+            if self.mode == 'echo':
+                sock.sendall(b'.')
+                if sock.recv(1) != b'.':
+                    raise ConnectionError('no echo')
+            else:
+                import ssl
+
+                context = ssl.create_default_context()
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+                context.wrap_socket(sock, server_hostname=self.server_name).close()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            try:
+                self._probe_once()
+                self.successes.append(time.perf_counter())
+            except OSError:
+                self.failures += 1
+            self._stop.wait(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop probing
+
+        Returns:
+            dict: probes, failures and max_gap_ms
+        """
+        self._stop.set()
+        self._thread.join()
+        gaps = [b - a for a, b in zip(self.successes, self.successes[1:])]
+        return {
+            'probes': len(self.successes) + self.failures,
+            'failures': self.failures,
+            'max_gap_ms': max(gaps) * 1000 if gaps else None,
+            'interval_ms': self.interval * 1000,
+        }
+
+
+class DockerBackend:
+    CHAIN = 'XRAY_BLUE_GREEN'
+    STATE_FILE = 'xray-active'
+    REDIRECT_SCRIPT = 'xray-redirect.sh'
+    UNIT = 'xray-blue-green.service'
+
+    def __init__(self, run, base_dir, image='ghcr.io/xtls/xray-core:latest', front_port=443, use_sudo=True):
+        """
+        Blue/green xray containers on one Docker host
+
+        Colors run with host networking on their own port (COLOR_PORTS),
+        from a copy of configs/xray-config.json with the Reality inbound's
+        and stats API ports rewritten (point StatsCollector at
+        COLOR_API_PORTS of the active color). A REDIRECT rule in a
+        dedicated nat chain sends new connections for front_port to the
+        active color; replacing that one rule is the switch. Connections already tracked by conntrack keep
+        going to the old container, which is what lets it drain.
+
+        The compose-managed `xray` container counts as the initial color
+        ('legacy'). Each switch records the active color in base_dir/xray-active
+        and the rule in base_dir/xray-redirect.sh, which a oneshot systemd unit
+        re-applies at boot (the color's container restarts by itself).
+        Deployer's compose start/restart leave xray to the active color.
+
+        Args:
+            run: Callable(command, check=False) -> (stdout, stderr, code),
+                 e.g. Deployer.run_remote_command or run_local
+            base_dir: Deployment directory holding configs/
+            image: Xray image
+            front_port: Public port clients connect to
+            use_sudo: Prefix iptables with sudo
+        """
+        self.run = run
+        self.base_dir = base_dir
+        self.image = image
+        self.front_port = front_port
+        self.sudo = 'sudo ' if use_sudo else ''
+        self.iptables = f"{self.sudo}iptables"
+
+    def _run(self, command):
+        return self.run(command, check=False)
+
+    def active(self):
+        stdout, _, _ = self._run("docker ps --format '{{.Names}}'")
+        names = set(stdout.split())
+        for color in COLORS:
+            if f"xray-{color}" in names:
+                return color
+        return 'legacy' if 'xray' in names else self.assigned()
+
+    def assigned(self):
+        """Color port 443 is redirected to since the last switch (None before the first swap)"""
+        stdout, _, _ = self._run(f"cat {self.base_dir}/{self.STATE_FILE} 2>/dev/null")
+        color = stdout.strip()
+        return color if color in COLORS else None
+
+    def write_config(self, color):
+        """
+        Write configs/xray-config.<color>.json: the uploaded config with the
+        public inbound moved to COLOR_PORTS and the API inbound to COLOR_API_PORTS
+
+        Returns:
+            str: Remote path of the color's config
+        """
+        config = f"{self.base_dir}/configs/xray-config.{color}.json"
+        _, stderr, code = self._run(
+            f"python3 -c {shlex.quote(_COLOR_CONFIG_SCRIPT)} {self.base_dir}/configs/xray-config.json {config} "
+            f"{self.front_port} {COLOR_PORTS[color]} {COLOR_API_PORTS[color]}"
+        )
+        if code != 0:
+            raise RuntimeError(f"Writing the xray-{color} config failed: {stderr.strip()}")
+        return config
+
+    def start(self, color):
+        config = self.write_config(color)
+        self._run(f"docker rm -f xray-{color} 2>/dev/null || true")
+        _, stderr, code = self._run(
+            f"docker run -d --name xray-{color} --network host --cap-add NET_ADMIN --restart unless-stopped "
+            f"-e XRAY_LOCATION_ASSET=/usr/local/share/xray -v {self.base_dir}/geo:/usr/local/share/xray:ro "
+            f"-v {config}:/usr/local/etc/xray/config.json:ro {self.image} run -c /usr/local/etc/xray/config.json"
+        )
+        if code != 0:
+            raise RuntimeError(f"Starting xray-{color} failed: {stderr.strip()}")
+
+    def ready(self, color):
+        _, _, code = self._run(f"timeout 1 bash -c '</dev/tcp/127.0.0.1/{COLOR_PORTS[color]}'")
+        return code == 0
+
+    def _switch_command(self, color):
+        nat = f"{self.iptables} -t nat"
+        rule = f"-p tcp --dport {self.front_port} -j REDIRECT --to-ports {COLOR_PORTS[color]}"
+        return (
+            f"({nat} -N {self.CHAIN} 2>/dev/null || true) && "
+            f"({nat} -C PREROUTING -j {self.CHAIN} 2>/dev/null || {nat} -I PREROUTING 1 -j {self.CHAIN}) && "
+            f"({nat} -R {self.CHAIN} 1 {rule} 2>/dev/null || {nat} -A {self.CHAIN} {rule})"
+        )
+
+    def switch(self, color):
+        """Point new connections at color; only the single rule in CHAIN changes"""
+        _, stderr, code = self._run(self._switch_command(color))
+        if code != 0:
+            raise RuntimeError(f"Switching to {color} failed: {stderr.strip()}")
+
+    def persist(self, color):
+        """
+        Make the switch to color survive a reboot
+
+        Writes the state file and the redirect script, and installs and
+        enables the systemd unit that runs the script at boot.
+
+        Returns:
+            bool: True if everything was written and the unit enabled
+        """
+        script = f"{self.base_dir}/{self.REDIRECT_SCRIPT}"
+        unit = (
+            "[Unit]\n"
+            "Description=Redirect xray's public port to the active blue/green container\n"
+            "After=network-online.target docker.service\n\n"
+            "[Service]\nType=oneshot\nRemainAfterExit=yes\n"
+            f"ExecStart=/bin/sh {script}\n\n"
+            "[Install]\nWantedBy=multi-user.target\n"
+        )
+        _, stderr, code = self._run(
+            f"printf '%s\\n' '#!/bin/sh' {shlex.quote(self._switch_command(color))} > {script} && "
+            f"echo {color} > {self.base_dir}/{self.STATE_FILE} && "
+            f"printf '%s' {shlex.quote(unit)} | {self.sudo}tee /etc/systemd/system/{self.UNIT} > /dev/null && "
+            f"{self.sudo}systemctl daemon-reload && {self.sudo}systemctl enable --quiet {self.UNIT}"
+        )
+        return code == 0
+
+    def connections(self, color):
+        """Established client connections still on color (None if it can't be counted)"""
+        if color == 'legacy':
+            # ss inside the container's network namespace sees its front-port sockets
+            # whether compose runs it bridged (behind Docker's DNAT) or on the host network
+            command = (f"{self.sudo}nsenter -t \"$(docker inspect -f '{{{{.State.Pid}}}}' xray)\" -n "
+                       f"ss -Htn state established '( sport = :{self.front_port} )'")
+        else:
+            command = f"ss -Htn state established '( sport = :{COLOR_PORTS[color]} )'"
+        stdout, _, code = self._run(command)
+        return len(stdout.splitlines()) if code == 0 else None
+
+    def stop(self, color, grace=10):
+        name = 'xray' if color == 'legacy' else f"xray-{color}"
+        self._run(f"docker stop -t {int(grace)} {name} && docker rm {name}")
+
+
+# -- process stand-in ------------------------------------------------------------
+
+class _Forwarder:
+    """Userspace stand-in for the REDIRECT rule: new connections go to `target`"""
+
+    def __init__(self, port):
+        self.listener = socket.create_server(('127.0.0.1', port), backlog=256)
+        self.port = self.listener.getsockname()[1]
+        self.target = None
+        self.active = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _pipe(self, source, sink):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                sink.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, sink):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _serve(self, client, target):
+        with self.lock:
+            self.active[target] = self.active.get(target, 0) + 1
+        try:
+            with client, socket.create_connection(('127.0.0.1', target), timeout=1.0) as upstream:
+                upstream.settimeout(None)
+                pipe = threading.Thread(target=self._pipe, args=(upstream, client), daemon=True)
+                pipe.start()
+                self._pipe(client, upstream)
+                pipe.join()
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                self.active[target] -= 1
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client, self.target), daemon=True).start()
+
+    def close(self):
+        # close() alone leaves a thread blocked in accept() holding the socket open
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener.close()
+
+
+class ProcessBackend:
+    def __init__(self, front_port=0, startup_delay=0.5):
+        """
+        Local stand-in for DockerBackend: each color is an echo-server
+        process and the front port is a userspace forwarder
+
+        Args:
+            front_port: Port the forwarder listens on (0 picks one)
+            startup_delay: Seconds a new color takes before it listens (like xray loading its config)
+        """
+        self.forwarder = _Forwarder(front_port)
+        self.front_port = self.forwarder.port
+        self.startup_delay = startup_delay
+        self.processes = {}
+        self.ports = {}
+
+    def active(self):
+        for color, port in self.ports.items():
+            if port == self.forwarder.target:
+                return color
+        return None
+
+    def start(self, color):
+        import sys
+
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        self.ports[color] = port
+        self.processes[color] = subprocess.Popen(
+            [sys.executable, __file__, '--stand-in-server', str(port), str(self.startup_delay)])
+
+    def ready(self, color):
+        try:
+            socket.create_connection(('127.0.0.1', self.ports[color]), timeout=0.2).close()
+            return True
+        except OSError:
+            return False
+
+    def switch(self, color):
+        self.forwarder.target = self.ports[color]
+
+    def persist(self, color):
+        # Nothing outlives the stand-in
+        return True
+
+    def connections(self, color):
+        with self.forwarder.lock:
+            return self.forwarder.active.get(self.ports.get(color), 0)
+
+    def stop(self, color, grace=10):
+        process = self.processes.pop(color, None)
+        if process:
+            process.terminate()
+            try:
+                process.wait(grace)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def close(self):
+        for color in list(self.processes):
+            self.stop(color, 0)
+        self.forwarder.close()
+
+
+def _stand_in_server(port, startup_delay):
+    """Echo server playing xray; exits on SIGTERM like xray does"""
+    import sys
+    import signal
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    time.sleep(startup_delay)
+    listener = socket.create_server(('127.0.0.1', port), backlog=256)
+
+    def echo(conn):
+        with conn:
+            try:
+                while True:
+                    data = conn.recv(65536)
+                    if not data:
+                        return
+                    conn.sendall(data)
+            except OSError:
+                pass
+
+    while True:
+        conn, _ = listener.accept()
+        threading.Thread(target=echo, args=(conn,), daemon=True).start()
+
+
+# -- swap ------------------------------------------------------------------------
+
+class BlueGreenSwap:
+    def __init__(self, backend, ready_timeout=30.0, drain_timeout=60.0, stop_grace=10, poll_interval=0.2):
+        """
+        Start the other color, switch new connections to it, drain the old one
+
+        Args:
+            backend: DockerBackend or ProcessBackend
+            ready_timeout: Seconds the new color has to start listening
+            drain_timeout: Seconds existing tunnels get to finish on the old color
+            stop_grace: SIGTERM-to-SIGKILL grace when stopping the old color
+            poll_interval: Readiness/drain polling interval
+        """
+        self.backend = backend
+        self.ready_timeout = ready_timeout
+        self.drain_timeout = drain_timeout
+        self.stop_grace = stop_grace
+        self.poll_interval = poll_interval
+
+    def _wait(self, condition, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(self.poll_interval)
+        return condition()
+
+    def run(self):
+        """
+        Returns:
+            dict: from/to colors, ready_s, switch_ms, persisted, drain_s,
+                  connections left when the old color was stopped, and ok
+
+        Raises:
+            RuntimeError: New color never became ready (it is removed and
+                the old one keeps serving)
+        """
+        backend = self.backend
+        old = backend.active()
+        new = 'blue' if old in (None, 'legacy') else other_color(old)
+        result = {'from': old, 'to': new}
+
+        started = time.perf_counter()
+        backend.start(new)
+        if not self._wait(lambda: backend.ready(new), self.ready_timeout):
+            backend.stop(new, 0)
+            raise RuntimeError(f"xray-{new} not ready after {self.ready_timeout:.0f}s; kept {old}")
+        result['ready_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        backend.switch(new)
+        result['switch_ms'] = (time.perf_counter() - started) * 1000
+        result['persisted'] = backend.persist(new)
+
+        left = None
+        if old:
+            started = time.perf_counter()
+            self._wait(lambda: backend.connections(old) == 0, self.drain_timeout)
+            result['drain_s'] = time.perf_counter() - started
+            left = backend.connections(old)
+            backend.stop(old, self.stop_grace)
+        result['connections_left'] = left
+        result['ok'] = True
+        return result
+
+
+def print_swap(result, gap=None):
+    print(f"  ✓ {result['from'] or 'nothing'} → {result['to']}: ready in {result['ready_s']:.2f}s, "
+          f"switch {result['switch_ms']:.1f} ms")
+    if not result.get('persisted', True):
+        print("  ⚠ Could not persist the switch; after a reboot port 443 won't reach xray until the next swap")
+    if 'drain_s' in result:
+        left = result['connections_left']
+        print(f"  ✓ Drained {result['from']} in {result['drain_s']:.1f}s"
+              + (f" ({left} connection(s) cut at the timeout)" if left else ''))
+    if gap:
+        status = "✓" if gap['failures'] == 0 else "✗"
+        max_gap = f"{gap['max_gap_ms']:.0f} ms" if gap['max_gap_ms'] is not None else 'n/a'
+        print(f"  {status} Service gap: longest {max_gap} between successful probes "
+              f"(probe every {gap['interval_ms']:.0f} ms), {gap['failures']}/{gap['probes']} failed")
+
+
+def stand_in_demo(drain_timeout=3.0, tunnel_seconds=1.0):
+    """
+    Swap twice on the process stand-in while a probe and a long-lived tunnel run
+
+    Returns:
+        list: (swap result, gap) per swap
+    """
+    backend = ProcessBackend()
+    swap = BlueGreenSwap(backend, ready_timeout=10, drain_timeout=drain_timeout, stop_grace=1)
+    results = []
+    try:
+        swap.run()  # initial deploy
+        for _ in range(2):
+            # A tunnel opened before the swap must survive it
+            tunnel = socket.create_connection(('127.0.0.1', backend.front_port))
+            closer = threading.Timer(tunnel_seconds, tunnel.close)
+            closer.start()
+            probe = GapProbe('127.0.0.1', backend.front_port, mode='echo').start()
+            time.sleep(0.2)
+            result = swap.run()
+            time.sleep(0.2)
+            results.append((result, probe.stop()))
+            closer.cancel()
+            tunnel.close()
+    finally:
+        backend.close()
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    if len(sys.argv) == 4 and sys.argv[1] == '--stand-in-server':
+        _stand_in_server(int(sys.argv[2]), float(sys.argv[3]))
+
+    parser = argparse.ArgumentParser(description='Blue/green xray swap on a local Docker daemon or a stand-in')
+    parser.add_argument('--docker', metavar='BASE_DIR', help='Swap containers on this machine (needs docker, iptables)')
+    parser.add_argument('--drain-timeout', type=float, default=3.0)
+    parser.add_argument('--probe', metavar='HOST', help='Measure the gap on HOST:443 during a --docker swap')
+    args = parser.parse_args()
+
+    if args.docker:
+        probe = GapProbe(args.probe, 443).start() if args.probe else None
+        result = BlueGreenSwap(DockerBackend(run_local, args.docker), drain_timeout=args.drain_timeout).run()
+        print_swap(result, probe.stop() if probe else None)
+    else:
+        for result, gap in stand_in_demo(args.drain_timeout):
+            print_swap(result, gap)
@@ -4,23 +4,29 @@ Client Config Generator - Generate VLESS and Shadowsocks client configs
 """
 
 import json
-import qrcode
 from pathlib import Path
 from urllib.parse import quote
 
+from tracing import traced
+from client_formats import ServerProfile, MULTI_RENDERERS, render_xray, xray_mux, user_file_stem
+from qr_render import write_qr, FORMATS as QR_FORMATS
+
 
 class ClientConfigGenerator:
-    def __init__(self, output_dir='../client_configs'):
+    def __init__(self, output_dir='../client_configs', qr_format='png'):
         """
         Initialize the client config generator
 
         Args:
             output_dir: Directory to save client configs
+            qr_format: Default QR renderer ('png', 'svg', 'terminal' or 'pil')
         """
         self.output_dir = Path(output_dir)
+        self.qr_format = qr_format
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
-    def generate_vless_link(self, uuid, domain, port=443, sni=None, public_key=None, short_id=None, fp='chrome'):
+    def generate_vless_link(self, uuid, domain, port=443, sni=None, public_key=None, short_id=None, fp='chrome',
+                            name='CustomVPN-Reality'):
         """
         Generate VLESS Reality client link
 
@@ -32,6 +38,7 @@ class ClientConfigGenerator:
             public_key: Reality public key
             short_id: Reality short ID
             fp: TLS fingerprint (default 'chrome')
+            name: Profile name shown in the client
 
         Returns:
             str: VLESS URI with Reality
@@ -46,39 +53,28 @@ class ClientConfigGenerator:
             f"&sni={sni}"
             f"&sid={short_id}"
             f"&flow=xtls-rprx-vision"
-            f"#{quote('CustomVPN-Reality')}"
+            f"#{quote(name)}"
         )
 
         return vless_link
 
-    def generate_qr_code(self, data, filename):
+    @traced(category='clients')
+    def generate_qr_code(self, data, filename, fmt=None):
         """
         Generate QR code from data
 
         Args:
             data: Data to encode
             filename: Output filename (without extension)
+            fmt: QR renderer for this call (defaults to the generator's qr_format)
 
         Returns:
-            Path: Path to saved QR code image
+            Path: Path to saved QR code file
         """
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-
-        output_file = self.output_dir / f"{filename}.png"
-        img.save(output_file)
-
-        return output_file
+        return write_qr(data, self.output_dir / filename, fmt or self.qr_format)
 
-    def generate_all_configs(self, uuid, domain, sni, public_key, short_id):
+    @traced(category='clients')
+    def generate_all_configs(self, uuid, domain, sni, public_key, short_id, xudp_concurrency=0):
         """
         Generate client configuration for Reality
 
@@ -88,6 +84,8 @@ class ClientConfigGenerator:
             sni: Reality SNI
             public_key: Reality public key
             short_id: Reality short ID
+            xudp_concurrency: UDP mode (see ServerProfile); links can't carry
+                mux settings, so it shows up in the JSON and Xray client config
 
         Returns:
             dict: Paths and links for config
@@ -112,10 +110,18 @@ class ClientConfigGenerator:
             }
         }
 
+        server = ServerProfile(domain, sni, public_key, xudp_concurrency=xudp_concurrency)
+        mux = xray_mux(server)
+        if mux:
+            config_data['vless_reality']['mux'] = mux
+
         config_file = self.output_dir / 'client_configs.json'
         with open(config_file, 'w') as f:
             json.dump(config_data, f, indent=2)
 
+        xray_file = self.output_dir / 'xray_client.json'
+        xray_file.write_text(render_xray(server, {'uuid': uuid, 'short_id': short_id, 'email': 'admin@customvpn'}))
+
         # Save links to text file
         links_file = self.output_dir / 'links.txt'
         with open(links_file, 'w') as f:
@@ -124,14 +130,109 @@ class ClientConfigGenerator:
             f.write(f"{vless_link}\n\n")
             f.write("QR Code:\n")
             f.write(f"  VLESS Reality: {vless_qr}\n")
+            if mux:
+                f.write(f"\nUDP mode (XUDP x{xudp_concurrency}): import {xray_file.name}; the link has no mux settings\n")
 
         return {
             'vless_link': vless_link,
             'vless_qr': vless_qr,
             'config_file': config_file,
-            'links_file': links_file
+            'links_file': links_file,
+            'xray_file': xray_file
         }
 
+    @traced(category='clients')
+    def generate_multi_endpoint_configs(self, uuid, endpoints, sni, public_key, short_id, probe=True,
+                                        email='admin@customvpn', xudp_concurrency=0):
+        """
+        Generate client configs spanning several server endpoints
+
+        Endpoints are probed concurrently and ordered fastest first; the
+        configs carry a urltest/fallback group (sing-box, Clash) or an
+        observatory balancer (Xray) so devices keep picking the fastest node.
+
+        Args:
+            uuid: VLESS user UUID
+            endpoints: List of endpoints.Endpoint objects
+            sni: Reality SNI
+            public_key: Reality public key
+            short_id: Reality short ID
+            probe: Measure handshake latency and reorder (False keeps the given order)
+            email: User identity; its local part appears in profile names
+            xudp_concurrency: UDP mode (see ServerProfile)
+
+        Returns:
+            dict: Endpoint ranking and paths of the written files
+        """
+        if probe:
+            from endpoints import EndpointProber
+            endpoints = EndpointProber(endpoints, sni).run()
+
+        servers = [ServerProfile(e.host, sni, public_key, port=e.port, label=e.label,
+                                 xudp_concurrency=xudp_concurrency) for e in endpoints]
+        user = {'uuid': uuid, 'short_id': short_id, 'email': email}
+
+        multi_dir = self.output_dir / 'multi'
+        multi_dir.mkdir(parents=True, exist_ok=True)
+        files = {}
+        for fmt, filename in (('base64', 'subscription.txt'), ('clash', 'clash.yaml'),
+                              ('singbox', 'singbox.json'), ('xray', 'xray.json')):
+            render, _ = MULTI_RENDERERS[fmt]
+            files[fmt] = multi_dir / filename
+            files[fmt].write_text(render(servers, user))
+
+        return {
+            'ranking': [e.as_dict() for e in endpoints],
+            'files': files,
+        }
+
+    @traced(category='clients')
+    def generate_user_configs(self, store, domain, sni, public_key, force=False, with_qr=True):
+        """
+        Write per-user link/QR files, only for users changed since the last build
+
+        Files live under output_dir/users/ as <uuid>.txt plus the QR file;
+        deleted or disabled users have theirs removed.
+
+        Args:
+            store: UserStore holding the users
+            domain: Server domain
+            sni: Reality SNI
+            public_key: Reality public key
+            force: Rebuild every user
+            with_qr: Also render a QR code per user
+
+        Returns:
+            dict: {'written': [emails], 'removed': [emails]}
+        """
+        users_dir = self.output_dir / 'users'
+        users_dir.mkdir(parents=True, exist_ok=True)
+
+        revision = store.revision
+        last = -1 if force else store.last_built('client-configs')
+        changed = store.active_users() if last < 0 else store.changed_since(last)
+
+        written, removed = [], []
+        for user in changed:
+            stem = user_file_stem(user)
+            if user['deleted'] or not user['enabled']:
+                for suffix in ['.txt'] + [f".{ext}" for ext, _ in QR_FORMATS.values()]:
+                    (users_dir / f"{stem}{suffix}").unlink(missing_ok=True)
+                removed.append(user['email'])
+                continue
+
+            link = self.generate_vless_link(
+                user['uuid'], domain, sni=sni, public_key=public_key,
+                short_id=user['short_id'], name=f"CustomVPN-{user['email']}"
+            )
+            (users_dir / f"{stem}.txt").write_text(link + '\n')
+            if with_qr:
+                self.generate_qr_code(link, f"users/{stem}")
+            written.append(user['email'])
+
+        store.mark_built('client-configs', revision)
+        return {'written': written, 'removed': removed}
+
     def print_client_instructions(self, results):
         """Print client setup instructions"""
         print("\n" + "=" * 60)
@@ -149,6 +250,7 @@ class ClientConfigGenerator:
         print("\n📋 Configuration Files:")
         print(f"  Links: {results['links_file']}")
         print(f"  JSON: {results['config_file']}")
+        print(f"  Xray client: {results['xray_file']}")
         print(f"  VLESS Reality QR: {results['vless_qr']}")
 
         print("\n🔗 Connection Link:")
@@ -161,16 +263,15 @@ if __name__ == '__main__':
     # Example usage
     import sys
 
-    if len(sys.argv) < 5:
-        print("Usage: client_config.py <uuid> <domain> <ws_path> <ss_password> [ss_port]")
+    if len(sys.argv) < 6:
+        print("Usage: client_config.py <uuid> <domain> <sni> <public_key> <short_id> [png|svg|terminal|pil]")
         sys.exit(1)
 
-    uuid = sys.argv[1]
-    domain = sys.argv[2]
-    ws_path = sys.argv[3]
-    ss_password = sys.argv[4]
-    ss_port = int(sys.argv[5]) if len(sys.argv) > 5 else 8388
+    uuid, domain, sni, public_key, short_id = sys.argv[1:6]
+    qr_format = sys.argv[6] if len(sys.argv) > 6 else 'png'
 
-    generator = ClientConfigGenerator()
-    results = generator.generate_all_configs(uuid, domain, ws_path, ss_password, ss_port)
+    generator = ClientConfigGenerator(qr_format=qr_format)
+    results = generator.generate_all_configs(uuid, domain, sni, public_key, short_id)
     generator.print_client_instructions(results)
+    if qr_format == 'terminal':
+        print(results['vless_qr'].read_text())
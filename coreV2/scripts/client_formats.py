@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Client Formats - Render VLESS Reality profiles for common client apps
+"""
+
+import re
+import json
+import base64
+from urllib.parse import quote
+
+
+# Concurrent XUDP sub-connections per mux connection when UDP mode is on
+XUDP_CONCURRENCY = 16
+
+
+class ServerProfile:
+    def __init__(self, domain, sni, public_key, port=443, fp='chrome', name_prefix='CustomVPN', label=None,
+                 xudp_concurrency=0):
+        """
+        Server-side parameters shared by every user's profile
+
+        Args:
+            domain: Server domain or IP
+            sni: Reality serverName
+            public_key: Reality public key
+            port: Server port
+            fp: uTLS fingerprint
+            name_prefix: Prefix of profile names shown in clients
+            label: Node name, added to profile names when a user has several endpoints
+            xudp_concurrency: Carry UDP (games, VoIP) as XUDP over this many
+                mux sub-connections; 0 leaves clients' UDP handling alone
+        """
+        self.domain = domain
+        self.sni = sni
+        self.public_key = public_key
+        self.port = port
+        self.fp = fp
+        self.name_prefix = name_prefix
+        self.label = label
+        self.xudp_concurrency = xudp_concurrency
+
+    def profile_name(self, user):
+        if self.label:
+            return f"{self.name_prefix}-{self.label}-{profile_label(user)}"
+        return f"{self.name_prefix}-{profile_label(user)}"
+
+
+def profile_label(user, taken=None):
+    """
+    User part of a profile name: the email's local part
+
+    alice@x and alice@y share a local part, so documents listing many users
+    pass the set of labels already used; a colliding label gets a short
+    UUID prefix (the full UUID if even that is taken) and is added to the set.
+    """
+    label = user['email'].split('@')[0]
+    if taken is not None:
+        if label in taken:
+            label = f"{user['uuid'][:8]}-{label}"
+        if label in taken:
+            label = f"{user['uuid']}-{user['email'].split('@')[0]}"
+        taken.add(label)
+    return label
+
+
+def user_file_stem(user):
+    """
+    File name (without extension) for a user's per-user profiles
+
+    Keyed by UUID rather than email: emails are free text and may hold '/'
+    or '..'. The UUID is sanitized too, since the store doesn't validate it.
+    """
+    return re.sub(r'[^A-Za-z0-9_-]', '_', user['uuid'])
+
+
+def vless_uri(server, user):
+    """VLESS Reality URI (same format as ClientConfigGenerator.generate_vless_link)"""
+    return (
+        f"vless://{user['uuid']}@{server.domain}:{server.port}"
+        f"?type=tcp"
+        f"&security=reality"
+        f"&pbk={server.public_key}"
+        f"&fp={server.fp}"
+        f"&sni={server.sni}"
+        f"&sid={user['short_id']}"
+        f"&flow=xtls-rprx-vision"
+        f"#{quote(server.profile_name(user))}"
+    )
+
+
+def render_base64(server, user):
+    """Classic v2rayN/Shadowrocket subscription: base64 of newline-separated URIs"""
+    return base64.b64encode((vless_uri(server, user) + '\n').encode()).decode()
+
+
+def xray_mux(server):
+    """
+    Xray client `mux` block for UDP mode, or None
+
+    Vision can't be muxed, so TCP keeps its own connections (concurrency
+    -1) and only UDP flows share XUDP sub-connections. UDP to port 443 is
+    QUIC, which is rejected so browsers fall back to TCP + Vision.
+    """
+    if not server.xudp_concurrency:
+        return None
+    return {'enabled': True, 'concurrency': -1, 'xudpConcurrency': server.xudp_concurrency,
+            'xudpProxyUDP443': 'reject'}
+
+
+def singbox_outbound(server, user):
+    outbound = {
+        'type': 'vless',
+        'tag': server.profile_name(user),
+        'server': server.domain,
+        'server_port': server.port,
+        'uuid': user['uuid'],
+        'flow': 'xtls-rprx-vision',
+        'tls': {
+            'enabled': True,
+            'server_name': server.sni,
+            'utls': {'enabled': True, 'fingerprint': server.fp},
+            'reality': {'enabled': True, 'public_key': server.public_key, 'short_id': user['short_id']},
+        },
+    }
+    if server.xudp_concurrency:
+        outbound['packet_encoding'] = 'xudp'
+    return outbound
+
+
+def render_singbox(server, user):
+    """Minimal sing-box config: one VLESS Reality outbound routed by default"""
+    outbound = singbox_outbound(server, user)
+    return json.dumps({
+        'outbounds': [outbound, {'type': 'direct', 'tag': 'direct'}],
+        'route': {'final': outbound['tag']},
+    }, indent=2)
+
+
+def clash_proxy_lines(server, user, indent='  '):
+    """Clash.Meta / Mihomo proxy entry as YAML lines (JSON strings are valid YAML scalars)"""
+    q = json.dumps
+    lines = [
+        f"{indent}- name: {q(server.profile_name(user))}",
+        f"{indent}  type: vless",
+        f"{indent}  server: {q(server.domain)}",
+        f"{indent}  port: {server.port}",
+        f"{indent}  uuid: {q(user['uuid'])}",
+        f"{indent}  network: tcp",
+        f"{indent}  udp: true",
+        f"{indent}  tls: true",
+        f"{indent}  flow: xtls-rprx-vision",
+        f"{indent}  servername: {q(server.sni)}",
+        f"{indent}  client-fingerprint: {q(server.fp)}",
+        f"{indent}  reality-opts:",
+        f"{indent}    public-key: {q(server.public_key)}",
+        f"{indent}    short-id: {q(user['short_id'])}",
+    ]
+    if server.xudp_concurrency:
+        lines.append(f"{indent}  packet-encoding: xudp")
+    return lines
+
+
+def render_clash(server, user):
+    """Clash.Meta / Mihomo config with a single proxy and a select group"""
+    name = json.dumps(server.profile_name(user))
+    lines = ['proxies:']
+    lines += clash_proxy_lines(server, user)
+    lines += [
+        'proxy-groups:',
+        '  - name: Proxy',
+        '    type: select',
+        f'    proxies: [{name}]',
+        'rules:',
+        '  - MATCH,Proxy',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def xray_client_config(server, user, socks_port=10808, http_port=10809):
+    """Xray-core / v2rayN client config with local SOCKS and HTTP inbounds"""
+    config = {
+        'remarks': server.profile_name(user),
+        'log': {'loglevel': 'warning'},
+        'inbounds': [
+            {'tag': 'socks', 'listen': '127.0.0.1', 'port': socks_port, 'protocol': 'socks',
+             'settings': {'udp': True}, 'sniffing': {'enabled': True, 'destOverride': ['http', 'tls']}},
+            {'tag': 'http', 'listen': '127.0.0.1', 'port': http_port, 'protocol': 'http'},
+        ],
+        'outbounds': [
+            {
+                'tag': 'proxy',
+                'protocol': 'vless',
+                'settings': {'vnext': [{
+                    'address': server.domain,
+                    'port': server.port,
+                    'users': [{'id': user['uuid'], 'encryption': 'none', 'flow': 'xtls-rprx-vision'}],
+                }]},
+                'streamSettings': {
+                    'network': 'tcp',
+                    'security': 'reality',
+                    'realitySettings': {
+                        'serverName': server.sni,
+                        'fingerprint': server.fp,
+                        'publicKey': server.public_key,
+                        'shortId': user['short_id'],
+                    },
+                },
+            },
+            {'tag': 'direct', 'protocol': 'freedom'},
+        ],
+    }
+    mux = xray_mux(server)
+    if mux:
+        config['outbounds'][0]['mux'] = mux
+    return config
+
+
+def render_xray(server, user):
+    return json.dumps(xray_client_config(server, user), indent=2)
+
+
+RENDERERS = {
+    'base64': (render_base64, 'text/plain; charset=utf-8'),
+    'clash': (render_clash, 'text/yaml; charset=utf-8'),
+    'singbox': (render_singbox, 'application/json'),
+    'xray': (render_xray, 'application/json'),
+}
+
+
+# -- multi-endpoint profiles ---------------------------------------------------
+#
+# `servers` is a list of ServerProfile objects (with distinct labels), best
+# first; EndpointProber.rank() produces that order. Each client still
+# re-measures on its own, but the order decides what a fallback group tries
+# first and what a client selects before its first health check.
+
+LATENCY_TEST_URL = 'https://www.gstatic.com/generate_204'
+
+
+def render_base64_multi(servers, user):
+    """Subscription with one URI per endpoint, best first"""
+    uris = ''.join(vless_uri(server, user) + '\n' for server in servers)
+    return base64.b64encode(uris.encode()).decode()
+
+
+def render_singbox_multi(servers, user, interval='3m', tolerance=50):
+    """sing-box config with a urltest group picking the fastest endpoint"""
+    outbounds = [singbox_outbound(server, user) for server in servers]
+    tags = [outbound['tag'] for outbound in outbounds]
+    return json.dumps({
+        'outbounds': [
+            {'type': 'selector', 'tag': 'proxy', 'outbounds': ['auto'] + tags, 'default': 'auto'},
+            {'type': 'urltest', 'tag': 'auto', 'outbounds': tags,
+             'url': LATENCY_TEST_URL, 'interval': interval, 'tolerance': tolerance},
+            *outbounds,
+            {'type': 'direct', 'tag': 'direct'},
+        ],
+        'route': {'final': 'proxy'},
+    }, indent=2)
+
+
+def render_clash_multi(servers, user, interval=300, tolerance=50):
+    """Clash.Meta / Mihomo config with url-test and fallback groups over every endpoint"""
+    names = ', '.join(json.dumps(server.profile_name(user)) for server in servers)
+    lines = ['proxies:']
+    for server in servers:
+        lines += clash_proxy_lines(server, user)
+    lines += [
+        'proxy-groups:',
+        '  - name: Proxy',
+        '    type: select',
+        f'    proxies: [Auto, Fallback, {names}]',
+        '  - name: Auto',
+        '    type: url-test',
+        f'    url: {json.dumps(LATENCY_TEST_URL)}',
+        f'    interval: {interval}',
+        f'    tolerance: {tolerance}',
+        f'    proxies: [{names}]',
+        '  - name: Fallback',
+        '    type: fallback',
+        f'    url: {json.dumps(LATENCY_TEST_URL)}',
+        f'    interval: {interval}',
+        f'    proxies: [{names}]',
+        'rules:',
+        '  - MATCH,Proxy',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def render_xray_multi(servers, user, interval='3m'):
+    """Xray client config balancing endpoints by observed latency (observatory + leastPing)"""
+    config = xray_client_config(servers[0], user)
+    proxies = []
+    for i, server in enumerate(servers):
+        outbound = xray_client_config(server, user)['outbounds'][0]
+        outbound['tag'] = f"proxy-{server.label or i}"
+        proxies.append(outbound)
+    config['remarks'] = f"{servers[0].name_prefix}-{user['email'].split('@')[0]}"
+    config['outbounds'] = proxies + [{'tag': 'direct', 'protocol': 'freedom'}]
+    config['observatory'] = {
+        'subjectSelector': ['proxy-'],
+        'probeURL': LATENCY_TEST_URL,
+        'probeInterval': interval,
+        'enableConcurrency': True,
+    }
+    config['routing'] = {
+        'balancers': [{'tag': 'auto', 'selector': ['proxy-'], 'fallbackTag': proxies[0]['tag'],
+                       'strategy': {'type': 'leastPing'}}],
+        'rules': [{'type': 'field', 'network': 'tcp,udp', 'balancerTag': 'auto'}],
+    }
+    return json.dumps(config, indent=2)
+
+
+MULTI_RENDERERS = {
+    'base64': (render_base64_multi, 'text/plain; charset=utf-8'),
+    'clash': (render_clash_multi, 'text/yaml; charset=utf-8'),
+    'singbox': (render_singbox_multi, 'application/json'),
+    'xray': (render_xray_multi, 'application/json'),
+}
+
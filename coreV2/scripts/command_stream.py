@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Command Stream - Run commands with streamed output, bounded memory and deadlines
+"""
+
+import os
+import time
+import signal
+import selectors
+import subprocess
+from collections import deque
+
+
+DEFAULT_TAIL_LINES = 200
+# Longest line kept; longer runs without a newline (binary output) are split
+DEFAULT_MAX_LINE_BYTES = 8192
+
+
+class CommandTimeout(RuntimeError):
+    """Raised when a streamed command is killed at its deadline"""
+
+
+class CommandResult:
+    def __init__(self, command, returncode, stdout_tail, stderr_tail, duration, timed_out=False):
+        """
+        Outcome of a streamed command
+
+        Args:
+            command: Command that was executed
+            returncode: Process exit code (-9 style values when killed)
+            stdout_tail: Last lines of stdout (bounded)
+            stderr_tail: Last lines of stderr (bounded)
+            duration: Wall clock seconds
+            timed_out: True if the command was killed at its deadline
+        """
+        self.command = command
+        self.returncode = returncode
+        self.stdout_tail = list(stdout_tail)
+        self.stderr_tail = list(stderr_tail)
+        self.duration = duration
+        self.timed_out = timed_out
+
+    @property
+    def stdout(self):
+        return '\n'.join(self.stdout_tail)
+
+    @property
+    def stderr(self):
+        return '\n'.join(self.stderr_tail)
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    def error_report(self):
+        """Short multi-line report for failed commands"""
+        reason = f"timed out after {self.duration:.1f}s" if self.timed_out else f"exit code {self.returncode}"
+        tail = self.stderr_tail or self.stdout_tail
+        return f"Command failed ({reason}): {self.command}\n" + '\n'.join(tail)
+
+    def __iter__(self):
+        # Allows `stdout, stderr, code = result` like the old tuple API
+        return iter((self.stdout, self.stderr, self.returncode))
+
+
+class CommandStream:
+    def __init__(self, cmd, timeout=None, tail_lines=DEFAULT_TAIL_LINES, chunk_size=65536,
+                 max_line_bytes=DEFAULT_MAX_LINE_BYTES):
+        """
+        Iterate over the output lines of a running command
+
+        Yields ('stdout' | 'stderr', line) tuples as the process produces them.
+        Only the last `tail_lines` lines of each stream are kept, each at most
+        `max_line_bytes` long, so memory stays bounded even for output
+        without newlines; `result` is available once iteration finishes.
+
+        Args:
+            cmd: Argument list passed to subprocess.Popen
+            timeout: Seconds before the process group is killed (None = no limit)
+            tail_lines: Number of trailing lines kept per stream
+            chunk_size: Bytes read per pipe wakeup
+            max_line_bytes: Longer lines are yielded in pieces of this size
+        """
+        self.cmd = cmd
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.max_line_bytes = max_line_bytes
+        self.stdout_tail = deque(maxlen=tail_lines)
+        self.stderr_tail = deque(maxlen=tail_lines)
+        self.result = None
+
+    def _describe(self):
+        return ' '.join(self.cmd) if isinstance(self.cmd, (list, tuple)) else str(self.cmd)
+
+    @staticmethod
+    def _kill(proc):
+        """Kill the whole process group so children (e.g. ssh) die too"""
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            proc.kill()
+
+    def __iter__(self):
+        start = time.monotonic()
+        deadline = start + self.timeout if self.timeout else None
+        timed_out = False
+
+        proc = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+
+        tails = {'stdout': self.stdout_tail, 'stderr': self.stderr_tail}
+        partial = {'stdout': b'', 'stderr': b''}
+
+        selector = selectors.DefaultSelector()
+        selector.register(proc.stdout, selectors.EVENT_READ, 'stdout')
+        selector.register(proc.stderr, selectors.EVENT_READ, 'stderr')
+
+        unfinished = True
+        try:
+            while selector.get_map():
+                wait = None
+                if deadline is not None:
+                    wait = deadline - time.monotonic()
+                    if wait <= 0:
+                        timed_out = True
+                        self._kill(proc)
+                        break
+
+                for key, _ in selector.select(wait):
+                    name = key.data
+                    chunk = os.read(key.fileobj.fileno(), self.chunk_size)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        if partial[name]:
+                            line = partial[name].decode(errors='replace')
+                            partial[name] = b''
+                            tails[name].append(line)
+                            yield name, line
+                        continue
+
+                    # apt/docker use \r for progress bars; treat it as a line break
+                    data = (partial[name] + chunk).replace(b'\r', b'\n')
+                    *lines, partial[name] = data.split(b'\n')
+                    rest = partial[name]
+                    if len(rest) > self.max_line_bytes:
+                        # No newline in sight: cut the run into max-length lines
+                        cut = len(rest) - len(rest) % self.max_line_bytes
+                        lines += [rest[i:i + self.max_line_bytes] for i in range(0, cut, self.max_line_bytes)]
+                        partial[name] = rest[cut:]
+                    for raw in lines:
+                        if not raw:
+                            continue
+                        line = raw.decode(errors='replace')
+                        tails[name].append(line)
+                        yield name, line
+            unfinished = timed_out
+        finally:
+            selector.close()
+            if unfinished and proc.poll() is None:
+                # Consumer stopped iterating before the command finished
+                self._kill(proc)
+            proc.stdout.close()
+            proc.stderr.close()
+            try:
+                # The pipes can close before the process exits (it closed them or
+                # handed them to a daemon), so the deadline still applies here
+                returncode = proc.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                self._kill(proc)
+                returncode = proc.wait()
+
+            self.result = CommandResult(
+                self._describe(), returncode, self.stdout_tail, self.stderr_tail,
+                time.monotonic() - start, timed_out
+            )
+
+
+def run_streaming(cmd, on_line=None, timeout=None, tail_lines=DEFAULT_TAIL_LINES, check=False):
+    """
+    Run a command to completion, passing each output line to a callback
+
+    Args:
+        cmd: Argument list to execute
+        on_line: Optional callable(stream_name, line) invoked per line
+        timeout: Seconds before the command is killed
+        tail_lines: Number of trailing lines kept per stream
+        check: Raise on non-zero exit or timeout
+
+    Returns:
+        CommandResult: Exit code, bounded output tails and timing
+    """
+    stream = CommandStream(cmd, timeout=timeout, tail_lines=tail_lines)
+    for name, line in stream:
+        if on_line:
+            on_line(name, line)
+
+    result = stream.result
+    if check and result.timed_out:
+        raise CommandTimeout(result.error_report())
+    if check and result.returncode != 0:
+        raise RuntimeError(result.error_report())
+    return result
+
+
+def print_progress(prefix='    '):
+    """Build an on_line callback that echoes lines with an indent"""
+    def on_line(stream_name, line):
+        print(f"{prefix}{line}", flush=True)
+    return on_line
+
+
+if __name__ == '__main__':
+    # Example usage
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: command_stream.py <command> [args...]")
+        sys.exit(1)
+
+    result = run_streaming(sys.argv[1:], on_line=print_progress(), timeout=60)
+    print(f"\nexit={result.returncode} duration={result.duration:.2f}s timed_out={result.timed_out}")
+    sys.exit(0 if result.ok else 1)
@@ -8,28 +8,55 @@ import secrets
 import base64
 import json
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
+
+from tracing import traced
+from user_store import default_email
+from config_validator import validate_file
+
+
+# Merged into docker-compose.yml by `docker compose`; only present while shaping is on
+COMPOSE_OVERRIDE = 'docker-compose.override.yml'
 
 
 class ConfigGenerator:
-    def __init__(self, config_dir, output_dir):
+    def __init__(self, config_dir, output_dir, cache_dir=None):
         """
         Initialize the config generator
 
         Args:
             config_dir: Directory containing Jinja2 templates
             output_dir: Directory to write rendered configs
+            cache_dir: Compiled-template and render cache (default: output_dir/.cache)
         """
         self.config_dir = Path(config_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_dir = Path(cache_dir) if cache_dir else self.output_dir / '.cache'
 
-        self.env = Environment(
-            loader=FileSystemLoader(self.config_dir),
-            autoescape=False
-        )
+        # Imported here so commands that never render templates skip jinja2
+        from template_cache import template_environment, RenderCache
+        self.env = template_environment(self.config_dir.resolve(), (self.cache_dir / 'bytecode').resolve())
+        self.render_cache = RenderCache(self.cache_dir / 'renders.json')
+
+    def precompile_templates(self):
+        """Compile every template into the bytecode cache ahead of the first render"""
+        from template_cache import precompile
+        return precompile(self.env)
+
+    def render_template(self, template_name, output_name, **context):
+        """
+        Render a template into output_dir, skipped when inputs match the last render
+
+        Returns:
+            Path: The output file
+        """
+        output_file = self.output_dir / output_name
+        with self.render_cache.batch():
+            self.render_cache.render(self.env, template_name, output_file, context)
+        return output_file
 
     @staticmethod
+    @traced(category='generate')
     def generate_reality_keypair():
         """Generate Reality private/public key pair using xray"""
         import subprocess
@@ -49,23 +76,221 @@ class ConfigGenerator:
         """Generate a random 16-char hex shortId for Reality"""
         return secrets.token_hex(8)
 
-    def render_xray_config(self, uuid, reality_dest, reality_server_names, reality_private_key, reality_short_ids):
-        """Render Xray configuration with Reality"""
-        template = self.env.get_template('xray.json.j2')
-        content = template.render(
-            uuid=uuid,
+    @staticmethod
+    def build_clients(users, with_email=True):
+        """
+        Build the VLESS `clients` list from user records
+
+        Args:
+            users: Iterable of dicts with 'uuid' and optionally 'email'/'level'
+            with_email: Include email (needed for per-user stats)
+
+        Returns:
+            list: Xray client objects
+        """
+        clients = []
+        for user in users:
+            client = {'id': user['uuid']}
+            if with_email:
+                client['email'] = user.get('email') or default_email(user['uuid'])
+            if user.get('level'):
+                client['level'] = user['level']
+            client['flow'] = 'xtls-rprx-vision'
+            clients.append(client)
+        return clients
+
+    @traced(category='generate')
+    def render_xray_config(self, uuid, reality_dest, reality_server_names, reality_private_key, reality_short_ids,
+                           enable_stats=False, stats_api_port=10085, email=None, clients=None,
+                           output_name='xray-config.json', shaping=None):
+        """
+        Render Xray configuration with Reality
+
+        Args:
+            enable_stats: Enable per-user/per-inbound traffic counters and the
+                StatsService API on 127.0.0.1:stats_api_port
+            stats_api_port: Local port of the stats API inbound
+            email: Client email (the key Xray uses for per-user stats)
+            clients: Prebuilt client list (see build_clients); overrides uuid/email
+            output_name: File name written under output_dir
+            shaping: ShapingPlan; routes each tier's users to its marked outbound
+        """
+        if clients is None:
+            if email or enable_stats:
+                clients = self.build_clients([{'uuid': uuid, 'email': email}])
+            else:
+                clients = self.build_clients([{'uuid': uuid}], with_email=False)
+
+        policy = {}
+        if enable_stats or shaping:
+            policy['levels'] = (shaping.policy_levels(enable_stats) if shaping else
+                                {'0': {'statsUserUplink': True, 'statsUserDownlink': True}})
+        if enable_stats:
+            policy['system'] = {
+                'statsInboundUplink': True,
+                'statsInboundDownlink': True,
+                'statsOutboundUplink': True,
+                'statsOutboundDownlink': True,
+            }
+
+        return self.render_template(
+            'xray.json.j2', output_name,
+            # Pretty-print small configs; large user lists stay compact
+            clients=json.dumps(clients, indent=2 if len(clients) <= 100 else None),
             reality_dest=reality_dest,
             reality_server_names=json.dumps(reality_server_names),
             reality_private_key=reality_private_key,
-            reality_short_ids=json.dumps(reality_short_ids)
+            reality_short_ids=json.dumps(reality_short_ids),
+            enable_stats=enable_stats,
+            stats_api_port=stats_api_port,
+            policy=json.dumps(policy, indent=2) if policy else None,
+            shaping_rules=[json.dumps(r) for r in shaping.routing_rules(clients)] if shaping else [],
+            shaping_outbounds=[json.dumps(o) for o in shaping.outbounds()] if shaping else []
         )
 
-        output_file = self.output_dir / 'xray-config.json'
-        output_file.write_text(content)
-        return output_file
+    @traced(category='generate')
+    def render_nginx_config(self, domain, ws_path, host=None, brotli_static=False, https_port=8443, **options):
+        """
+        Render nginx.conf sized for the host it will run on
+
+        nginx runs on the host network next to xray (docker-compose.yml), so
+        it serves the site over TLS on https_port: 443 belongs to xray.
+
+        Args:
+            domain: Site domain
+            ws_path: WebSocket path proxied to xray (127.0.0.1:10000)
+            host: HostResources of the target (default: this machine)
+            https_port: Port of the TLS site; REALITY_DEST=<domain>:<port> shows
+                it to anyone connecting to 443 without Reality credentials
+            brotli_static: Serve .br files (needs nginx built with ngx_brotli;
+                the stock nginx:alpine image would refuse to start)
+            options: Passed to nginx_sizing (ssl_session_tickets, ocsp_stapling, resolver)
+        """
+        from nginx_tuning import HostResources, nginx_sizing
+        from site_builder import HASHED_NAME_RE
+
+        sizing = nginx_sizing(host or HostResources.local(), **options)
+        return self.render_template(
+            'nginx.conf.j2', 'nginx.conf', domain=domain, ws_path=ws_path, https_port=https_port,
+            brotli_static=brotli_static, hashed_asset_re=HASHED_NAME_RE, **sizing
+        )
+
+    @traced(category='generate')
+    def build_site(self, force=False):
+        """
+        Build the camouflage site into output_dir/www
+
+        Minifies, fingerprints and precompresses configs/index.html and
+        configs/site/*; unchanged sources are skipped.
+
+        Returns:
+            dict: SiteBuilder stats
+        """
+        from site_builder import SiteBuilder, site_sources
+
+        builder = SiteBuilder(site_sources(self.config_dir), self.output_dir / 'www', self.cache_dir / 'site.json')
+        return builder.build(force=force)
+
+    def shard_config_name(self, store, shard):
+        """Output file for a shard; a single-shard store keeps xray-config.json"""
+        return 'xray-config.json' if store.shard_count == 1 else f"xray-config.shard-{shard}.json"
+
+    @traced(category='generate')
+    def generate_from_store(self, store, reality_dest, reality_server_names, reality_private_key,
+                            enable_stats=False, stats_api_port=10085, force=False, validate=True,
+                            geo_source_dir=None, shaping=None):
+        """
+        Render per-shard Xray configs, only for shards whose users changed
+
+        Args:
+            store: UserStore holding the users
+            reality_dest: Reality destination
+            reality_server_names: List of Reality server names
+            reality_private_key: Reality private key
+            enable_stats: Enable traffic stats
+            stats_api_port: Local port of the stats API inbound
+            force: Rebuild every shard
+            validate: Check each written config (raises ConfigValidationError)
+            geo_source_dir: Full geoip.dat/geosite.dat to trim (see build_geo_data)
+            shaping: ShapingPlan for users' levels; pass force=True when the tiers change
+
+        Returns:
+            dict: shard -> Path for the configs that were (re)written; a
+            shard without enabled users gets no config (an old one is removed)
+
+        Raises:
+            ValueError: No enabled users at all (Xray needs at least one client)
+        """
+        if not store.active_count():
+            raise ValueError(f"No enabled users in {store.db_path}; add or enable one before generating")
+
+        revision = store.revision
+        last_built = {shard: store.last_built(f"xray-config:{shard}") for shard in range(store.shard_count)}
+        changed = store.changed_shards(max(0, min(last_built.values())))
+
+        written = {}
+        # One manifest write for all shards
+        with self.render_cache.batch():
+            for shard, last in last_built.items():
+                artifact = f"xray-config:{shard}"
+                output = self.output_dir / self.shard_config_name(store, shard)
+                if not force and last >= 0 and output.exists() and changed.get(shard, -1) <= last:
+                    continue
+
+                users = store.active_users(shard)
+                if not users:
+                    output.unlink(missing_ok=True)
+                    store.mark_built(artifact, revision)
+                    continue
+                short_ids = sorted({u['short_id'] for u in users}) or ['']
+                written[shard] = self.render_xray_config(
+                    None, reality_dest, reality_server_names, reality_private_key, short_ids,
+                    enable_stats=enable_stats, stats_api_port=stats_api_port,
+                    clients=self.build_clients(users, with_email=True),
+                    output_name=output.name, shaping=shaping
+                )
+                if validate:
+                    validate_file(written[shard])
+                store.mark_built(artifact, revision)
+
+        # Every shard shares the routing rules, so any shard's config decides the geo data
+        configs = self.shard_configs(store)
+        self.build_geo_data(configs[0], geo_source_dir)
+        return written
+
+    def shard_configs(self, store):
+        """Paths of every shard config currently in output_dir (not just the regenerated ones)"""
+        paths = (self.output_dir / self.shard_config_name(store, shard) for shard in range(store.shard_count))
+        return [path for path in paths if path.exists()]
+
+    @traced(category='generate')
+    def build_geo_data(self, xray_config, source_dir=None):
+        """
+        Write geoip.dat/geosite.dat holding only the codes the routing rules use
 
-    def copy_static_files(self):
-        """Copy static files like docker-compose.yml"""
+        Xray loads every referenced .dat file whole, so trimming it to the
+        used entries cuts its memory and startup time. The files go to
+        output_dir/geo, which docker-compose.yml mounts as the asset dir.
+
+        Args:
+            xray_config: Path of the rendered config
+            source_dir: Directory with the full .dat files (only needed for
+                codes other than geoip:private)
+
+        Returns:
+            dict: GeoDataBuilder.build result
+        """
+        from geo_data import GeoDataBuilder
+        return GeoDataBuilder(self.output_dir / 'geo', source_dir).build(xray_config)
+
+    def copy_static_files(self, shaping=None):
+        """
+        Copy static files like docker-compose.yml
+
+        Args:
+            shaping: ShapingPlan; also writes the compose override that moves
+                xray to host networking (see write_compose_override)
+        """
         import shutil
 
         static_files = ['docker-compose.yml']
@@ -74,8 +299,41 @@ class ConfigGenerator:
             if src.exists():
                 dst = self.output_dir / filename
                 shutil.copy(src, dst)
+        self.write_compose_override(shaping)
 
-    def generate_all(self, uuid, reality_dest, reality_server_names, reality_private_key, reality_short_ids):
+    def write_compose_override(self, shaping=None):
+        """
+        Write docker-compose.override.yml when bandwidth shaping is on, else remove it
+
+        Socket marks don't survive leaving a container's network namespace,
+        so shaped xray needs host networking and NET_ADMIN. Without tiers it
+        keeps the bridged network and port mappings of docker-compose.yml.
+        `docker compose` merges the override by itself when run in the
+        deployment directory.
+
+        Returns:
+            Path: The override, or None when shaping is off
+        """
+        override = self.output_dir / COMPOSE_OVERRIDE
+        if not shaping:
+            override.unlink(missing_ok=True)
+            return None
+        override.write_text(
+            "# Written by ConfigGenerator because SHAPING_TIERS is set (shaping.py)\n"
+            "services:\n"
+            "  xray:\n"
+            "    network_mode: host\n"
+            "    cap_add:\n"
+            "      - NET_ADMIN\n"
+            "    # Host networking can't publish ports (needs Compose 2.24+ for !reset)\n"
+            "    ports: !reset []\n"
+        )
+        return override
+
+    @traced(category='generate')
+    def generate_all(self, uuid, reality_dest, reality_server_names, reality_private_key, reality_short_ids,
+                     enable_stats=False, stats_api_port=10085, validate=True, geo_source_dir=None,
+                     shaping=None):
         """
         Generate all configuration files for Reality setup
 
@@ -85,15 +343,32 @@ class ConfigGenerator:
             reality_server_names: List of server names for Reality SNI
             reality_private_key: Reality private key
             reality_short_ids: List of short IDs for Reality
+            enable_stats: Enable Xray traffic stats and the StatsService API
+            stats_api_port: Local port of the stats API inbound
+            validate: Check the rendered config before anything is uploaded
+            geo_source_dir: Full geoip.dat/geosite.dat to trim (see build_geo_data)
+            shaping: ShapingPlan; the single user is on level 0, so this only
+                adds the tier outbounds and policy levels
 
         Returns:
             dict: Paths to generated files
+
+        Raises:
+            ConfigValidationError: The rendered config would not start
+            GeoDataError: The rules use geo codes geo_source_dir doesn't have
         """
-        xray_config = self.render_xray_config(uuid, reality_dest, reality_server_names, reality_private_key, reality_short_ids)
-        self.copy_static_files()
+        xray_config = self.render_xray_config(
+            uuid, reality_dest, reality_server_names, reality_private_key, reality_short_ids,
+            enable_stats=enable_stats, stats_api_port=stats_api_port, shaping=shaping
+        )
+        if validate:
+            validate_file(xray_config)
+        self.build_geo_data(xray_config, geo_source_dir)
+        self.copy_static_files(shaping)
 
         return {
-            'xray_config': xray_config
+            'xray_config': xray_config,
+            'geo_dir': self.output_dir / 'geo'
         }
 
 
@@ -101,21 +376,18 @@ if __name__ == '__main__':
     # Example usage
     import sys
 
-    if len(sys.argv) < 5:
-        print("Usage: config_generator.py <uuid> <domain> <ws_path> <ss_port>")
+    if len(sys.argv) < 6:
+        print("Usage: config_generator.py <uuid> <reality_dest> <server_name> <private_key> <short_id>")
         sys.exit(1)
 
-    uuid = sys.argv[1]
-    domain = sys.argv[2]
-    ws_path = sys.argv[3]
-    ss_port = int(sys.argv[4])
+    uuid, reality_dest, server_name, private_key, short_id = sys.argv[1:6]
 
     generator = ConfigGenerator(
         config_dir='../configs',
         output_dir='../generated'
     )
 
-    result = generator.generate_all(uuid, domain, ws_path, ss_port)
+    result = generator.generate_all(uuid, reality_dest, [server_name], private_key, [short_id])
 
     print("Generated configurations:")
     for key, value in result.items():
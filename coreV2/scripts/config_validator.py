@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Config Validator - Catch broken Xray configs locally before they are deployed
+"""
+
+import re
+import json
+from collections import Counter
+from itertools import repeat
+from operator import itemgetter
+from pathlib import Path
+
+
+UUID_RE = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+SHORT_ID_RE = re.compile(r'(?:[0-9a-fA-F]{2}){0,8}')
+PRIVATE_KEY_RE = re.compile(r'[A-Za-z0-9_-]{43}')
+
+VLESS_FLOWS = {'', 'xtls-rprx-vision'}
+WILDCARD_LISTENS = {'0.0.0.0', '::', ''}
+MAX_REPORTED = 10
+
+
+class ConfigValidationError(ValueError):
+    def __init__(self, path, problems):
+        self.path = path
+        self.problems = problems
+        shown = '\n'.join(f"  - {p}" for p in problems[:MAX_REPORTED])
+        more = f"\n  ... and {len(problems) - MAX_REPORTED} more" if len(problems) > MAX_REPORTED else ''
+        super().__init__(f"{path}: {len(problems)} problem(s)\n{shown}{more}")
+
+
+def _valid_id(value):
+    # Xray also accepts any 1-30 byte string and maps it to a UUIDv5
+    return isinstance(value, str) and (UUID_RE.fullmatch(value) is not None or 0 < len(value.encode()) <= 30)
+
+
+# Long lists (ids, shortIds) are checked in bulk on the joined string with
+# C-level str operations; the per-item regex only runs to name offenders
+_DELETE_HEX = str.maketrans('', '', '0123456789abcdefABCDEF')
+SHORT_ID_LENGTHS = set(range(0, 17, 2))
+
+
+def _join(values):
+    try:
+        return '\n'.join(values)
+    except TypeError:
+        return None
+
+
+def _all_uuids(ids):
+    """True if every id is a canonical 36-character UUID"""
+    joined, n = _join(ids), len(ids)
+    if joined is None or len(joined) != 37 * n - 1:
+        return False
+    if any(joined[offset::37].count('-') != n for offset in (8, 13, 18, 23)):
+        return False
+    # What is left after deleting hex digits must be exactly the dashes and separators
+    return joined[36::37].count('\n') == n - 1 and len(joined.translate(_DELETE_HEX)) == 5 * n - 1
+
+
+def _all_short_ids(short_ids):
+    """True if every shortId is 0-16 hex digits of even length"""
+    joined = _join(short_ids)
+    if joined is None or not set(map(len, short_ids)) <= SHORT_ID_LENGTHS:
+        return False
+    return joined.translate(_DELETE_HEX) == '\n' * (len(short_ids) - 1)
+
+
+def _duplicates(values):
+    counts = Counter(values)
+    return [value for value, n in counts.items() if n > 1]
+
+
+def _limited(problems, found, message):
+    for item in found[:MAX_REPORTED]:
+        problems.append(message(item))
+    if len(found) > MAX_REPORTED:
+        problems.append(f"... {len(found) - MAX_REPORTED} more like the above")
+
+
+class XrayConfigValidator:
+    def __init__(self, config):
+        """
+        Validate a parsed Xray server config
+
+        Every cross-reference (tags, ports, ids) goes through a set or dict
+        built once, so the cost is linear in the config size.
+
+        Args:
+            config: Parsed JSON dict
+        """
+        self.config = config
+        self.problems = []
+
+    def error(self, path, message):
+        self.problems.append(f"{path}: {message}")
+
+    def validate(self):
+        """
+        Run every check
+
+        Returns:
+            list: Problem descriptions (empty when valid)
+        """
+        config = self.config
+        if not isinstance(config, dict):
+            self.error('$', 'top level must be an object')
+            return self.problems
+
+        inbounds = self._list(config, 'inbounds', required=True)
+        outbounds = self._list(config, 'outbounds', required=True)
+
+        inbound_tags = self._tags(inbounds, 'inbounds')
+        outbound_tags = self._tags(outbounds, 'outbounds')
+        self._ports(inbounds)
+        for i, inbound in enumerate(inbounds):
+            if isinstance(inbound, dict):
+                self._inbound(f"inbounds[{i}]", inbound)
+        self._routing(config.get('routing'), inbound_tags, outbound_tags)
+        return self.problems
+
+    # -- structure -----------------------------------------------------------
+
+    def _list(self, config, key, required=False):
+        value = config.get(key)
+        if value is None:
+            if required:
+                self.error(key, 'missing')
+            return []
+        if not isinstance(value, list):
+            self.error(key, 'must be a list')
+            return []
+        return value
+
+    def _tags(self, items, path):
+        tags = set()
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                self.error(f"{path}[{i}]", 'must be an object')
+                continue
+            if not item.get('protocol'):
+                self.error(f"{path}[{i}]", 'missing protocol')
+            tag = item.get('tag')
+            if tag is None:
+                continue
+            if tag in tags:
+                self.error(f"{path}[{i}].tag", f"duplicate tag '{tag}'")
+            tags.add(tag)
+        return tags
+
+    def _ports(self, inbounds):
+        """Two inbounds conflict on the same port if either listens on all addresses"""
+        by_port = {}
+        for i, inbound in enumerate(inbounds):
+            if not isinstance(inbound, dict):
+                continue
+            port = inbound.get('port')
+            if isinstance(port, str) and port.isdigit():
+                port = int(port)
+            if not isinstance(port, int) or not 0 < port < 65536:
+                self.error(f"inbounds[{i}].port", f"invalid port {port!r}")
+                continue
+            listen = inbound.get('listen', '0.0.0.0')
+            for j, other in by_port.get(port, ()):
+                if listen == other or listen in WILDCARD_LISTENS or other in WILDCARD_LISTENS:
+                    self.error(f"inbounds[{i}].port", f"port {port} already used by inbounds[{j}]")
+            by_port.setdefault(port, []).append((i, listen))
+
+    # -- inbounds ------------------------------------------------------------
+
+    def _inbound(self, path, inbound):
+        settings = inbound.get('settings') or {}
+        if inbound.get('protocol') == 'vless':
+            if settings.get('decryption') != 'none':
+                self.error(f"{path}.settings.decryption", "VLESS requires 'none'")
+            self._clients(f"{path}.settings.clients", settings.get('clients'))
+
+        stream = inbound.get('streamSettings') or {}
+        if stream.get('security') == 'reality':
+            self._reality(f"{path}.streamSettings.realitySettings", stream.get('realitySettings'))
+
+    def _clients(self, path, clients):
+        if not isinstance(clients, list) or not clients:
+            self.error(path, 'must be a non-empty list')
+            return
+        try:
+            ids = list(map(itemgetter('id'), clients))
+        except (TypeError, KeyError):
+            for i, client in enumerate(clients):
+                if not isinstance(client, dict) or 'id' not in client:
+                    self.error(f"{path}[{i}]", 'missing id')
+            return
+
+        if not _all_uuids(ids):
+            bad = [i for i, value in enumerate(ids) if not _valid_id(value)]
+            _limited(self.problems, bad, lambda i: f"{path}[{i}].id: invalid id {ids[i]!r}")
+
+        if len(set(ids)) != len(ids):
+            _limited(self.problems, _duplicates(ids), lambda v: f"{path}: duplicate id {v}")
+
+        emails = [e for e in map(dict.get, clients, repeat('email')) if e is not None]
+        if len(set(emails)) != len(emails):
+            _limited(self.problems, _duplicates(emails), lambda v: f"{path}: duplicate email {v}")
+
+        flows = set(map(dict.get, clients, repeat('flow'))) - {None}
+        for flow in flows - VLESS_FLOWS:
+            self.error(path, f"unknown flow {flow!r}")
+
+    def _reality(self, path, reality):
+        if not isinstance(reality, dict):
+            self.error(path, 'missing')
+            return
+
+        dest = reality.get('dest')
+        if not dest:
+            self.error(f"{path}.dest", 'missing')
+        else:
+            port = str(dest).rpartition(':')[2]
+            if not port.isdigit() or not 0 < int(port) < 65536:
+                self.error(f"{path}.dest", f"expected host:port, got {dest!r}")
+
+        names = reality.get('serverNames')
+        if not isinstance(names, list) or not names or not all(isinstance(n, str) and n for n in names):
+            self.error(f"{path}.serverNames", 'must be a non-empty list of names')
+        else:
+            # A comma-separated config value passed through as one name never matches any SNI
+            for name in names:
+                if ',' in name or ' ' in name:
+                    self.error(f"{path}.serverNames", f"{name!r} looks like several names in one entry")
+
+        key = reality.get('privateKey')
+        if not isinstance(key, str) or not PRIVATE_KEY_RE.fullmatch(key):
+            self.error(f"{path}.privateKey", 'must be a 43-character base64url X25519 key')
+
+        short_ids = reality.get('shortIds')
+        if not isinstance(short_ids, list) or not short_ids:
+            self.error(f"{path}.shortIds", 'must be a non-empty list')
+            return
+        if not _all_short_ids(short_ids):
+            bad = [s for s in short_ids if not isinstance(s, str) or not SHORT_ID_RE.fullmatch(s)]
+            _limited(self.problems, bad, lambda s: f"{path}.shortIds: {s!r} is not 0-16 hex digits of even length")
+        if len(set(map(str, short_ids))) != len(short_ids):
+            _limited(self.problems, _duplicates(map(str, short_ids)), lambda s: f"{path}.shortIds: duplicate {s!r}")
+
+    # -- routing -------------------------------------------------------------
+
+    def _routing(self, routing, inbound_tags, outbound_tags):
+        if routing is None:
+            return
+        if not isinstance(routing, dict):
+            self.error('routing', 'must be an object')
+            return
+
+        # The API's tag acts as an outbound for routing purposes
+        api_tag = (self.config.get('api') or {}).get('tag')
+        targets = outbound_tags | ({api_tag} if api_tag else set())
+
+        balancer_tags = set()
+        for i, balancer in enumerate(self._list(routing, 'balancers')):
+            path = f"routing.balancers[{i}]"
+            if not isinstance(balancer, dict):
+                self.error(path, 'must be an object')
+                continue
+            balancer_tags.add(balancer.get('tag'))
+            for prefix in balancer.get('selector') or []:
+                if not any(tag.startswith(prefix) for tag in outbound_tags):
+                    self.error(f"{path}.selector", f"no outbound tag starts with '{prefix}'")
+
+        for i, rule in enumerate(self._list(routing, 'rules')):
+            path = f"routing.rules[{i}]"
+            if not isinstance(rule, dict):
+                self.error(path, 'must be an object')
+                continue
+            outbound, balancer = rule.get('outboundTag'), rule.get('balancerTag')
+            if not outbound and not balancer:
+                self.error(path, 'needs outboundTag or balancerTag')
+            if outbound and outbound not in targets:
+                self.error(f"{path}.outboundTag", f"unknown outbound '{outbound}'")
+            if balancer and balancer not in balancer_tags:
+                self.error(f"{path}.balancerTag", f"unknown balancer '{balancer}'")
+            for tag in rule.get('inboundTag') or []:
+                if tag not in inbound_tags:
+                    self.error(f"{path}.inboundTag", f"unknown inbound '{tag}'")
+
+
+def validate_xray_config(config):
+    """Validate a parsed config; returns a list of problems"""
+    return XrayConfigValidator(config).validate()
+
+
+def validate_file(path):
+    """
+    Parse and validate an Xray config file
+
+    Raises:
+        ConfigValidationError: With every problem found
+    """
+    text = Path(path).read_text()
+    try:
+        config = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ConfigValidationError(path, [f"line {e.lineno} column {e.colno}: {e.msg}"])
+
+    problems = validate_xray_config(config)
+    if problems:
+        raise ConfigValidationError(path, problems)
+    return config
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: config_validator.py <xray-config.json> [...]")
+        sys.exit(1)
+
+    failed = False
+    for path in sys.argv[1:]:
+        started = time.perf_counter()
+        try:
+            validate_file(path)
+            print(f"  ✓ {path} ({(time.perf_counter() - started) * 1000:.1f} ms)")
+        except ConfigValidationError as e:
+            failed = True
+            print(f"  ✗ {e}")
+    sys.exit(1 if failed else 0)
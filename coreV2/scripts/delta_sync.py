@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Delta Sync - rsync-style uploads that send only the blocks a remote file lacks
+"""
+
+import math
+import zlib
+import time
+import shlex
+import struct
+import hashlib
+import subprocess
+from pathlib import Path
+
+
+MIN_BLOCK = 1024
+MAX_BLOCK = 64 * 1024
+# Below this size one scp costs about as much as the signature round trip
+DELTA_MIN_SIZE = 256 * 1024
+# Literal bytes beyond this fraction of the file make a full copy the better deal
+MAX_LITERAL = 0.5
+ADLER_MOD = 65521
+
+# Signature: file size + SHA-256, then per block its Adler-32 and a 128-bit BLAKE2b
+_HEADER = struct.Struct('<Q32s')
+_BLOCK = struct.Struct('<I16s')
+# Delta stream ops: copy `count` old blocks from `index` / send `length` literal bytes
+_COPY = struct.Struct('<cII')
+_LITERAL = struct.Struct('<cI')
+# Exit status of the helper's sig mode when the remote file does not exist
+_MISSING = 3
+
+# Runs on the VPS with its python3 (stdlib only, any 3.6+). `sig PATH BLOCK` prints the
+# signature; `patch PATH BLOCK SHA256` rebuilds PATH from its old blocks and the delta on
+# stdin into a temp file next to it, checks the SHA-256 and renames it into place.
+REMOTE_HELPER = r'''
+import os, sys, zlib, struct, hashlib, tempfile
+mode, path, block = sys.argv[1], sys.argv[2], int(sys.argv[3])
+if mode == 'sig':
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        sys.exit(3)
+    whole, size, blocks = hashlib.sha256(), 0, []
+    with f:
+        for chunk in iter(lambda: f.read(block), b''):
+            whole.update(chunk)
+            size += len(chunk)
+            blocks.append(struct.pack('<I16s', zlib.adler32(chunk), hashlib.blake2b(chunk, digest_size=16).digest()))
+    sys.stdout.buffer.write(struct.pack('<Q32s', size, whole.digest()) + b''.join(blocks))
+    sys.exit(0)
+
+src = sys.stdin.buffer
+fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.' + os.path.basename(path) + '.')
+whole = hashlib.sha256()
+try:
+    with open(path, 'rb') as old, os.fdopen(fd, 'wb') as new:
+        for op in iter(lambda: src.read(1), b''):
+            if op == b'C':
+                index, count = struct.unpack('<II', src.read(8))
+                old.seek(index * block)
+                remaining = count * block
+                while remaining:
+                    data = old.read(min(remaining, 1 << 20))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    whole.update(data)
+                    new.write(data)
+            elif op == b'L':
+                data = src.read(struct.unpack('<I', src.read(4))[0])
+                whole.update(data)
+                new.write(data)
+            else:
+                sys.exit('bad delta op %r' % op)
+        new.flush()
+        os.fsync(new.fileno())
+    if whole.hexdigest() != sys.argv[4]:
+        sys.exit('rebuilt file does not match; left unchanged')
+    os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+    os.replace(tmp, path)
+finally:
+    if os.path.exists(tmp):
+        os.unlink(tmp)
+'''
+
+
+class DeltaError(RuntimeError):
+    pass
+
+
+def block_size(size):
+    """rsync's rule of thumb: about sqrt(size), within MIN_BLOCK..MAX_BLOCK"""
+    return min(MAX_BLOCK, max(MIN_BLOCK, math.isqrt(size)))
+
+
+def strong_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class Signature:
+    def __init__(self, raw, block):
+        """
+        Parsed signature of the remote copy
+
+        Args:
+            raw: Bytes printed by the helper's sig mode
+            block: Block size it was computed with
+
+        Raises:
+            DeltaError: Truncated or malformed signature
+        """
+        if len(raw) < _HEADER.size or (len(raw) - _HEADER.size) % _BLOCK.size:
+            raise DeltaError(f"malformed signature ({len(raw)} bytes)")
+        self.block = block
+        self.size, self.sha256 = _HEADER.unpack_from(raw)
+        blocks = list(_BLOCK.iter_unpack(raw[_HEADER.size:]))
+        if len(blocks) != -(-self.size // block):
+            raise DeltaError(f"signature has {len(blocks)} blocks for {self.size} bytes")
+
+        # weak -> {strong: index}; a short last block can only match at the very end
+        self.table = {}
+        self.tail = None
+        for index, (weak, strong) in enumerate(blocks):
+            if index == len(blocks) - 1 and self.size % block:
+                self.tail = (index, self.size % block, strong)
+            else:
+                self.table.setdefault(weak, {}).setdefault(strong, index)
+
+
+def compute_delta(data, signature, max_literal=None):
+    """
+    Ops rebuilding `data` from the blocks behind `signature`
+
+    Block-aligned matches are found with one Adler-32 and one hash lookup
+    per block; only after a change does the window roll byte by byte until
+    it lines up with an old block again.
+
+    Args:
+        data: New file contents
+        signature: Signature of the old contents
+        max_literal: Give up (return None) once more bytes than this are unmatched
+
+    Returns:
+        list: ('C', index, count) and ('L', start, end) ops, or None
+    """
+    block = signature.block
+    table = signature.table
+    view = memoryview(data)
+    size = len(data)
+    ops = []
+
+    def copy(index):
+        if ops and ops[-1][0] == 'C' and ops[-1][1] + ops[-1][2] == index:
+            ops[-1] = ('C', ops[-1][1], ops[-1][2] + 1)
+        else:
+            ops.append(('C', index, 1))
+
+    pos = literal_from = unmatched = 0
+    weak = None
+    while pos + block <= size:
+        if weak is None:
+            weak = zlib.adler32(view[pos:pos + block])
+        candidates = table.get(weak)
+        if candidates:
+            index = candidates.get(strong_hash(view[pos:pos + block]))
+            if index is not None:
+                if literal_from < pos:
+                    ops.append(('L', literal_from, pos))
+                copy(index)
+                pos += block
+                literal_from = pos
+                weak = None
+                continue
+        if pos + block == size:
+            break
+        # Roll the window one byte: drop data[pos], take in data[pos + block]
+        out, new = data[pos], data[pos + block]
+        a = ((weak & 0xffff) - out + new) % ADLER_MOD
+        b = ((weak >> 16) - block * out + a - 1) % ADLER_MOD
+        weak = a | b << 16
+        pos += 1
+        unmatched += 1
+        if max_literal is not None and unmatched > max_literal:
+            return None
+
+    tail = signature.tail
+    if tail and size - literal_from >= tail[1] and strong_hash(view[size - tail[1]:]) == tail[2]:
+        if literal_from < size - tail[1]:
+            ops.append(('L', literal_from, size - tail[1]))
+        copy(tail[0])
+        literal_from = size
+    if literal_from < size:
+        ops.append(('L', literal_from, size))
+    return ops
+
+
+def encode_delta(data, ops):
+    """Byte stream of ops for the helper's patch mode"""
+    parts = []
+    for op in ops:
+        if op[0] == 'C':
+            parts.append(_COPY.pack(b'C', op[1], op[2]))
+        else:
+            parts.append(_LITERAL.pack(b'L', op[2] - op[1]))
+            parts.append(data[op[1]:op[2]])
+    return b''.join(parts)
+
+
+def delta_upload(ssh_alias, local_path, remote_path, timeout=300, python='python3'):
+    """
+    Update a remote file by sending only what changed
+
+    Args:
+        ssh_alias: SSH config alias
+        local_path: New file
+        remote_path: Remote file to update in place (atomically renamed)
+        timeout: Seconds per ssh command
+        python: Python 3 on the remote host
+
+    Returns:
+        dict: mode ('delta' or 'unchanged'), size, sent, received, literal and
+        seconds; None when a plain copy is the way to go (no remote file yet,
+        or too little of it reusable)
+
+    Raises:
+        DeltaError: The helper failed; the remote file is left as it was
+    """
+    started = time.perf_counter()
+    data = Path(local_path).read_bytes()
+    block = block_size(len(data))
+    helper = f"{python} -c {shlex.quote(REMOTE_HELPER)}"
+    target = shlex.quote(str(remote_path))
+
+    def remote(command, payload=None):
+        try:
+            return subprocess.run(['ssh', ssh_alias, command], input=payload, capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise DeltaError(f"timed out after {timeout}s")
+
+    result = remote(f"{helper} sig {target} {block}")
+    if result.returncode == _MISSING:
+        return None
+    if result.returncode != 0:
+        raise DeltaError(result.stderr.decode(errors='replace').strip() or f"exit status {result.returncode}")
+    signature = Signature(result.stdout, block)
+
+    digest = hashlib.sha256(data)
+    stats = {'mode': 'unchanged', 'size': len(data), 'sent': 0, 'received': len(result.stdout), 'literal': 0}
+    if signature.size != len(data) or signature.sha256 != digest.digest():
+        ops = compute_delta(data, signature, max_literal=int(len(data) * MAX_LITERAL))
+        if ops is None:
+            return None
+        delta = encode_delta(data, ops)
+        result = remote(f"{helper} patch {target} {block} {digest.hexdigest()}", delta)
+        if result.returncode != 0:
+            raise DeltaError(result.stderr.decode(errors='replace').strip() or f"exit status {result.returncode}")
+        stats.update(mode='delta', sent=len(delta), literal=sum(op[2] - op[1] for op in ops if op[0] == 'L'))
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+# -- benchmark ----------------------------------------------------------------------
+
+def _large_config(clients):
+    """Xray-config-shaped JSON with one line per client"""
+    import uuid as uuid_lib
+
+    lines = [f'        {{"id": "{uuid_lib.UUID(int=i + 1)}", "email": "user{i}@example.com", '
+             f'"flow": "xtls-rprx-vision", "level": {i % 3}}},' for i in range(clients)]
+    return ('{\n  "inbounds": [{\n    "settings": {\n      "clients": [\n' + '\n'.join(lines) +
+            '\n      ]\n    }\n  }]\n}\n').encode()
+
+
+def _edits(data):
+    """(label, edited copy) pairs of small changes to a large file"""
+    middle = data.index(b'\n', len(data) // 2) + 1
+    line_end = data.index(b'\n', middle)
+    return [
+        ('one line changed', data[:middle] + data[middle:line_end].replace(b'"level": ', b'"level": 9') +
+         data[line_end:]),
+        ('one line inserted', data[:middle] + b'        {"id": "new", "email": "new@example.com"},\n' + data[middle:]),
+        ('1 KB deleted at start', data[:100] + data[1124:]),
+        ('appended 10 KB', data + b' ' * 10240),
+    ]
+
+
+def run_benchmark(clients=100000, repeat=3):
+    """
+    Full scp vs delta upload of a large file after small edits, over the ssh stand-in
+
+    Returns:
+        list: dicts with label, size, full_s, delta_s, sent and literal
+    """
+    import tempfile
+    from benchmark import ssh_shim
+
+    data = _large_config(clients)
+    rows = []
+    with ssh_shim(), tempfile.TemporaryDirectory(prefix='delta-bench-') as work_dir:
+        local, remote = Path(work_dir) / 'new.json', Path(work_dir) / 'remote.json'
+        for label, edited in _edits(data):
+            local.write_bytes(edited)
+            full, delta = [], []
+            for _ in range(repeat):
+                remote.write_bytes(data)
+                started = time.perf_counter()
+                subprocess.run(['scp', str(local), f"bench:{remote}"], check=True)
+                full.append(time.perf_counter() - started)
+
+                remote.write_bytes(data)
+                stats = delta_upload('bench', local, remote)
+                delta.append(stats['seconds'])
+                if remote.read_bytes() != edited:
+                    raise DeltaError(f"{label}: remote file differs after the delta upload")
+            rows.append({'label': label, 'size': len(edited), 'full_s': min(full), 'delta_s': min(delta),
+                         'sent': stats['sent'] + stats['received'], 'literal': stats['literal']})
+    return rows
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Delta-upload a file over SSH, or benchmark it')
+    parser.add_argument('local', nargs='?')
+    parser.add_argument('remote', nargs='?', help='alias:path')
+    parser.add_argument('--bench', action='store_true', help='Small edits to a large file via a local ssh stand-in')
+    parser.add_argument('--clients', type=int, default=100000, help='Client lines in the benchmark file')
+    parser.add_argument('--uplink', type=float, default=20.0,
+                        help='Mbit/s used to estimate times on a real link (the stand-in has no wire)')
+    args = parser.parse_args()
+
+    if args.bench:
+        kb = 1024
+        wire = args.uplink * 1e6 / 8
+        print(f"  Local stand-in times; 'at {args.uplink:g} Mbit/s' adds the bytes' transfer time\n")
+        for row in run_benchmark(args.clients):
+            print(f"  {row['label']:<22} {row['size'] / kb / kb:.1f} MB: scp {row['full_s'] * 1000:.0f} ms, "
+                  f"delta {row['delta_s'] * 1000:.0f} ms with {row['sent'] / kb:.1f} KB on the wire "
+                  f"({row['literal']:,} literal bytes); at {args.uplink:g} Mbit/s "
+                  f"{row['full_s'] + row['size'] / wire:.1f}s vs {row['delta_s'] + row['sent'] / wire:.1f}s")
+        sys.exit(0)
+
+    if not args.local or not args.remote or ':' not in args.remote:
+        parser.error('pass LOCAL ALIAS:PATH, or --bench')
+    alias, path = args.remote.split(':', 1)
+    try:
+        stats = delta_upload(alias, args.local, path)
+    except DeltaError as e:
+        print(f"  ✗ {e}")
+        sys.exit(1)
+    if stats is None:
+        print("  ✗ No usable remote copy; upload it in full first")
+        sys.exit(1)
+    print(f"  ✓ {stats['mode']}: {stats['sent'] + stats['received']:,} bytes on the wire for "
+          f"{stats['size']:,} in {stats['seconds']:.2f}s")
@@ -6,9 +6,19 @@ Deployer - Remote deployment orchestration
 import time
 import subprocess
 
+from command_stream import run_streaming, print_progress, CommandTimeout
+from tracing import span, traced
+
+
+DOCKER_IMAGES = [
+    "ghcr.io/xtls/xray-core:latest",
+    "ghcr.io/shadowsocks/ssserver-rust:latest",
+    "nginx:alpine"
+]
+
 
 class Deployer:
-    def __init__(self, ssh_alias, remote_user, remote_base_dir='/home/shaun/vpn'):
+    def __init__(self, ssh_alias, remote_user, remote_base_dir='/home/shaun/vpn', command_timeout=600, verbose=True):
         """
         Initialize the deployer
 
@@ -16,10 +26,14 @@ class Deployer:
             ssh_alias: SSH config alias
             remote_user: Remote username
             remote_base_dir: Base directory for VPN files on remote server
+            command_timeout: Seconds before a remote command is killed
+            verbose: Echo streamed output of long-running commands
         """
         self.ssh_alias = ssh_alias
         self.remote_user = remote_user
         self.remote_base_dir = remote_base_dir
+        self.command_timeout = command_timeout
+        self.verbose = verbose
 
     def run_remote_command(self, command, check=True):
         """
@@ -33,15 +47,70 @@ class Deployer:
             tuple: (stdout, stderr, return_code)
         """
         ssh_cmd = ['ssh', self.ssh_alias, command]
-        result = subprocess.run(ssh_cmd, capture_output=True, text=True)
+        with span(command, 'remote', host=self.ssh_alias) as sp:
+            try:
+                result = subprocess.run(ssh_cmd, capture_output=True, text=True, timeout=self.command_timeout)
+            except subprocess.TimeoutExpired:
+                raise CommandTimeout(f"Command timed out after {self.command_timeout}s: {command}")
+            sp.set(returncode=result.returncode)
 
         if check and result.returncode != 0:
             raise RuntimeError(f"Command failed: {command}\nError: {result.stderr}")
 
         return result.stdout, result.stderr, result.returncode
 
+    def stream_remote_command(self, command, on_line=None, timeout=None, check=True):
+        """
+        Run a long-running command on the remote server, streaming its output
+
+        Only a bounded tail of the output is kept in memory, so chatty
+        commands like `docker pull` or `apt-get` don't grow unbounded.
+
+        Args:
+            command: Command to execute
+            on_line: Callable(stream_name, line) per output line
+                (defaults to an indented echo when verbose)
+            timeout: Seconds before the command is killed (defaults to command_timeout)
+            check: Raise exception on non-zero exit code or timeout
+
+        Returns:
+            CommandResult: Exit code, output tails and duration
+        """
+        if on_line is None and self.verbose:
+            on_line = print_progress('    │ ')
+
+        ssh_cmd = ['ssh', self.ssh_alias, command]
+        with span(command, 'remote', host=self.ssh_alias, streamed=True) as sp:
+            result = run_streaming(
+                ssh_cmd,
+                on_line=on_line,
+                timeout=timeout or self.command_timeout,
+                check=check
+            )
+            sp.set(returncode=result.returncode, timed_out=result.timed_out)
+        return result
+
+    @traced(category='deployer')
+    def probe_host_resources(self):
+        """
+        Cores, RAM and fd limit of the VPS, for sizing nginx.conf
+
+        Returns:
+            HostResources: Parsed probe output
+        """
+        from nginx_tuning import HostResources
+
+        stdout, _, _ = self.run_remote_command(HostResources.PROBE_COMMAND)
+        return HostResources.from_probe_output(stdout)
+
+    @traced(category='deployer')
     def install_dependencies(self):
-        """Install required packages on VPS"""
+        """
+        Install required packages on VPS
+
+        Returns:
+            bool: True if every command succeeded (stops at the first failure)
+        """
         print("Installing dependencies...")
 
         commands = [
@@ -50,12 +119,14 @@ class Deployer:
         ]
 
         for cmd in commands:
-            stdout, stderr, code = self.run_remote_command(cmd)
-            if code == 0:
-                print(f"  ✓ {cmd.split()[-1]}")
-            else:
-                print(f"  ✗ {cmd}: {stderr}")
+            result = self.stream_remote_command(cmd, check=False)
+            if not result.ok:
+                print(f"  ✗ {result.error_report()}")
+                return False
+            print(f"  ✓ {cmd.split()[-1]}")
+        return True
 
+    @traced(category='deployer')
     def obtain_ssl_certificate(self, domain, email):
         """
         Obtain SSL certificate using certbot
@@ -96,39 +167,103 @@ class Deployer:
             print(f"  ✗ SSL certificate failed: {stderr}")
             return False
 
+    @traced(category='deployer')
     def pull_docker_images(self):
-        """Pull Docker images from registries"""
+        """
+        Pull Docker images from registries
+
+        Returns:
+            bool: True if every image was pulled
+        """
         print("Pulling Docker images...")
 
-        images = [
-            "ghcr.io/xtls/xray-core:latest",
-            "ghcr.io/shadowsocks/ssserver-rust:latest",
-            "nginx:alpine"
-        ]
+        ok = True
+        for image in DOCKER_IMAGES:
+            result = self.stream_remote_command(f"docker pull {image}", check=False)
+            if result.ok:
+                print(f"  ✓ {image} ({result.duration:.1f}s)")
+            else:
+                print(f"  ✗ {image}: {result.error_report()}")
+                ok = False
+        return ok
+
+    @traced(category='deployer')
+    def transfer_docker_images(self, images=None, archive=None, full=False):
+        """
+        Ship images from this machine instead of letting the VPS pull them
+
+        Only layers the VPS doesn't already have go over SSH, gzipped.
 
-        for image in images:
-            stdout, stderr, code = self.run_remote_command(f"docker pull {image}")
-            if code == 0:
-                print(f"  ✓ {image}")
+        Args:
+            images: Images to `docker save` locally (default: DOCKER_IMAGES)
+            archive: Existing `docker save` archive to send instead
+            full: Send every layer (VPS uses the containerd image store)
+
+        Returns:
+            dict: Transfer stats (see image_transfer.transfer)
+        """
+        import tempfile
+        from image_transfer import DockerHost, ImageArchive, transfer, print_transfer
+
+        print("Transferring Docker images...")
+        with tempfile.TemporaryDirectory() as tmp:
+            if archive:
+                source = ImageArchive(archive)
             else:
-                print(f"  ✗ {image}: {stderr}")
+                source = ImageArchive.export(images or DOCKER_IMAGES, f"{tmp}/images.tar")
+            stats = transfer(source, DockerHost(self.ssh_alias), full=full)
+        print_transfer(stats)
+        return stats
+
+    def _blue_green(self):
+        """(DockerBackend, active color) once a blue/green swap has happened, else (backend, None)"""
+        from blue_green import COLORS, DockerBackend
+
+        backend = DockerBackend(self.run_remote_command, self.remote_base_dir)
+        color = backend.assigned()
+        return backend, color if color in COLORS else None
+
+    @traced(category='deployer')
+    def start_containers(self, recreate_xray=False):
+        """
+        Start Docker containers using docker-compose
 
-    def start_containers(self):
-        """Start Docker containers using docker-compose"""
+        After a blue/green swap, compose's own `xray` would take port 443
+        back while the redirect still points at the swapped-in container, so
+        compose starts every other service and xray runs as the active color.
+
+        Args:
+            recreate_xray: Re-create the active color from the current
+                configs/xray-config.json even if it is running
+        """
         print("Starting containers...")
+        backend, color = self._blue_green()
 
         # Navigate to VPN directory and start
         cmd = f"cd {self.remote_base_dir} && docker compose up -d"
-        stdout, stderr, code = self.run_remote_command(cmd)
+        if color:
+            cmd += " $(docker compose config --services | grep -vx xray)"
+        result = self.stream_remote_command(cmd, check=False)
 
-        if code == 0:
-            print("  ✓ Containers started")
-            time.sleep(3)  # Wait for containers to start
-            return True
-        else:
-            print(f"  ✗ Failed to start containers: {stderr}")
+        if not result.ok:
+            print(f"  ✗ Failed to start containers: {result.error_report()}")
             return False
 
+        if color:
+            running = f"xray-{color}" in self.get_container_status().split()
+            try:
+                if recreate_xray or not running:
+                    backend.start(color)
+            except RuntimeError as e:
+                print(f"  ✗ {e}")
+                return False
+            print(f"  ✓ xray runs as xray-{color} (blue/green)")
+
+        print("  ✓ Containers started")
+        time.sleep(3)  # Wait for containers to start
+        return True
+
+    @traced(category='deployer')
     def stop_containers(self):
         """Stop all running containers"""
         print("Stopping containers...")
@@ -141,25 +276,80 @@ class Deployer:
         else:
             print(f"  ✗ Failed to stop containers: {stderr}")
 
+    @traced(category='deployer')
     def restart_containers(self):
-        """Restart all containers"""
+        """Restart all containers (the active blue/green xray is re-created from the current config)"""
         print("Restarting containers...")
         self.stop_containers()
         time.sleep(2)
-        return self.start_containers()
+        return self.start_containers(recreate_xray=True)
+
+    @traced(category='deployer')
+    def blue_green_swap(self, drain_timeout=60, ready_timeout=30, probe_host=None, server_name=None):
+        """
+        Replace xray with a container running the uploaded config, without a restart gap
+
+        Unlike restart_containers, port 443 keeps answering: the new color
+        starts next to the old one, new connections switch once it listens,
+        and the old one is stopped after its tunnels finish (or drain_timeout).
+
+        Args:
+            drain_timeout: Seconds existing tunnels get on the old container
+            ready_timeout: Seconds the new container has to start listening
+            probe_host: Probe this host's port 443 during the swap and report the gap
+            server_name: SNI for the probe (a Reality serverName)
+
+        Returns:
+            dict: Swap result, with 'gap' when probed
+        """
+        from blue_green import BlueGreenSwap, DockerBackend, GapProbe, print_swap
+
+        print("Swapping xray (blue/green)...")
+        probe = GapProbe(probe_host, 443, server_name=server_name).start() if probe_host else None
+        swap = BlueGreenSwap(DockerBackend(self.run_remote_command, self.remote_base_dir),
+                             ready_timeout=ready_timeout, drain_timeout=drain_timeout)
+        try:
+            result = swap.run()
+        finally:
+            gap = probe.stop() if probe else None
+        result['gap'] = gap
+        print_swap(result, gap)
+        return result
+
+    @traced(category='deployer')
+    def apply_shaping(self, plan):
+        """
+        Install the tc/iptables rules of a ShapingPlan (idempotent)
+
+        Args:
+            plan: ShapingPlan matching the one the Xray config was rendered with
+
+        Returns:
+            bool: True if every command succeeded
+        """
+        print(f"Applying bandwidth shaping on {plan.interface} ({len(plan.tiers)} tiers)...")
+        failed = plan.apply(lambda command: self.run_remote_command(command, check=False))
+        for command, error in failed:
+            print(f"  ✗ {command}: {error}")
+        if not failed:
+            for tier in plan.tiers:
+                print(f"  ✓ Level {tier.level}: {tier.rate} (ceil {tier.ceil}, burst {tier.burst})")
+        return not failed
 
     def get_container_status(self):
         """Get status of all containers"""
         stdout, stderr, code = self.run_remote_command("docker ps --format '{{.Names}}\t{{.Status}}'")
         return stdout
 
-    def deploy(self, domain, email):
+    @traced(category='deployer')
+    def deploy(self, domain, email, offline_images=False):
         """
         Full deployment process
 
         Args:
             domain: Domain name
             email: Email for SSL certificate
+            offline_images: Send images from this machine instead of pulling on the VPS
 
         Returns:
             bool: True if deployment successful
@@ -170,14 +360,18 @@ class Deployer:
 
         try:
             # Step 1: Install dependencies
-            self.install_dependencies()
+            if not self.install_dependencies():
+                return False
 
             # Step 2: Obtain SSL certificate
             if not self.obtain_ssl_certificate(domain, email):
                 return False
 
-            # Step 3: Pull Docker images
-            self.pull_docker_images()
+            # Step 3: Pull (or transfer) Docker images
+            if offline_images:
+                self.transfer_docker_images()
+            elif not self.pull_docker_images():
+                return False
 
             # Step 4: Start containers
             if not self.start_containers():
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Dest Selector - Benchmark candidate Reality dest sites and pick the best one
+"""
+
+import ssl
+import time
+import asyncio
+import statistics
+
+from env_config import update_env_file
+
+
+DEFAULT_CANDIDATES = [
+    'www.microsoft.com',
+    'www.apple.com',
+    'www.amazon.com',
+    'www.cloudflare.com',
+    'dl.google.com',
+    'www.lovelive-anime.jp',
+    'addons.mozilla.org',
+    'www.samsung.com',
+]
+
+
+class DestProbe:
+    def __init__(self, server_name, port=443):
+        """
+        Probe results for one candidate dest
+
+        Args:
+            server_name: SNI / hostname of the candidate
+            port: TLS port
+        """
+        self.server_name = server_name
+        self.port = port
+        self.reachable = False
+        self.tls13 = False
+        self.x25519 = False
+        self.h2 = False
+        self.cert_valid = False
+        self.connect_ms = []
+        self.handshake_ms = []
+        self.error = None
+
+    @property
+    def dest(self):
+        return f"{self.server_name}:{self.port}"
+
+    @property
+    def eligible(self):
+        """Reality needs TLS 1.3 with X25519 and H2 on the dest"""
+        return self.tls13 and self.x25519 and self.h2 and self.cert_valid
+
+    @property
+    def handshake_median(self):
+        return statistics.median(self.handshake_ms) if self.handshake_ms else float('inf')
+
+    def as_dict(self):
+        return {
+            'dest': self.dest,
+            'eligible': self.eligible,
+            'tls13': self.tls13,
+            'x25519': self.x25519,
+            'h2': self.h2,
+            'cert_valid': self.cert_valid,
+            'connect_ms': round(statistics.median(self.connect_ms), 2) if self.connect_ms else None,
+            'handshake_ms': round(self.handshake_median, 2) if self.handshake_ms else None,
+            'error': self.error,
+        }
+
+
+class DestSelector:
+    def __init__(self, candidates=None, samples=3, timeout=5.0, verify_tls=True, address_overrides=None):
+        """
+        Initialize the selector
+
+        Args:
+            candidates: List of "host" or "host:port" strings
+            samples: Handshakes per candidate used for the RTT estimate
+            timeout: Per-connection timeout in seconds
+            verify_tls: Require a certificate valid for the SNI
+            address_overrides: {server_name: (ip, port)} to connect somewhere
+                other than DNS says (used for local stand-ins)
+        """
+        self.candidates = [self._parse(c) for c in (candidates or DEFAULT_CANDIDATES)]
+        self.samples = samples
+        self.timeout = timeout
+        self.verify_tls = verify_tls
+        self.address_overrides = address_overrides or {}
+
+    @staticmethod
+    def _parse(candidate):
+        host, _, port = candidate.partition(':')
+        return host, int(port) if port else 443
+
+    def _context(self, tls13_only=False, x25519_only=False):
+        context = ssl.create_default_context()
+        if not self.verify_tls:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        if tls13_only:
+            context.minimum_version = ssl.TLSVersion.TLSv1_3
+        if x25519_only:
+            # Restricts the offered key share groups to X25519 only
+            context.set_ecdh_curve('X25519')
+        context.set_alpn_protocols(['h2', 'http/1.1'])
+        return context
+
+    async def _handshake(self, probe, context):
+        """One TCP connect + TLS handshake; returns (connect_s, handshake_s, alpn)"""
+        host, port = self.address_overrides.get(probe.server_name, (probe.server_name, probe.port))
+
+        start = time.perf_counter()
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+        connected = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                writer.start_tls(context, server_hostname=probe.server_name),
+                self.timeout
+            )
+            done = time.perf_counter()
+            alpn = writer.get_extra_info('ssl_object').selected_alpn_protocol()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ssl.SSLError, ConnectionError):
+                pass
+        return connected - start, done - start, alpn
+
+    async def probe(self, server_name, port=443):
+        """
+        Probe one candidate for capabilities and handshake RTT
+
+        Returns:
+            DestProbe: Capability flags and timings
+        """
+        probe = DestProbe(server_name, port)
+        strict = self._context(tls13_only=True, x25519_only=True)
+
+        try:
+            connect_s, handshake_s, alpn = await self._handshake(probe, strict)
+            probe.reachable = probe.tls13 = probe.x25519 = probe.cert_valid = True
+            probe.h2 = alpn == 'h2'
+            probe.connect_ms.append(connect_s * 1000)
+            probe.handshake_ms.append(handshake_s * 1000)
+        except ssl.SSLCertVerificationError as e:
+            probe.reachable = True
+            probe.error = f"certificate: {e.verify_message}"
+            return probe
+        except (OSError, ssl.SSLError, asyncio.TimeoutError) as e:
+            probe.error = str(e) or type(e).__name__
+            await self._diagnose(probe)
+            return probe
+
+        for _ in range(self.samples - 1):
+            try:
+                connect_s, handshake_s, _ = await self._handshake(probe, strict)
+                probe.connect_ms.append(connect_s * 1000)
+                probe.handshake_ms.append(handshake_s * 1000)
+            except (OSError, ssl.SSLError, asyncio.TimeoutError):
+                break
+        return probe
+
+    async def _diagnose(self, probe):
+        """Work out which capability a failed strict handshake is missing"""
+        for tls13_only, flag in ((True, 'tls13'), (False, 'reachable')):
+            try:
+                _, _, alpn = await self._handshake(probe, self._context(tls13_only=tls13_only))
+            except (OSError, ssl.SSLError, asyncio.TimeoutError):
+                continue
+            probe.reachable = True
+            probe.cert_valid = True
+            probe.h2 = alpn == 'h2'
+            probe.tls13 = flag == 'tls13'
+            return
+
+    async def probe_all(self):
+        """Probe every candidate concurrently"""
+        return await asyncio.gather(*(self.probe(host, port) for host, port in self.candidates))
+
+    @staticmethod
+    def rank(probes):
+        """Eligible candidates first, each group ordered by median handshake time"""
+        return sorted(probes, key=lambda p: (not p.eligible, p.handshake_median))
+
+    def select(self):
+        """
+        Probe and rank all candidates
+
+        Returns:
+            list: DestProbe objects, best first
+        """
+        return self.rank(asyncio.run(self.probe_all()))
+
+    @staticmethod
+    def print_ranking(ranking):
+        """Print the ranking table"""
+        print(f"\n  {'dest':<32} {'tls1.3':>6} {'x25519':>6} {'h2':>4} {'cert':>4} {'tcp ms':>8} {'tls ms':>8}")
+        for p in ranking:
+            d = p.as_dict()
+            flags = ['✓' if d[k] else '✗' for k in ('tls13', 'x25519', 'h2', 'cert_valid')]
+            connect = f"{d['connect_ms']:.1f}" if d['connect_ms'] is not None else '-'
+            handshake = f"{d['handshake_ms']:.1f}" if d['handshake_ms'] is not None else '-'
+            mark = '→' if p is ranking[0] and p.eligible else ' '
+            print(f"{mark} {d['dest']:<32} {flags[0]:>6} {flags[1]:>6} {flags[2]:>4} {flags[3]:>4} {connect:>8} {handshake:>8}")
+            if d['error'] and not p.eligible:
+                print(f"    {d['error']}")
+
+
+def apply_best(ranking, env_path):
+    """
+    Write the best eligible dest into config.env
+
+    The values are read back by deploy_local.py and passed to
+    ConfigGenerator.render_xray_config as reality_dest/reality_server_names.
+
+    Returns:
+        DestProbe or None: The applied candidate
+    """
+    if not ranking or not ranking[0].eligible:
+        return None
+    best = ranking[0]
+    update_env_file(env_path, {
+        'REALITY_DEST': best.dest,
+        'REALITY_SERVER_NAMES': best.server_name,
+    })
+    return best
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Rank candidate Reality dest sites')
+    parser.add_argument('candidates', nargs='*', help='host or host:port (default: built-in list)')
+    parser.add_argument('--samples', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--write', metavar='ENV_FILE', help='Write the best dest into this config.env')
+    args = parser.parse_args()
+
+    selector = DestSelector(args.candidates or None, samples=args.samples, timeout=args.timeout)
+    ranking = selector.select()
+    DestSelector.print_ranking(ranking)
+
+    if args.write:
+        best = apply_best(ranking, args.write)
+        if best:
+            print(f"\n  ✓ REALITY_DEST={best.dest} written to {args.write}")
+        else:
+            print("\n  ✗ No eligible dest found; config unchanged")
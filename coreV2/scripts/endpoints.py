@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Endpoints - Probe VPN server endpoints concurrently and order them by handshake latency
+"""
+
+import ssl
+import time
+import asyncio
+import statistics
+
+
+class Endpoint:
+    def __init__(self, host, port=443, label=None):
+        """
+        One server node users can connect to
+
+        Args:
+            host: Domain or IP
+            port: Reality port
+            label: Short node name used in profile names (defaults to the host)
+        """
+        self.host = host
+        self.port = port
+        self.label = label or host
+        self.connect_ms = []
+        self.handshake_ms = []
+        self.error = None
+
+    @property
+    def reachable(self):
+        return bool(self.handshake_ms)
+
+    @property
+    def latency_ms(self):
+        """Median TCP + TLS handshake time (inf if never reached)"""
+        return statistics.median(self.handshake_ms) if self.handshake_ms else float('inf')
+
+    def as_dict(self):
+        return {
+            'label': self.label,
+            'endpoint': f"{self.host}:{self.port}",
+            'reachable': self.reachable,
+            'connect_ms': round(statistics.median(self.connect_ms), 2) if self.connect_ms else None,
+            'handshake_ms': round(self.latency_ms, 2) if self.reachable else None,
+            'error': self.error,
+        }
+
+
+def parse_endpoints(spec):
+    """
+    Parse "label=host:port,host2,..." (label and port optional)
+
+    Returns:
+        list: Endpoint objects in the given order
+    """
+    endpoints = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        label, _, address = item.rpartition('=')
+        host, _, port = address.partition(':')
+        endpoints.append(Endpoint(host, int(port) if port else 443, label or None))
+    return endpoints
+
+
+class EndpointProber:
+    def __init__(self, endpoints, sni, samples=3, timeout=3.0, concurrency=32):
+        """
+        Initialize the prober
+
+        Args:
+            endpoints: List of Endpoint objects
+            sni: Reality serverName to handshake with (Reality answers unknown
+                 clients with the dest's handshake, so this measures the real path)
+            samples: Handshakes per endpoint
+            timeout: Per-connection timeout in seconds
+            concurrency: Maximum handshakes in flight
+        """
+        self.endpoints = endpoints
+        self.sni = sni
+        self.samples = samples
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+    @staticmethod
+    def _context():
+        # Only timing matters here; the certificate is the dest's, not ours
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        context.minimum_version = ssl.TLSVersion.TLSv1_3
+        return context
+
+    async def _handshake(self, endpoint, context):
+        """One TCP connect + TLS handshake; returns (connect_s, handshake_s)"""
+        start = time.perf_counter()
+        _, writer = await asyncio.wait_for(asyncio.open_connection(endpoint.host, endpoint.port), self.timeout)
+        connected = time.perf_counter()
+        try:
+            await asyncio.wait_for(writer.start_tls(context, server_hostname=self.sni), self.timeout)
+            done = time.perf_counter()
+        finally:
+            # No graceful TLS shutdown: waiting for close_notify only slows the probe down
+            writer.transport.abort()
+        return connected - start, done - start
+
+    async def probe(self, endpoint, context, limit):
+        """Measure one endpoint; stops at the first failed sample"""
+        for _ in range(self.samples):
+            async with limit:
+                try:
+                    connect_s, handshake_s = await self._handshake(endpoint, context)
+                except (OSError, ssl.SSLError, asyncio.TimeoutError) as e:
+                    endpoint.error = str(e) or type(e).__name__
+                    break
+            endpoint.connect_ms.append(connect_s * 1000)
+            endpoint.handshake_ms.append(handshake_s * 1000)
+        return endpoint
+
+    async def probe_all(self):
+        context = self._context()
+        limit = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self.probe(e, context, limit) for e in self.endpoints))
+
+    @staticmethod
+    def rank(endpoints):
+        """Reachable endpoints by latency, then unreachable ones in configured order"""
+        return sorted(endpoints, key=lambda e: e.latency_ms)
+
+    def run(self):
+        """
+        Probe every endpoint and rank them
+
+        Returns:
+            list: Endpoint objects, fastest first
+        """
+        return self.rank(asyncio.run(self.probe_all()))
+
+    @staticmethod
+    def print_ranking(ranking):
+        print(f"\n  {'node':<16} {'endpoint':<32} {'tcp ms':>8} {'tls ms':>8}")
+        for endpoint in ranking:
+            info = endpoint.as_dict()
+            if endpoint.reachable:
+                print(f"  ✓ {info['label']:<14} {info['endpoint']:<32} "
+                      f"{info['connect_ms']:>8.1f} {info['handshake_ms']:>8.1f}")
+            else:
+                print(f"  ✗ {info['label']:<14} {info['endpoint']:<32} {endpoint.error}")
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Rank VPN endpoints by handshake latency')
+    parser.add_argument('endpoints', help='label=host:port,... (label and port optional)')
+    parser.add_argument('--sni', required=True, help='Reality serverName')
+    parser.add_argument('--samples', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=3.0)
+    args = parser.parse_args()
+
+    ranking = EndpointProber(parse_endpoints(args.endpoints), args.sni, args.samples, args.timeout).run()
+    EndpointProber.print_ranking(ranking)
+    sys.exit(0 if any(e.reachable for e in ranking) else 1)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Env Config - Read and update KEY=value config files (config.env)
+"""
+
+from pathlib import Path
+
+
+def load_env_file(env_path):
+    """
+    Load environment variables from a config file
+
+    Args:
+        env_path: Path to config.env
+
+    Returns:
+        dict: KEY -> value (comments and blank lines skipped)
+    """
+    env_path = Path(env_path)
+    if not env_path.exists():
+        raise FileNotFoundError(f"Config file not found: {env_path}")
+
+    env_vars = {}
+    with open(env_path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                if '=' in line:
+                    key, value = line.split('=', 1)
+                    env_vars[key.strip()] = value.strip()
+
+    return env_vars
+
+
+def update_env_file(env_path, updates):
+    """
+    Set KEY=value pairs in an env file, keeping comments and ordering
+
+    Args:
+        env_path: Path to config.env
+        updates: Dict of keys to set (appended if missing)
+
+    Returns:
+        Path: The updated file
+    """
+    env_path = Path(env_path)
+    lines = env_path.read_text().splitlines() if env_path.exists() else []
+    remaining = dict(updates)
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped and not stripped.startswith('#') and '=' in stripped:
+            key = stripped.split('=', 1)[0].strip()
+            if key in remaining:
+                lines[i] = f"{key}={remaining.pop(key)}"
+
+    lines.extend(f"{key}={value}" for key, value in remaining.items())
+    env_path.write_text('\n'.join(lines) + '\n')
+    return env_path
+
+
+def config_flag(config, key, default=False):
+    """Interpret a config value like 'true'/'1'/'yes' as a bool"""
+    value = config.get(key)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Geo Data - Trim geoip.dat/geosite.dat down to the codes the routing rules use
+"""
+
+import os
+import json
+import ipaddress
+from pathlib import Path
+
+
+GEO_FILES = {'geoip': 'geoip.dat', 'geosite': 'geosite.dat'}
+
+# Reserved/private ranges as in v2fly's geoip:private, so the default config needs no source file
+PRIVATE_CIDRS = [
+    '0.0.0.0/8', '10.0.0.0/8', '100.64.0.0/10', '127.0.0.0/8', '169.254.0.0/16', '172.16.0.0/12',
+    '192.0.0.0/24', '192.0.2.0/24', '192.88.99.0/24', '192.168.0.0/16', '198.18.0.0/15',
+    '198.51.100.0/24', '203.0.113.0/24', '224.0.0.0/4', '240.0.0.0/4', '255.255.255.255/32',
+    '::/128', '::1/128', 'fc00::/7', 'fe80::/10', 'ff00::/8',
+]
+
+
+class GeoDataError(ValueError):
+    pass
+
+
+# -- protobuf wire format ----------------------------------------------------------
+# GeoIPList/GeoSiteList are `repeated Entry entry = 1`, and every entry starts
+# with `string country_code = 1`, so entries can be selected and copied as raw
+# bytes without decoding (or depending on) the full schema.
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _field(number, payload):
+    """Length-delimited field"""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def iter_entries(data):
+    """
+    Yield (code, raw field bytes) for every top-level entry of a .dat file
+
+    Raises:
+        GeoDataError: Not a GeoIPList/GeoSiteList
+    """
+    pos, end = 0, len(data)
+    while pos < end:
+        start = pos
+        key, pos = _read_varint(data, pos)
+        if key != (1 << 3 | 2):
+            raise GeoDataError(f"unexpected field {key >> 3} (wire type {key & 7}) at byte {start}")
+        length, pos = _read_varint(data, pos)
+        body = memoryview(data)[pos:pos + length]
+        pos += length
+
+        key, inner = _read_varint(body, 0)
+        if key != (1 << 3 | 2):
+            raise GeoDataError(f"entry at byte {start} has no country_code")
+        code_length, inner = _read_varint(body, inner)
+        yield bytes(body[inner:inner + code_length]).decode().lower(), data[start:pos]
+
+
+def geoip_entry(code, cidrs):
+    """Encode one GeoIP entry (`repeated CIDR cidr = 2`, CIDR = {bytes ip = 1; uint32 prefix = 2})"""
+    payload = _field(1, code.upper().encode())
+    for cidr in cidrs:
+        network = ipaddress.ip_network(cidr)
+        cidr_payload = _field(1, network.network_address.packed) + b'\x10' + _varint(network.prefixlen)
+        payload += _field(2, cidr_payload)
+    return _field(1, payload)
+
+
+# -- rules -----------------------------------------------------------------------
+
+def referenced_codes(config):
+    """
+    geoip/geosite codes an Xray config refers to
+
+    Looks at routing rules (ip, source, domain) and DNS servers (domains,
+    expectIPs). Negation ("geoip:!cn") and geosite attributes
+    ("geosite:google@cn") are reduced to the file entry they read.
+
+    Returns:
+        dict: 'geoip'/'geosite' -> set of lower-case codes
+    """
+    values = []
+    for rule in (config.get('routing') or {}).get('rules') or []:
+        for key in ('ip', 'source', 'domain', 'domains'):
+            values.extend(rule.get(key) or [])
+    for server in (config.get('dns') or {}).get('servers') or []:
+        if isinstance(server, dict):
+            values.extend(server.get('domains') or [])
+            values.extend(server.get('expectIPs') or [])
+
+    codes = {kind: set() for kind in GEO_FILES}
+    for value in values:
+        kind, _, code = str(value).partition(':')
+        if kind in codes and code:
+            codes[kind].add(code.lstrip('!').split('@')[0].lower())
+    return codes
+
+
+# -- build -----------------------------------------------------------------------
+
+class GeoDataBuilder:
+    def __init__(self, output_dir, source_dir=None):
+        """
+        Write trimmed .dat files next to the generated config
+
+        Args:
+            output_dir: Directory mounted as Xray's asset location
+            source_dir: Directory with full geoip.dat/geosite.dat (e.g. from
+                v2fly/Loyalsoldier releases); geoip:private is built in, so
+                the default config needs none
+        """
+        self.output_dir = Path(output_dir)
+        self.source_dir = Path(source_dir) if source_dir else None
+
+    def _source(self, kind):
+        if self.source_dir is None:
+            return None
+        path = self.source_dir / GEO_FILES[kind]
+        return path if path.exists() else None
+
+    def trim(self, kind, codes):
+        """
+        Raw bytes of a .dat file holding only `codes`
+
+        Raises:
+            GeoDataError: A code is in neither the source file nor the built-ins
+        """
+        entries = {}
+        source = self._source(kind)
+        if source:
+            data = source.read_bytes()
+            for code, raw in iter_entries(data):
+                if code in codes:
+                    entries[code] = raw
+        if kind == 'geoip' and 'private' in codes and 'private' not in entries:
+            entries['private'] = geoip_entry('private', PRIVATE_CIDRS)
+
+        missing = codes - set(entries)
+        if missing:
+            if source:
+                where = f"not in {source}"
+            elif self.source_dir:
+                where = f"no {GEO_FILES[kind]} in {self.source_dir}"
+            else:
+                where = 'no GEO_SOURCE_DIR set'
+            raise GeoDataError(f"{kind} code(s) {', '.join(sorted(missing))} missing: {where}")
+        return b''.join(entries[code] for code in sorted(entries))
+
+    def build(self, config):
+        """
+        Write trimmed files for every geo kind the config references
+
+        Files are only rewritten when their content changes, and files for
+        kinds the config no longer uses are removed.
+
+        Args:
+            config: Parsed Xray config, or a path to one
+
+        Returns:
+            dict: kind -> {'codes', 'bytes', 'written'}
+        """
+        if not isinstance(config, dict):
+            config = json.loads(Path(config).read_text())
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        result = {}
+        for kind, codes in referenced_codes(config).items():
+            output = self.output_dir / GEO_FILES[kind]
+            if not codes:
+                if output.exists():
+                    output.unlink()
+                continue
+            data = self.trim(kind, codes)
+            written = not output.exists() or output.read_bytes() != data
+            if written:
+                tmp = output.with_suffix('.tmp')
+                tmp.write_bytes(data)
+                os.replace(tmp, output)
+            result[kind] = {'codes': sorted(codes), 'bytes': len(data), 'written': written}
+        return result
+
+
+def benchmark(config_path, full_dir, trimmed_dir, xray='xray', runs=3):
+    """
+    Peak RSS and startup time of `xray run -test` with full vs trimmed data
+
+    -test builds the router (which loads the geo files) and exits, so it
+    isolates what the .dat files cost at startup.
+
+    Returns:
+        dict: variant -> {'max_rss_mb', 'seconds', 'dat_bytes'}
+    """
+    import time
+    import shutil
+    import subprocess
+
+    if not shutil.which(xray):
+        raise FileNotFoundError(f"'{xray}' not found; run the benchmark where xray is installed")
+
+    results = {}
+    for name, directory in (('full', full_dir), ('trimmed', trimmed_dir)):
+        rss, seconds = [], []
+        for _ in range(runs):
+            env = dict(os.environ, XRAY_LOCATION_ASSET=str(directory))
+            started = time.perf_counter()
+            process = subprocess.Popen([xray, 'run', '-test', '-c', str(config_path)], env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            _, status, usage = os.wait4(process.pid, 0)
+            seconds.append(time.perf_counter() - started)
+            if os.waitstatus_to_exitcode(status) != 0:
+                raise RuntimeError(f"xray -test failed with the {name} data in {directory}")
+            rss.append(usage.ru_maxrss / 1024)
+        results[name] = {
+            'max_rss_mb': min(rss),
+            'seconds': min(seconds),
+            'dat_bytes': sum(p.stat().st_size for p in Path(directory).glob('*.dat')),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Trim geoip/geosite data to what an Xray config uses')
+    parser.add_argument('config', help='Generated xray-config.json')
+    parser.add_argument('--source-dir', help='Directory with the full geoip.dat/geosite.dat')
+    parser.add_argument('--output-dir', default='../generated/geo')
+    parser.add_argument('--bench', action='store_true', help='Compare xray RSS/startup with full vs trimmed files')
+    args = parser.parse_args()
+
+    try:
+        built = GeoDataBuilder(args.output_dir, args.source_dir).build(args.config)
+    except GeoDataError as e:
+        print(f"  ✗ {e}")
+        sys.exit(1)
+    for kind, info in built.items():
+        state = 'written' if info['written'] else 'unchanged'
+        print(f"  ✓ {GEO_FILES[kind]}: {', '.join(info['codes'])} ({info['bytes']} B, {state})")
+    if not built:
+        print("  ✓ Config references no geo data")
+
+    if args.bench:
+        if not args.source_dir:
+            parser.error('--bench needs --source-dir')
+        for name, result in benchmark(args.config, args.source_dir, args.output_dir).items():
+            print(f"  {name:<8} {result['max_rss_mb']:>7.1f} MB peak RSS  {result['seconds'] * 1000:>7.0f} ms  "
+                  f"{result['dat_bytes'] / 1e6:>6.2f} MB of .dat")
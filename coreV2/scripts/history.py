@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+History - Append-only time series of check results and latencies, downsampled as it ages
+"""
+
+import os
+import re
+import sys
+import math
+import time
+import struct
+import bisect
+from array import array
+from pathlib import Path
+
+
+# Raw sample: unix seconds, value (latency ms, or 1/0 for up/down)
+RAW = struct.Struct('<If')
+# Rollup of a bucket: start, count, min, max, mean, p50, p95, p99
+ROLLUP = struct.Struct('<II6f')
+QUANTILES = (0.5, 0.95, 0.99)
+
+HOUR = 3600
+DAY = 86400
+# Compaction runs once the oldest raw sample is this far past its retention
+COMPACT_SLACK = DAY
+
+_NAME_RE = re.compile(r'[A-Za-z0-9_.-]+')
+
+
+def quantile(sorted_values, q):
+    """
+    Nearest-rank quantile of an already sorted list (NaN when empty)
+
+    The smallest value with at least q of the samples at or below it; shared
+    by the monitor and the load tester so their p50/p95/p99 agree with history.
+    """
+    if not sorted_values:
+        return math.nan
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def mixture_quantile(rollups, q):
+    """
+    Quantile of the samples behind several rollups
+
+    Each rollup's distribution is taken as linear between its min, p50,
+    p95, p99 and max; the quantile is read off the count-weighted sum of
+    those CDFs by one sweep over their sorted knots.
+    """
+    events = []
+    total = 0
+    for r in rollups:
+        weight = r[1]
+        total += weight
+        knots = ((r[2], 0.0), (r[5], 0.5), (r[6], 0.95), (r[7], 0.99), (r[3], 1.0))
+        for (x0, c0), (x1, c1) in zip(knots, knots[1:]):
+            mass = weight * (c1 - c0)
+            if mass <= 0:
+                continue
+            if x1 > x0:
+                events.append((x0, mass / (x1 - x0), 0.0))
+                events.append((x1, -mass / (x1 - x0), 0.0))
+            else:
+                events.append((x0, 0.0, mass))
+    events.sort()
+
+    target = q * total
+    cumulative = slope = 0.0
+    previous = events[0][0]
+    for x, slope_change, jump in events:
+        if slope > 0:
+            reached = cumulative + slope * (x - previous)
+            if reached >= target:
+                return previous + (target - cumulative) / slope
+            cumulative = reached
+        previous = x
+        cumulative += jump
+        if cumulative >= target:
+            return x
+        slope += slope_change
+    return previous
+
+
+def rollup(start, values):
+    """ROLLUP tuple for one bucket of raw values"""
+    ordered = sorted(values)
+    return (start, len(ordered), ordered[0], ordered[-1], sum(ordered) / len(ordered),
+            *(quantile(ordered, q) for q in QUANTILES))
+
+
+def merge_rollups(start, rollups):
+    """
+    ROLLUP tuple for a bucket made of smaller rollups
+
+    Count, min, max and mean stay exact; quantiles are estimated with
+    mixture_quantile.
+    """
+    count = sum(r[1] for r in rollups)
+    mean = sum(r[1] * r[4] for r in rollups) / count
+    return (start, count, min(r[2] for r in rollups), max(r[3] for r in rollups), mean,
+            *(mixture_quantile(rollups, q) for q in QUANTILES))
+
+
+def _raw_columns(data):
+    """(timestamps, values) arrays of a raw file's bytes"""
+    words, floats = array('I'), array('f')
+    words.frombytes(data)
+    floats.frombytes(data)
+    if sys.byteorder == 'big':
+        words.byteswap()
+        floats.byteswap()
+    return words[0::2], floats[1::2]
+
+
+def _rollups(data):
+    return list(ROLLUP.iter_unpack(data))
+
+
+def _rewrite(path, data):
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class HistoryStore:
+    def __init__(self, directory, raw_days=14, hourly_days=180, daily_days=1825):
+        """
+        Per-metric files of fixed-width records
+
+        Every metric has three files: <metric>.raw (8-byte samples),
+        <metric>.1h and <metric>.1d (32-byte rollups with count, min, max,
+        mean, p50, p95, p99). Samples are only appended; once the oldest raw
+        sample is past raw_days, whole expired hours are rolled up into .1h
+        and cut from .raw, and expired hours into days the same way, so a
+        metric sampled every minute never exceeds roughly
+        (raw_days * 1440 * 8 + hourly_days * 24 * 32 + daily_days * 32) bytes.
+
+        Args:
+            directory: Where the files live (created if missing)
+            raw_days: Days of full-resolution samples
+            hourly_days: Days of hourly rollups
+            daily_days: Days of daily rollups
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.retention = {'raw': raw_days * DAY, '1h': hourly_days * DAY, '1d': daily_days * DAY}
+        self._last = {}
+        self._first = {}
+
+    def _path(self, metric, tier):
+        if not _NAME_RE.fullmatch(metric):
+            raise ValueError(f"Invalid metric name '{metric}' (letters, digits, '_', '.', '-')")
+        return self.directory / f"{metric}.{tier}"
+
+    def metrics(self):
+        return sorted(path.stem for path in self.directory.glob('*.raw'))
+
+    def disk_usage(self):
+        return sum(path.stat().st_size for path in self.directory.iterdir() if path.is_file())
+
+    # -- writing -----------------------------------------------------------------
+
+    def _edges(self, metric, path):
+        """(first, last) timestamps of a raw file, cached after the first read"""
+        if metric not in self._last:
+            first = last = None
+            size = path.stat().st_size if path.exists() else 0
+            if size >= RAW.size:
+                with open(path, 'rb') as f:
+                    first = RAW.unpack(f.read(RAW.size))[0]
+                    f.seek(size - size % RAW.size - RAW.size)
+                    last = RAW.unpack(f.read(RAW.size))[0]
+            self._first[metric], self._last[metric] = first, last
+        return self._first[metric], self._last[metric]
+
+    def record(self, metric, value, ts=None):
+        """Append one sample (NaN is skipped; a clock step back is clamped to keep files sorted)"""
+        self.record_many({metric: value}, ts)
+
+    def record_many(self, values, ts=None):
+        """
+        Append one sample per metric, all at the same time
+
+        Args:
+            values: metric -> number (bools become 1/0)
+            ts: Unix seconds (default: now)
+        """
+        ts = int(time.time() if ts is None else ts)
+        for metric, value in values.items():
+            value = float(value)
+            if math.isnan(value):
+                continue
+            path = self._path(metric, 'raw')
+            first, last = self._edges(metric, path)
+            stamp = max(ts, last or 0)
+            with open(path, 'ab') as f:
+                f.write(RAW.pack(stamp, value))
+            self._last[metric] = stamp
+            if first is None:
+                self._first[metric] = stamp
+            elif stamp - first > self.retention['raw'] + COMPACT_SLACK:
+                self.compact(metric, now=stamp)
+
+    # -- downsampling -------------------------------------------------------------
+
+    def compact(self, metric, now=None):
+        """
+        Roll expired raw samples into hours, expired hours into days, drop expired days
+
+        Returns:
+            dict: tier -> records removed from it
+        """
+        now = int(time.time() if now is None else now)
+        removed = {}
+
+        raw_path = self._path(metric, 'raw')
+        data = raw_path.read_bytes() if raw_path.exists() else b''
+        data = data[:len(data) - len(data) % RAW.size]
+        timestamps, values = _raw_columns(data)
+        cutoff = (now - self.retention['raw']) // HOUR * HOUR
+        cut = bisect.bisect_left(timestamps, cutoff)
+        if cut:
+            buckets = {}
+            for ts, value in zip(timestamps[:cut], values[:cut]):
+                buckets.setdefault(ts // HOUR * HOUR, []).append(value)
+            with open(self._path(metric, '1h'), 'ab') as f:
+                for start in sorted(buckets):
+                    f.write(ROLLUP.pack(*rollup(start, buckets[start])))
+            _rewrite(raw_path, data[cut * RAW.size:])
+            removed['raw'] = cut
+        self._first[metric] = timestamps[cut] if cut < len(timestamps) else None
+        if self._first[metric] is None:
+            self._last.pop(metric, None)
+            self._first.pop(metric, None)
+
+        for tier, coarser, size in (('1h', '1d', DAY), ('1d', None, None)):
+            path = self._path(metric, tier)
+            if not path.exists():
+                continue
+            rollups = _rollups(path.read_bytes())
+            cutoff = (now - self.retention[tier]) // DAY * DAY
+            cut = bisect.bisect_left([r[0] for r in rollups], cutoff)
+            if not cut:
+                continue
+            if coarser:
+                buckets = {}
+                for r in rollups[:cut]:
+                    buckets.setdefault(r[0] // size * size, []).append(r)
+                with open(self._path(metric, coarser), 'ab') as f:
+                    for start in sorted(buckets):
+                        f.write(ROLLUP.pack(*merge_rollups(start, buckets[start])))
+            _rewrite(path, b''.join(ROLLUP.pack(*r) for r in rollups[cut:]))
+            removed[tier] = cut
+        return removed
+
+    # -- reading -------------------------------------------------------------------
+
+    def _load(self, metric, start, end):
+        """Raw (timestamps, values) in [start, end) plus the older rollups overlapping it"""
+        path = self._path(metric, 'raw')
+        data = path.read_bytes() if path.exists() else b''
+        timestamps, values = _raw_columns(data[:len(data) - len(data) % RAW.size])
+        lo, hi = bisect.bisect_left(timestamps, start), bisect.bisect_left(timestamps, end)
+        raw_first = timestamps[0] if timestamps else end
+
+        rollups = []
+        limit = raw_first
+        for tier in ('1h', '1d'):
+            path = self._path(metric, tier)
+            tier_rollups = _rollups(path.read_bytes()) if path.exists() else []
+            # Only the part older than the finer tier, so no sample is counted twice
+            rollups += [(tier, r) for r in tier_rollups if start <= r[0] < min(end, limit)]
+            if tier_rollups:
+                limit = min(limit, tier_rollups[0][0])
+        return timestamps[lo:hi], values[lo:hi], sorted(rollups, key=lambda item: item[1][0])
+
+    def query(self, metric, start, end=None):
+        """
+        Points in [start, end): raw samples, and rollup means where only rollups remain
+
+        Returns:
+            list: (timestamp, value, resolution) tuples, oldest first
+        """
+        end = int(time.time()) + 1 if end is None else end
+        timestamps, values, rollups = self._load(metric, start, end)
+        points = [(r[0], r[4], tier) for tier, r in rollups]
+        points += [(ts, value, 'raw') for ts, value in zip(timestamps, values)]
+        return points
+
+    def summary(self, metric, start, end=None):
+        """
+        count/min/max/mean/p50/p95/p99 over [start, end)
+
+        Exact while the range is within raw retention. Older parts only
+        have rollups; then the raw samples are bucketed by hour as well and
+        the quantiles estimated over all buckets ('approximate' is True).
+        Rollup buckets count when they start inside the range.
+
+        Returns:
+            dict: Summary, or None when the range holds no samples
+        """
+        end = int(time.time()) + 1 if end is None else end
+        timestamps, values, rollups = self._load(metric, start, end)
+        if not values and not rollups:
+            return None
+
+        if not rollups:
+            ordered = sorted(values)
+            result = {'count': len(ordered), 'min': ordered[0], 'max': ordered[-1],
+                      'mean': sum(ordered) / len(ordered), 'approximate': False}
+            result.update({f"p{int(q * 100)}": quantile(ordered, q) for q in QUANTILES})
+            return result
+
+        buckets = {}
+        for ts, value in zip(timestamps, values):
+            buckets.setdefault(ts // HOUR * HOUR, []).append(value)
+        parts = [r for _, r in rollups] + [rollup(hour, bucket) for hour, bucket in buckets.items()]
+        merged = merge_rollups(start, parts)
+        result = {'count': merged[1], 'min': merged[2], 'max': merged[3], 'mean': merged[4], 'approximate': True}
+        result.update({f"p{int(q * 100)}": merged[5 + i] for i, q in enumerate(QUANTILES)})
+        return result
+
+
+def run_checks(checks, history=None, prefix='verify'):
+    """
+    Run named checks in order, timing each
+
+    Args:
+        checks: name -> callable returning pass/fail
+        history: HistoryStore to append <prefix>.<name>.ok and .ms samples to
+        prefix: Metric name prefix
+
+    Returns:
+        dict: name -> check result
+    """
+    results, samples = {}, {}
+    for name, check in checks.items():
+        started = time.perf_counter()
+        results[name] = check()
+        samples[f"{prefix}.{name}.ok"] = bool(results[name])
+        samples[f"{prefix}.{name}.ms"] = (time.perf_counter() - started) * 1000
+    if history is not None:
+        history.record_many(samples)
+    return results
+
+
+def parse_since(text):
+    """'90m', '12h', '30d' or '2w' -> seconds"""
+    match = re.fullmatch(r'(\d+)([mhdw])', text)
+    if not match:
+        raise ValueError(f"Invalid duration '{text}' (e.g. 30m, 12h, 7d, 2w)")
+    return int(match.group(1)) * {'m': 60, 'h': HOUR, 'd': DAY, 'w': 7 * DAY}[match.group(2)]
+
+
+def print_summaries(store, since, metrics=None):
+    start = int(time.time()) - since
+    for metric in metrics or store.metrics():
+        result = store.summary(metric, start)
+        if result is None:
+            print(f"  {metric:<32} no samples")
+            continue
+        approx = ' ~' if result['approximate'] else ''
+        print(f"  {metric:<32} n={result['count']:<7} mean {result['mean']:>9.2f}  p50 {result['p50']:>9.2f}  "
+              f"p95 {result['p95']:>9.2f}  p99 {result['p99']:>9.2f}  max {result['max']:>9.2f}{approx}")
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description='Summarise (or benchmark) a history directory')
+    parser.add_argument('directory', nargs='?', default='../history')
+    parser.add_argument('--since', default='7d')
+    parser.add_argument('--bench', action='store_true', help='Fill a temp store with 6 months of per-minute data')
+    args = parser.parse_args()
+
+    if not args.bench:
+        print_summaries(HistoryStore(args.directory), parse_since(args.since))
+        sys.exit(0)
+
+    import random
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(directory)
+        now = int(time.time()) // 60 * 60
+        begin = now - 182 * DAY
+        started = time.perf_counter()
+        for ts in range(begin, now, 60):
+            store.record_many({'tls_handshake.latency_ms': random.lognormvariate(3.5, 0.3),
+                               'tls_handshake.up': 1}, ts)
+        print(f"  ✓ {(now - begin) // 60:,} minutes x 2 metrics in {time.perf_counter() - started:.1f}s, "
+              f"{store.disk_usage() / 1024:.0f} KiB on disk")
+        for label, since in (('last day', DAY), ('last 30 days', 30 * DAY), ('6 months', 182 * DAY)):
+            started = time.perf_counter()
+            result = store.summary('tls_handshake.latency_ms', now - since)
+            print(f"  {label:<13} p95 {result['p95']:.1f} ms over {result['count']:,} samples "
+                  f"in {(time.perf_counter() - started) * 1000:.1f} ms{' (approx.)' if result['approximate'] else ''}")
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Image Transfer - Ship Docker images over SSH, sending only layers the host lacks
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import tarfile
+import tempfile
+import subprocess
+from pathlib import Path
+
+
+class ImageTransferError(RuntimeError):
+    pass
+
+
+def chain_ids(diff_ids):
+    """
+    Docker's ChainIDs for a layer stack
+
+    A layer is only reused when everything below it matches too, so the
+    chain (not the layer's own DiffID) is what a host "has".
+    """
+    chain = []
+    for diff_id in diff_ids:
+        parent = chain[-1] if chain else None
+        chain.append(diff_id if parent is None else
+                     'sha256:' + hashlib.sha256(f"{parent} {diff_id}".encode()).hexdigest())
+    return chain
+
+
+class _CountingWriter:
+    """File wrapper that counts the bytes written through it"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+# -- source ----------------------------------------------------------------------
+
+class ImageArchive:
+    def __init__(self, path):
+        """
+        A `docker save` archive (classic or OCI layout; both carry manifest.json)
+
+        Args:
+            path: Archive path
+
+        Raises:
+            ImageTransferError: Not a docker save archive
+        """
+        self.path = Path(path)
+        self.images = []
+        with tarfile.open(self.path) as tar:
+            try:
+                manifest = json.load(tar.extractfile('manifest.json'))
+            except KeyError:
+                raise ImageTransferError(f"{self.path} has no manifest.json; create it with `docker save`")
+            for entry in manifest:
+                config = json.load(tar.extractfile(entry['Config']))
+                diff_ids = config['rootfs']['diff_ids']
+                self.images.append({
+                    'tags': entry.get('RepoTags') or [],
+                    'layers': list(zip(entry['Layers'], diff_ids, chain_ids(diff_ids))),
+                })
+            self.sizes = {member.name: member.size for member in tar.getmembers() if member.isfile()}
+
+    @classmethod
+    def export(cls, images, path, docker='docker'):
+        """
+        `docker save` images from this machine (pull them, e.g. from a local registry, first)
+
+        Returns:
+            ImageArchive
+        """
+        result = subprocess.run([docker, 'save', '-o', str(path), *images], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise ImageTransferError(f"docker save failed: {result.stderr.strip()}")
+        return cls(path)
+
+    def needed_layers(self, have):
+        """Archive members holding layers whose chain isn't in `have`"""
+        return {path for image in self.images for path, _, chain in image['layers'] if chain not in have}
+
+    def plan(self, have):
+        """
+        What a transfer to a host with `have` would send
+
+        Returns:
+            dict: layers_sent/layers_skipped counts and raw layer bytes of each
+        """
+        layers = {path for image in self.images for path, _, _ in image['layers']}
+        needed = self.needed_layers(have)
+        return {
+            'layers_sent': len(needed),
+            'layers_skipped': len(layers - needed),
+            'raw_sent': sum(self.sizes[path] for path in needed),
+            'raw_skipped': sum(self.sizes[path] for path in layers - needed),
+        }
+
+    def write_bundle(self, fileobj, have, level=6):
+        """
+        Write a gzipped copy of the archive without the layers the host has
+
+        `docker load` looks a layer up by ChainID before opening its file,
+        so layers it already has can be left out; all metadata is kept.
+
+        Args:
+            fileobj: Writable binary stream (e.g. `docker load` stdin over ssh)
+            have: Set of ChainIDs on the host
+            level: gzip level; 1-6 keeps a slow link, not the CPU, the bottleneck
+
+        Returns:
+            int: Compressed bytes written
+        """
+        layers = {path for image in self.images for path, _, _ in image['layers']}
+        skip = layers - self.needed_layers(have)
+        counter = _CountingWriter(fileobj)
+        with tarfile.open(self.path) as source, \
+                gzip.GzipFile(fileobj=counter, mode='wb', compresslevel=level, mtime=0) as compressed, \
+                tarfile.open(fileobj=compressed, mode='w|') as bundle:
+            for member in source:
+                if member.name in skip:
+                    continue
+                bundle.addfile(member, source.extractfile(member) if member.isfile() else None)
+        return counter.bytes
+
+
+# -- destinations ------------------------------------------------------------------
+
+class DockerHost:
+    def __init__(self, ssh_alias=None, docker='docker'):
+        """
+        Docker daemon reached over SSH (or this machine when ssh_alias is None)
+
+        Layer reuse relies on the classic image store; with the containerd
+        image store enabled, transfer with full=True.
+
+        Args:
+            ssh_alias: SSH config alias
+            docker: Docker command on that host (e.g. 'sudo docker')
+        """
+        self.ssh_alias = ssh_alias
+        self.docker = docker
+
+    def _command(self, command):
+        return ['ssh', self.ssh_alias, command] if self.ssh_alias else ['sh', '-c', command]
+
+    def layer_chains(self):
+        """ChainIDs of every layer stack in the host's images"""
+        command = (f"{self.docker} image inspect --format '{{{{json .RootFS.Layers}}}}' "
+                   f"$({self.docker} image ls -aq) 2>/dev/null")
+        result = subprocess.run(self._command(command), capture_output=True, text=True)
+        have = set()
+        for line in result.stdout.splitlines():
+            if line.startswith('['):
+                have.update(chain_ids(json.loads(line)))
+        return have
+
+    def load(self, write):
+        """
+        Stream a bundle into `docker load`
+
+        Args:
+            write: Callable(fileobj) writing the bundle; returns bytes sent
+
+        Returns:
+            tuple: (bytes sent, list of "Loaded image: ..." lines)
+        """
+        proc = subprocess.Popen(self._command(f"{self.docker} load"), stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            sent = write(proc.stdin)
+        except BrokenPipeError:
+            sent = None
+        # communicate() flushes and closes stdin itself; closing it first makes it raise
+        stdout, stderr = proc.communicate()
+        if proc.returncode != 0 or sent is None:
+            raise ImageTransferError(f"docker load failed: {stderr.decode(errors='replace').strip()}")
+        return sent, [line for line in stdout.decode().splitlines() if line.startswith('Loaded')]
+
+
+class DirectoryImageStore:
+    def __init__(self, path):
+        """
+        Image store in a directory, loading bundles the way `docker load` does
+
+        Stands in for a remote daemon: layers are kept by ChainID, a bundle
+        must carry every layer the store lacks, and each layer's content must
+        match its DiffID.
+
+        Args:
+            path: Store directory (created if missing)
+        """
+        self.path = Path(path)
+        (self.path / 'layers').mkdir(parents=True, exist_ok=True)
+        self.state_file = self.path / 'images.json'
+
+    def _images(self):
+        try:
+            return json.loads(self.state_file.read_text())
+        except FileNotFoundError:
+            return {}
+
+    def layer_chains(self):
+        return {chain for diff_ids in self._images().values() for chain in chain_ids(diff_ids)}
+
+    def load(self, write):
+        images = self._images()
+        with tempfile.TemporaryFile() as spool:
+            sent = write(spool)
+            spool.seek(0)
+            loaded = []
+            with tarfile.open(fileobj=spool, mode='r:gz') as bundle:
+                members = {member.name: member for member in bundle.getmembers()}
+                for entry in json.load(bundle.extractfile('manifest.json')):
+                    diff_ids = json.load(bundle.extractfile(entry['Config']))['rootfs']['diff_ids']
+                    for path, diff_id, chain in zip(entry['Layers'], diff_ids, chain_ids(diff_ids)):
+                        stored = self.path / 'layers' / chain.split(':')[1]
+                        if stored.exists():
+                            continue
+                        if path not in members:
+                            raise ImageTransferError(f"layer {diff_id} is neither in the store nor the bundle")
+                        data = bundle.extractfile(members[path]).read()
+                        if 'sha256:' + hashlib.sha256(data).hexdigest() != diff_id:
+                            raise ImageTransferError(f"layer {path} does not match its DiffID {diff_id}")
+                        stored.write_bytes(data)
+                    for tag in entry.get('RepoTags') or []:
+                        images[tag] = diff_ids
+                        loaded.append(f"Loaded image: {tag}")
+        tmp = self.state_file.with_suffix('.tmp')
+        tmp.write_text(json.dumps(images, indent=1))
+        os.replace(tmp, self.state_file)
+        return sent, loaded
+
+
+# -- transfer ----------------------------------------------------------------------
+
+def transfer(archive, host, level=6, full=False):
+    """
+    Send an archive's images to a host, skipping the layers it already has
+
+    Args:
+        archive: ImageArchive
+        host: DockerHost or DirectoryImageStore
+        level: gzip level
+        full: Send every layer (hosts whose store can't reuse layers)
+
+    Returns:
+        dict: plan counts plus 'sent_bytes', 'seconds' and 'loaded'
+    """
+    started = time.perf_counter()
+    have = set() if full else host.layer_chains()
+    stats = archive.plan(have)
+    sent, loaded = host.load(lambda fileobj: archive.write_bundle(fileobj, have, level))
+    stats.update(sent_bytes=sent, seconds=time.perf_counter() - started, loaded=loaded)
+    return stats
+
+
+def print_transfer(stats):
+    mb = 1024 * 1024
+    for line in stats['loaded']:
+        print(f"  ✓ {line}")
+    print(f"  ✓ {stats['layers_sent']} layers sent ({stats['raw_sent'] / mb:.1f} MB raw, "
+          f"{stats['sent_bytes'] / mb:.1f} MB on the wire), {stats['layers_skipped']} already there "
+          f"({stats['raw_skipped'] / mb:.1f} MB) in {stats['seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Transfer docker images, sending only missing layers')
+    parser.add_argument('archive', help='docker save archive')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--ssh-alias', help='Load into the Docker daemon on this SSH host')
+    target.add_argument('--store', help='Load into a directory image store (for testing)')
+    parser.add_argument('--level', type=int, default=6, help='gzip level')
+    parser.add_argument('--full', action='store_true', help='Send every layer')
+    args = parser.parse_args()
+
+    try:
+        host = DirectoryImageStore(args.store) if args.store else DockerHost(args.ssh_alias)
+        print_transfer(transfer(ImageArchive(args.archive), host, args.level, args.full))
+    except ImageTransferError as e:
+        print(f"  ✗ {e}")
+        sys.exit(1)
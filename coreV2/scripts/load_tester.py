@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Load Tester - Concurrent TLS handshake latency and connection-rate testing
+"""
+
+import ssl
+import json
+import math
+import time
+import asyncio
+from collections import Counter
+from pathlib import Path
+
+from history import quantile
+
+
+def classify_error(exc):
+    """Map a connection exception to a short error bucket"""
+    if isinstance(exc, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(exc, ConnectionRefusedError):
+        return 'refused'
+    if isinstance(exc, ConnectionResetError):
+        return 'reset'
+    if isinstance(exc, ssl.SSLError):
+        return f"ssl:{getattr(exc, 'reason', None) or type(exc).__name__}"
+    if isinstance(exc, OSError) and exc.errno:
+        return f"os:{exc.errno}"
+    return type(exc).__name__
+
+
+def server_names_from_config(config_path):
+    """
+    Read Reality serverNames from a generated xray-config.json
+
+    Args:
+        config_path: Path to xray-config.json
+
+    Returns:
+        list: serverNames of the first Reality inbound
+    """
+    config = json.loads(Path(config_path).read_text())
+    for inbound in config.get('inbounds', []):
+        reality = inbound.get('streamSettings', {}).get('realitySettings')
+        if reality:
+            return list(reality.get('serverNames', []))
+    return []
+
+
+class LoadTester:
+    def __init__(self, host, port=443, server_names=None, connections=200, concurrency=50,
+                 ramp=0.0, timeout=5.0, verify_tls=False, hold=0.0):
+        """
+        Initialize the load tester
+
+        Args:
+            host: Target host
+            port: Target port
+            server_names: SNI values rotated across connections (defaults to host)
+            connections: Total connections to open
+            concurrency: Maximum handshakes in flight
+            ramp: Seconds over which connection starts are spread linearly
+            timeout: Per-handshake timeout in seconds
+            verify_tls: Verify certificates (off by default: Reality relays the dest cert)
+            hold: Seconds each connection stays open after the handshake
+        """
+        self.host = host
+        self.port = port
+        self.server_names = list(server_names or [host])
+        self.connections = connections
+        self.concurrency = concurrency
+        self.ramp = ramp
+        self.timeout = timeout
+        self.hold = hold
+        self.verify_tls = verify_tls
+
+    def _make_ssl_context(self):
+        # Built per event loop: SSLContext can't be pickled into worker processes
+        context = ssl.create_default_context()
+        if not self.verify_tls:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    async def _connect(self, index, start_at, context, semaphore, latencies, errors):
+        delay = start_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        sni = self.server_names[index % len(self.server_names)]
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, ssl=context, server_hostname=sni),
+                    self.timeout
+                )
+            except Exception as e:
+                errors[classify_error(e)] += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+            if self.hold:
+                await asyncio.sleep(self.hold)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ssl.SSLError, ConnectionError):
+                pass
+
+    async def run_async(self, connections=None):
+        """
+        Open the connections in this event loop
+
+        Args:
+            connections: Override for the number of connections
+
+        Returns:
+            dict: Raw samples: latencies, errors, wall and cpu seconds
+        """
+        total = self.connections if connections is None else connections
+        context = self._make_ssl_context()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        latencies = []
+        errors = Counter()
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        step = self.ramp / total if total else 0
+        await asyncio.gather(*(
+            self._connect(i, wall_start + i * step, context, semaphore, latencies, errors)
+            for i in range(total)
+        ))
+
+        return {
+            'latencies': latencies,
+            'errors': dict(errors),
+            'wall': time.perf_counter() - wall_start,
+            'cpu': time.process_time() - cpu_start,
+        }
+
+    def _worker(self, connections):
+        return asyncio.run(self.run_async(connections))
+
+    def run(self, workers=1):
+        """
+        Run the load test
+
+        Args:
+            workers: Processes used to generate load (1 = single event loop)
+
+        Returns:
+            dict: Summary report (see summarize())
+        """
+        if workers <= 1:
+            return self.summarize([self._worker(self.connections)])
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        shares = [self.connections // workers + (1 if i < self.connections % workers else 0)
+                  for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            samples = list(pool.map(self._worker, shares))
+        return self.summarize(samples)
+
+    def summarize(self, samples):
+        """
+        Merge per-worker samples into a report
+
+        Returns:
+            dict: attempted, succeeded, cps, latency percentiles (ms),
+                error breakdown and client CPU usage
+        """
+        latencies = sorted(l for s in samples for l in s['latencies'])
+        errors = Counter()
+        for s in samples:
+            errors.update(s['errors'])
+        wall = max((s['wall'] for s in samples), default=0.0)
+        cpu = sum(s['cpu'] for s in samples)
+
+        def ms(value):
+            return round(value * 1000, 3) if not math.isnan(value) else None
+
+        return {
+            'target': f"{self.host}:{self.port}",
+            'server_names': self.server_names,
+            'attempted': self.connections,
+            'succeeded': len(latencies),
+            'failed': sum(errors.values()),
+            'wall_seconds': round(wall, 3),
+            'connections_per_second': round(len(latencies) / wall, 1) if wall else 0.0,
+            'handshake_ms': {
+                'min': ms(latencies[0]) if latencies else None,
+                'p50': ms(quantile(latencies, 0.50)),
+                'p95': ms(quantile(latencies, 0.95)),
+                'p99': ms(quantile(latencies, 0.99)),
+                'max': ms(latencies[-1]) if latencies else None,
+            },
+            'errors': dict(errors.most_common()),
+            'client_cpu_seconds': round(cpu, 3),
+            'client_cpu_percent': round(100 * cpu / wall, 1) if wall else 0.0,
+            'workers': len(samples),
+        }
+
+    @staticmethod
+    def print_report(report):
+        """Print a human-readable report"""
+        hs = {k: 'n/a' if v is None else f"{v}ms" for k, v in report['handshake_ms'].items()}
+        print("\n" + "=" * 60)
+        print(f"Load Test: {report['target']}")
+        print("=" * 60)
+        print(f"  SNI:         {', '.join(report['server_names'])}")
+        print(f"  Connections: {report['succeeded']}/{report['attempted']} ok "
+              f"in {report['wall_seconds']}s ({report['workers']} worker(s))")
+        print(f"  Rate:        {report['connections_per_second']} conn/s")
+        print(f"  Handshake:   p50={hs['p50']} p95={hs['p95']} p99={hs['p99']} max={hs['max']}")
+        print(f"  Client CPU:  {report['client_cpu_seconds']}s ({report['client_cpu_percent']}% of one core)")
+        if report['errors']:
+            print("  Errors:")
+            for kind, count in report['errors'].items():
+                print(f"    ✗ {kind}: {count}")
+        print("=" * 60)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='TLS handshake load tester')
+    parser.add_argument('host')
+    parser.add_argument('--port', type=int, default=443)
+    parser.add_argument('-n', '--connections', type=int, default=200)
+    parser.add_argument('-c', '--concurrency', type=int, default=50)
+    parser.add_argument('--ramp', type=float, default=0.0, help='Seconds to ramp up to full rate')
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=1, help='Load generator processes')
+    parser.add_argument('--sni', action='append', help='SNI value (repeatable)')
+    parser.add_argument('--xray-config', help='Read serverNames from a generated xray-config.json')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    server_names = args.sni
+    if not server_names and args.xray_config:
+        server_names = server_names_from_config(args.xray_config)
+
+    tester = LoadTester(
+        args.host, args.port, server_names=server_names,
+        connections=args.connections, concurrency=args.concurrency,
+        ramp=args.ramp, timeout=args.timeout
+    )
+    report = tester.run(workers=args.workers)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        LoadTester.print_report(report)
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Log Analyzer - Stream Xray access logs and aggregate traffic in bounded memory
+"""
+
+import os
+import re
+import gzip
+import mmap
+import time
+from collections import Counter
+from operator import itemgetter
+from pathlib import Path
+
+
+# 2024/05/01 12:00:01.123456 from 1.2.3.4:5678 accepted tcp:www.example.com:443 [vless-reality >> direct] email: a@vpn
+# Groups: minute, client ip, status, destination, route, email
+ACCESS_LINE = re.compile(
+    rb'^(\d{4}/\d\d/\d\d \d\d:\d\d):\d\d\S* (?:from )?(?:tcp:|udp:)?(\S+):\d+ '
+    rb'(accepted|rejected) +(?:tcp:|udp:)?(\S+)(?: \[([^\]\n]*)\])?(?: email: (\S+))?',
+    re.MULTILINE
+)
+
+_MINUTE, _CLIENT, _STATUS, _DEST, _ROUTE, _EMAIL = (itemgetter(i) for i in range(6))
+
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+class TopK:
+    def __init__(self, capacity=1000):
+        """
+        Bounded heavy-hitter counter
+
+        Counts exactly until it holds 2x capacity keys, then prunes back to the
+        top `capacity`. `error` is the largest count ever pruned, an upper bound
+        on how much any surviving key may be under-counted.
+
+        Args:
+            capacity: Keys retained after pruning
+        """
+        self.capacity = capacity
+        self.counts = Counter()
+        self.error = 0
+
+    def update(self, items):
+        """Add an iterable of keys or a mapping of key -> count"""
+        self.counts.update(items)
+        if len(self.counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        kept = self.counts.most_common(self.capacity)
+        if len(kept) == self.capacity:
+            self.error = max(self.error, kept[-1][1])
+        self.counts = Counter(dict(kept))
+
+    def merge(self, other):
+        self.error = max(self.error, other.error)
+        self.update(other.counts)
+
+    def most_common(self, n=None):
+        return self.counts.most_common(n)
+
+
+class LogSummary:
+    def __init__(self, top_capacity=1000):
+        """
+        Aggregates for one or more log segments (mergeable across workers)
+
+        Args:
+            top_capacity: Keys kept by the destination / client IP sketches
+        """
+        self.lines = 0
+        self.matched = 0
+        self.bytes = 0
+        self.status = Counter()
+        self.per_minute = Counter()
+        self.per_user = Counter()
+        self.destinations = TopK(top_capacity)
+        self.clients = TopK(top_capacity)
+        self.routes = Counter()
+
+    def add_block(self, block):
+        """Parse one newline-aligned block (bytes or mmap slice)"""
+        matches = ACCESS_LINE.findall(block)
+        self.bytes += len(block)
+        self.lines += block.count(b'\n')
+        if not matches:
+            return
+        self.matched += len(matches)
+
+        # Counter.update over map(itemgetter) stays in C; no per-line Python work
+        self.per_minute.update(map(_MINUTE, matches))
+        self.clients.update(map(_CLIENT, matches))
+        self.status.update(map(_STATUS, matches))
+        self.destinations.update(map(_DEST, matches))
+        self.routes.update(map(_ROUTE, matches))
+        self.per_user.update(map(_EMAIL, matches))
+
+    def merge(self, other):
+        self.lines += other.lines
+        self.matched += other.matched
+        self.bytes += other.bytes
+        self.status.update(other.status)
+        self.per_minute.update(other.per_minute)
+        self.per_user.update(other.per_user)
+        self.routes.update(other.routes)
+        self.destinations.merge(other.destinations)
+        self.clients.merge(other.clients)
+        return self
+
+    @staticmethod
+    def _host(dest):
+        # 'www.example.com:443' -> 'www.example.com' (only run on the top keys)
+        host, sep, port = dest.rpartition(b':')
+        return (host if sep and port.isdigit() else dest).decode(errors='replace')
+
+    def report(self, top=20):
+        """
+        Decoded, JSON-friendly report
+
+        Returns:
+            dict: totals, top users/destinations/clients and per-minute counts
+        """
+        dest_hosts = Counter()
+        for dest, count in self.destinations.most_common():
+            dest_hosts[self._host(dest)] += count
+
+        return {
+            'bytes': self.bytes,
+            'lines': self.lines,
+            'matched': self.matched,
+            'accepted': self.status.get(b'accepted', 0),
+            'rejected': self.status.get(b'rejected', 0),
+            'users': len(self.per_user),
+            'top_users': [((k or b'-').decode(errors='replace'), v) for k, v in self.per_user.most_common(top)],
+            'top_destinations': dest_hosts.most_common(top),
+            'destination_error_bound': self.destinations.error,
+            'top_clients': [(k.decode(errors='replace'), v) for k, v in self.clients.most_common(top)],
+            'routes': {(k or b'-').decode(errors='replace'): v for k, v in self.routes.most_common()},
+            'per_minute': {k.decode(): v for k, v in sorted(self.per_minute.items())},
+        }
+
+
+def plan_tasks(paths, split_bytes=64 * 1024 * 1024):
+    """
+    Split inputs into independent work items
+
+    Plain files are cut into byte ranges (aligned to lines by the worker);
+    gzipped files must be decompressed sequentially and stay whole.
+
+    Returns:
+        list: (path, start, end) tuples; end is None for gzip files
+    """
+    tasks = []
+    for path in paths:
+        path = str(path)
+        if path.endswith('.gz'):
+            tasks.append((path, 0, None))
+            continue
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), split_bytes):
+            tasks.append((path, start, min(start + split_bytes, size)))
+    return tasks
+
+
+def _scan_range(mm, start, end, summary):
+    """Scan [start, end) of an mmap, owning lines that start inside the range"""
+    size = len(mm)
+    if start > 0:
+        # Skip the partial line; the previous range owns it
+        nl = mm.find(b'\n', start - 1)
+        start = size if nl < 0 else nl + 1
+    if end < size:
+        nl = mm.find(b'\n', end - 1)
+        end = size if nl < 0 else nl + 1
+
+    pos = start
+    while pos < end:
+        stop = min(pos + BLOCK_SIZE, end)
+        if stop < end:
+            nl = mm.rfind(b'\n', pos, stop)
+            stop = nl + 1 if nl >= pos else stop
+        summary.add_block(mm[pos:stop])
+        pos = stop
+
+
+def analyze_task(task, top_capacity=1000):
+    """
+    Process one work item (runs inside pool workers)
+
+    Returns:
+        LogSummary: Aggregates for the item
+    """
+    path, start, end = task
+    summary = LogSummary(top_capacity)
+
+    if end is None:
+        with gzip.open(path, 'rb') as f:
+            carry = b''
+            while True:
+                data = f.read(BLOCK_SIZE)
+                if not data:
+                    break
+                data = carry + data
+                cut = data.rfind(b'\n') + 1
+                carry = data[cut:]
+                summary.add_block(data[:cut])
+            if carry:
+                summary.add_block(carry + b'\n')
+        return summary
+
+    if end == start:
+        return summary
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        _scan_range(mm, start, end, summary)
+    return summary
+
+
+def find_logs(path):
+    """Expand a log path into itself plus rotated siblings (access.log.1, .2.gz, ...)"""
+    path = Path(path)
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.name.startswith('access.log'))
+    siblings = sorted(path.parent.glob(path.name + '.*'))
+    return ([path] if path.exists() else []) + [p for p in siblings if p.is_file()]
+
+
+def analyze(paths, workers=None, top_capacity=1000, split_bytes=64 * 1024 * 1024):
+    """
+    Analyze access logs in parallel
+
+    Args:
+        paths: Log files (plain or .gz)
+        workers: Processes to use (default: CPU count; 1 = in-process)
+        top_capacity: Keys kept by heavy-hitter sketches
+        split_bytes: Range size for splitting large plain files
+
+    Returns:
+        LogSummary: Merged aggregates
+    """
+    tasks = plan_tasks(paths, split_bytes)
+    workers = workers or os.cpu_count() or 1
+    total = LogSummary(top_capacity)
+
+    if workers == 1 or len(tasks) == 1:
+        for task in tasks:
+            total.merge(analyze_task(task, top_capacity))
+        return total
+
+    from functools import partial
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        for summary in pool.map(partial(analyze_task, top_capacity=top_capacity), tasks):
+            total.merge(summary)
+    return total
+
+
+def generate_sample_log(path, size_mb=256, users=5000, destinations=50000):
+    """Write a synthetic access log for benchmarking"""
+    import random
+
+    rng = random.Random(42)
+    emails = [f"user{i}@vpn".encode() for i in range(users)]
+    dests = [f"tcp:host{i}.example.com:443".encode() for i in range(destinations)]
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, 'wb') as f:
+        minute = 0
+        while written < target:
+            lines = []
+            for second in range(60):
+                stamp = f"2024/05/01 {minute // 60 % 24:02d}:{minute % 60:02d}:{second:02d}.{rng.randrange(10**6):06d}".encode()
+                for _ in range(50):
+                    lines.append(
+                        stamp + b" from 10.%d.%d.%d:%d accepted " % (
+                            rng.randrange(256), rng.randrange(256), rng.randrange(256), rng.randrange(1024, 65535))
+                        + dests[int(rng.paretovariate(1.2)) % destinations]
+                        + b" [vless-reality >> direct] email: " + emails[rng.randrange(users)] + b"\n"
+                    )
+            block = b''.join(lines)
+            f.write(block)
+            written += len(block)
+            minute += 1
+    return Path(path)
+
+
+def benchmark(size_mb=256, workers=None):
+    """Generate a synthetic log and report throughput in MB/s"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = generate_sample_log(Path(tmp) / 'access.log', size_mb)
+        real_mb = log.stat().st_size / 1e6
+        for n in sorted({1, workers or os.cpu_count() or 1}):
+            start = time.perf_counter()
+            summary = analyze([log], workers=n)
+            elapsed = time.perf_counter() - start
+            print(f"  workers={n:<3} {real_mb:.0f} MB in {elapsed:.2f}s = {real_mb / elapsed:.0f} MB/s "
+                  f"({summary.matched / elapsed / 1e6:.2f} M lines/s)")
+
+
+def print_report(report, top=10):
+    """Print a human-readable analysis"""
+    print("\n" + "=" * 60)
+    print("Access Log Analysis")
+    print("=" * 60)
+    print(f"  Lines: {report['lines']:,} ({report['matched']:,} parsed, {report['bytes'] / 1e6:.1f} MB)")
+    print(f"  Accepted: {report['accepted']:,}  Rejected: {report['rejected']:,}  Users: {report['users']:,}")
+
+    print("\n  Top users:")
+    for name, count in report['top_users'][:top]:
+        print(f"    {count:>10,}  {name}")
+    print("\n  Top destinations:")
+    for name, count in report['top_destinations'][:top]:
+        print(f"    {count:>10,}  {name}")
+    if report['destination_error_bound']:
+        print(f"    (counts may be low by up to {report['destination_error_bound']:,})")
+
+    if report['per_minute']:
+        busiest = max(report['per_minute'].items(), key=lambda kv: kv[1])
+        print(f"\n  Minutes: {len(report['per_minute']):,}, busiest {busiest[0]} ({busiest[1]:,} connections)")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    import sys
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Analyze Xray access logs')
+    parser.add_argument('paths', nargs='*', help='Log files or a log directory (rotated/.gz files included)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+    parser.add_argument('--bench', type=int, metavar='MB', help='Benchmark on a synthetic log of MB megabytes')
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.bench, args.workers)
+        sys.exit(0)
+
+    if not args.paths:
+        parser.error('no log paths given')
+
+    files = [p for path in args.paths for p in find_logs(path)]
+    if not files:
+        print("✗ No log files found")
+        sys.exit(1)
+
+    report = analyze(files, workers=args.workers).report(args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.top)
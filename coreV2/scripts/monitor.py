@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Monitor - Continuous async health probing with a Prometheus /metrics endpoint
+"""
+
+import ssl
+import time
+import math
+import asyncio
+from array import array
+from urllib.parse import urlparse
+
+from history import quantile
+
+
+# Prometheus histogram bucket bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RingBuffer:
+    def __init__(self, size):
+        """
+        Fixed-size ring of float samples (no allocation after construction)
+
+        Args:
+            size: Number of samples retained
+        """
+        self.size = size
+        self.data = array('d', bytes(8 * size))
+        self.count = 0
+
+    def append(self, value):
+        self.data[self.count % self.size] = value
+        self.count += 1
+
+    def values(self):
+        """Retained samples, oldest first"""
+        if self.count <= self.size:
+            return self.data[:self.count].tolist()
+        start = self.count % self.size
+        return (self.data[start:] + self.data[:start]).tolist()
+
+    def quantile(self, q):
+        return quantile(sorted(self.values()), q)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=512):
+        """
+        Cumulative Prometheus histogram plus a ring of recent samples
+
+        Args:
+            buckets: Upper bounds in seconds
+            window: Recent samples kept for quantile gauges
+        """
+        self.buckets = tuple(buckets)
+        self.counts = array('Q', bytes(8 * (len(self.buckets) + 1)))
+        self.sum = 0.0
+        self.recent = RingBuffer(window)
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    @property
+    def total(self):
+        return sum(self.counts)
+
+
+class ProbeResult:
+    __slots__ = ('ok', 'latency', 'error')
+
+    def __init__(self, ok, latency, error=None):
+        self.ok = ok
+        self.latency = latency
+        self.error = error
+
+
+class HealthMonitor:
+    def __init__(self, host, ports=(443,), tls_port=443, sni=None, http_url=None,
+                 container_command=None, expected_containers=('xray',),
+                 interval=30.0, timeout=5.0, verify_tls=True, window=512, history=None):
+        """
+        Initialize the monitor
+
+        Args:
+            host: Host to probe
+            ports: TCP ports checked for reachability
+            tls_port: Port used for the TLS handshake probe (None to skip)
+            sni: Server name sent in the TLS ClientHello (defaults to host)
+            http_url: URL fetched by the HTTP probe (None to skip)
+            container_command: Argument list printing `docker ps` style
+                "name<TAB>status" lines, e.g. ['ssh', 'customvpn', 'docker ps ...']
+                (None to skip)
+            expected_containers: Names that must be reported as Up (see
+                blue_green.container_status_command for an xray that swaps colors)
+            interval: Seconds between probe rounds
+            timeout: Per-probe timeout in seconds
+            verify_tls: Verify certificates (disable for self-signed stand-ins)
+            window: Recent samples kept per probe
+            history: HistoryStore every round's <probe>.up/.latency_ms samples
+                are appended to (the in-memory window only covers recent rounds)
+        """
+        self.host = host
+        self.ports = tuple(ports)
+        self.tls_port = tls_port
+        self.sni = sni or host
+        self.http_url = http_url
+        self.container_command = container_command
+        self.expected_containers = set(expected_containers)
+        self.interval = interval
+        self.timeout = timeout
+        self.window = window
+        self.history = history
+
+        self.ssl_context = ssl.create_default_context()
+        if not verify_tls:
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+
+        self.histograms = {}
+        self.up = {}
+        self.failures = {}
+        self.last_errors = {}
+        self.rounds = 0
+        self._stopping = None
+
+    # -- probes --------------------------------------------------------------
+
+    async def probe_port(self, port):
+        """TCP connect latency"""
+        start = time.perf_counter()
+        _, writer = await asyncio.wait_for(asyncio.open_connection(self.host, port), self.timeout)
+        latency = time.perf_counter() - start
+        writer.close()
+        await writer.wait_closed()
+        return ProbeResult(True, latency)
+
+    async def probe_tls(self):
+        """Full TLS handshake latency (TCP connect included)"""
+        start = time.perf_counter()
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.tls_port, ssl=self.ssl_context, server_hostname=self.sni),
+            self.timeout
+        )
+        latency = time.perf_counter() - start
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ssl.SSLError, ConnectionError):
+            pass
+        return ProbeResult(True, latency)
+
+    async def probe_http(self):
+        """Time to first response line for a GET on http_url"""
+        url = urlparse(self.http_url)
+        secure = url.scheme == 'https'
+        port = url.port or (443 if secure else 80)
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                url.hostname, port,
+                ssl=self.ssl_context if secure else None,
+                server_hostname=url.hostname if secure else None
+            ),
+            self.timeout
+        )
+        try:
+            path = url.path or '/'
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: {url.hostname}\r\n"
+                f"User-Agent: customvpn-monitor\r\nConnection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+            latency = time.perf_counter() - start
+        finally:
+            writer.close()
+        parts = status_line.decode(errors='replace').split()
+        status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+        if status >= 400 or status == 0:
+            return ProbeResult(False, latency, f"HTTP status {status}")
+        return ProbeResult(True, latency)
+
+    async def probe_containers(self):
+        """Run container_command and check expected containers are Up"""
+        start = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(
+            *self.container_command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(proc.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise
+        latency = time.perf_counter() - start
+
+        running = set()
+        for line in stdout.decode(errors='replace').splitlines():
+            if '\t' in line:
+                name, status = line.split('\t', 1)
+                if status.startswith('Up'):
+                    running.add(name.strip())
+        missing = self.expected_containers - running
+        if missing:
+            return ProbeResult(False, latency, f"not running: {', '.join(sorted(missing))}")
+        return ProbeResult(True, latency)
+
+    def probes(self):
+        """(probe name, coroutine factory) pairs for one round"""
+        probes = [(f"port_{port}", lambda port=port: self.probe_port(port)) for port in self.ports]
+        if self.tls_port:
+            probes.append(('tls_handshake', self.probe_tls))
+        if self.http_url:
+            probes.append(('http', self.probe_http))
+        if self.container_command:
+            probes.append(('containers', self.probe_containers))
+        return probes
+
+    # -- scheduling ----------------------------------------------------------
+
+    async def _run_probe(self, name, factory):
+        try:
+            result = await factory()
+        except asyncio.TimeoutError:
+            # A failure, not a latency sample: it would skew the histogram and history
+            result = ProbeResult(False, math.nan, f"timeout after {self.timeout:g}s")
+        except (OSError, ssl.SSLError) as e:
+            result = ProbeResult(False, math.nan, f"{type(e).__name__}: {e}")
+
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = LatencyHistogram(window=self.window)
+        if not math.isnan(result.latency):
+            hist.observe(result.latency)
+
+        self.up[name] = result.ok
+        if not result.ok:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            self.last_errors[name] = result.error
+        return name, result
+
+    async def run_once(self):
+        """
+        Run every probe concurrently once
+
+        Returns:
+            dict: probe name -> ProbeResult
+        """
+        results = dict(await asyncio.gather(*(self._run_probe(n, f) for n, f in self.probes())))
+        self.rounds += 1
+        if self.history is not None:
+            samples = {}
+            for name, result in results.items():
+                samples[f"{name}.up"] = result.ok
+                samples[f"{name}.latency_ms"] = result.latency * 1000
+            self.history.record_many(samples)
+        return results
+
+    async def run(self, rounds=None):
+        """Probe every `interval` seconds until stop() or `rounds` are done"""
+        self._stopping = asyncio.Event()
+        while rounds is None or self.rounds < rounds:
+            started = time.monotonic()
+            await self.run_once()
+            delay = max(0.0, self.interval - (time.monotonic() - started))
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    # -- exposition ----------------------------------------------------------
+
+    def render_metrics(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        host = self.host.replace('"', '')
+        out = [
+            '# HELP customvpn_probe_up Whether the last probe succeeded',
+            '# TYPE customvpn_probe_up gauge',
+        ]
+        for name, ok in sorted(self.up.items()):
+            out.append(f'customvpn_probe_up{{probe="{name}",host="{host}"}} {int(ok)}')
+
+        out += [
+            '# HELP customvpn_probe_failures_total Failed probes',
+            '# TYPE customvpn_probe_failures_total counter',
+        ]
+        for name in sorted(self.up):
+            out.append(f'customvpn_probe_failures_total{{probe="{name}",host="{host}"}} {self.failures.get(name, 0)}')
+
+        out += [
+            '# HELP customvpn_probe_latency_seconds Probe latency',
+            '# TYPE customvpn_probe_latency_seconds histogram',
+        ]
+        for name, hist in sorted(self.histograms.items()):
+            labels = f'probe="{name}",host="{host}"'
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                out.append(f'customvpn_probe_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            out.append(f'customvpn_probe_latency_seconds_bucket{{{labels},le="+Inf"}} {hist.total}')
+            out.append(f'customvpn_probe_latency_seconds_sum{{{labels}}} {hist.sum:.6f}')
+            out.append(f'customvpn_probe_latency_seconds_count{{{labels}}} {hist.total}')
+
+        out += [
+            '# HELP customvpn_probe_latency_recent_seconds Quantiles over the recent sample window',
+            '# TYPE customvpn_probe_latency_recent_seconds gauge',
+        ]
+        for name, hist in sorted(self.histograms.items()):
+            for q in (0.5, 0.95, 0.99):
+                value = hist.recent.quantile(q)
+                if not math.isnan(value):
+                    out.append(
+                        f'customvpn_probe_latency_recent_seconds{{probe="{name}",host="{host}",quantile="{q}"}} {value:.6f}'
+                    )
+
+        out += [
+            '# HELP customvpn_monitor_rounds_total Completed probe rounds',
+            '# TYPE customvpn_monitor_rounds_total counter',
+            f'customvpn_monitor_rounds_total {self.rounds}',
+        ]
+        return '\n'.join(out) + '\n'
+
+    async def _handle_http(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Drain headers; the endpoint ignores them
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request_line.decode(errors='replace').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                body = self.render_metrics().encode()
+                status = '200 OK'
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                body = b'not found\n'
+                status = '404 Not Found'
+                content_type = 'text/plain'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_metrics(self, listen='127.0.0.1', port=9477):
+        """Start the /metrics HTTP server; returns the asyncio Server"""
+        return await asyncio.start_server(self._handle_http, listen, port)
+
+    async def serve_forever(self, listen='127.0.0.1', port=9477):
+        """Run the probe loop and the metrics endpoint until stopped"""
+        server = await self.serve_metrics(listen, port)
+        print(f"Serving metrics on http://{listen}:{port}/metrics (interval {self.interval}s)")
+        async with server:
+            await self.run()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Continuous VPN health monitor')
+    parser.add_argument('host', help='Host to probe')
+    parser.add_argument('--ports', default='443', help='Comma-separated TCP ports (default: 443)')
+    parser.add_argument('--sni', help='TLS server name (e.g. the Reality serverName)')
+    parser.add_argument('--http-url', help='URL for the HTTP probe')
+    parser.add_argument('--ssh-alias', help='Check containers via `ssh <alias> docker ps`')
+    parser.add_argument('--remote-dir', default='/home/shaun/vpn', help='Deployment directory on the VPS')
+    parser.add_argument('--interval', type=float, default=30.0)
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--insecure', action='store_true', help='Skip TLS certificate verification')
+    parser.add_argument('--listen', default='127.0.0.1')
+    parser.add_argument('--metrics-port', type=int, default=9477)
+    args = parser.parse_args()
+
+    container_command = None
+    if args.ssh_alias:
+        from blue_green import container_status_command
+
+        container_command = ['ssh', args.ssh_alias, container_status_command(args.remote_dir)]
+
+    monitor = HealthMonitor(
+        host=args.host,
+        ports=[int(p) for p in args.ports.split(',') if p],
+        sni=args.sni,
+        http_url=args.http_url,
+        container_command=container_command,
+        interval=args.interval,
+        timeout=args.timeout,
+        verify_tls=not args.insecure
+    )
+
+    try:
+        asyncio.run(monitor.serve_forever(args.listen, args.metrics_port))
+    except KeyboardInterrupt:
+        print("\nMonitor stopped.")
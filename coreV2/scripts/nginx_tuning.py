@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Nginx Tuning - Size nginx.conf for the target host and load-test TLS session reuse
+"""
+
+import os
+import math
+
+
+# nginx shares ~4000 TLS sessions per megabyte of ssl_session_cache
+SESSIONS_PER_MB = 4000
+# Rough per-connection memory: TLS record buffers, proxy buffers, request pool
+CONNECTION_KB = 64
+# Share of RAM nginx may plan for; xray and the OS need the rest
+NGINX_MEMORY_SHARE = 0.25
+# Every proxied connection holds two descriptors (client + upstream)
+FDS_PER_CONNECTION = 2
+
+
+class HostResources:
+    # Run on the target host; prints cores, MemTotal (kB) and the hard fd limit
+    PROBE_COMMAND = "nproc; awk '/^MemTotal:/ {print $2}' /proc/meminfo; ulimit -Hn"
+
+    def __init__(self, cores, memory_mb, nofile):
+        """
+        CPU, memory and file descriptor limits of the host nginx runs on
+
+        Args:
+            cores: Online CPUs
+            memory_mb: Total RAM in MB
+            nofile: Hard RLIMIT_NOFILE (what worker_rlimit_nofile may raise to)
+        """
+        self.cores = max(1, int(cores))
+        self.memory_mb = max(64, int(memory_mb))
+        self.nofile = max(1024, int(nofile))
+
+    @classmethod
+    def local(cls):
+        """Resources of the machine running this script (e.g. deploy_local.py on the VPS)"""
+        import resource
+
+        memory_kb = 1024 * 1024
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemTotal:'):
+                        memory_kb = int(line.split()[1])
+                        break
+        except OSError:
+            pass
+        hard = resource.getrlimit(resource.RLIMIT_NOFILE)[1]
+        nofile = 1048576 if hard == resource.RLIM_INFINITY else hard
+        return cls(len(os.sched_getaffinity(0)), memory_kb // 1024, nofile)
+
+    @classmethod
+    def from_probe_output(cls, output):
+        """
+        Parse PROBE_COMMAND output
+
+        Raises:
+            ValueError: Output doesn't have the three expected numbers
+        """
+        values = output.split()
+        if len(values) != 3:
+            raise ValueError(f"Unexpected host probe output: {output!r}")
+        cores, memory_kb, nofile = values
+        return cls(int(cores), int(memory_kb) // 1024, 1048576 if nofile == 'unlimited' else int(nofile))
+
+    def summary(self):
+        return f"{self.cores} core(s), {self.memory_mb} MB RAM, nofile {self.nofile}"
+
+
+def nginx_sizing(host, ssl_session_tickets=True, ocsp_stapling=True, resolver='1.1.1.1 8.8.8.8'):
+    """
+    Derive nginx.conf limits from host resources
+
+    worker_connections is the smaller of what the fd limit and the memory
+    share allow per worker; the session cache holds one session for every
+    client that can be connected at once, so a reconnecting client resumes
+    instead of doing a full handshake.
+
+    Args:
+        host: HostResources
+        ssl_session_tickets: Stateless resumption (ticket keys rotate on nginx restart)
+        ocsp_stapling: Staple OCSP responses (harmless if the CA has no responder)
+        resolver: DNS servers nginx uses to reach the OCSP responder
+
+    Returns:
+        dict: Template variables for nginx.conf.j2
+    """
+    workers = host.cores
+    rlimit = min(host.nofile, 1048576)
+    fd_limit = (rlimit - 32) // FDS_PER_CONNECTION
+    memory_limit = int(host.memory_mb * 1024 * NGINX_MEMORY_SHARE / CONNECTION_KB / workers)
+    worker_connections = max(512, min(fd_limit, memory_limit, 65535))
+
+    clients = workers * worker_connections // FDS_PER_CONNECTION
+    cache_mb = math.ceil(clients / SESSIONS_PER_MB)
+
+    return {
+        'host_summary': host.summary(),
+        'worker_processes': workers,
+        'worker_rlimit_nofile': rlimit,
+        'worker_connections': worker_connections,
+        # Small hosts drop idle browsers sooner to free connection slots
+        'keepalive_timeout': 65 if host.memory_mb >= 1024 else 30,
+        'keepalive_requests': 1000,
+        'open_file_cache_max': min(10000, rlimit // 4),
+        'ssl_session_cache_mb': max(1, min(cache_mb, host.memory_mb // 64)),
+        'ssl_session_timeout': '1d',
+        'ssl_session_tickets': ssl_session_tickets,
+        'ocsp_stapling': ocsp_stapling,
+        'resolver': resolver,
+        # Idle connections each worker keeps open to xray
+        'upstream_keepalive': max(16, min(256, worker_connections // 16)),
+    }
+
+
+# -- load test ------------------------------------------------------------------
+
+def _request(tls, sni, close=True):
+    """One GET; returns once the response headers and body are read"""
+    tls.sendall(f"GET / HTTP/1.1\r\nHost: {sni}\r\nConnection: {'close' if close else 'keep-alive'}\r\n\r\n".encode())
+    response = b''
+    while b'\r\n\r\n' not in response:
+        chunk = tls.recv(16384)
+        if not chunk:
+            return response
+        response += chunk
+    head, _, body = response.partition(b'\r\n\r\n')
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':')[1])
+    while len(body) < length:
+        chunk = tls.recv(16384)
+        if not chunk:
+            break
+        body += chunk
+    return head
+
+
+def load_test(host, port, sni, connections=200, concurrency=8, resume=True, requests_per_connection=1):
+    """
+    Open many short TLS connections, as reconnecting VPN clients do
+
+    Each worker keeps the last session and offers it on its next connection,
+    so the resumed share shows whether the server caches sessions.
+
+    Args:
+        host, port: Server to test
+        sni: Server name to send
+        connections: Total connections
+        concurrency: Parallel client threads
+        resume: Offer the previous session when reconnecting
+        requests_per_connection: GETs sent on each connection
+
+    Returns:
+        dict: connections/s, connect-to-response percentiles (ms) and resumed share
+    """
+    import ssl
+    import time
+    import socket
+    import statistics
+    from concurrent.futures import ThreadPoolExecutor
+
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+
+    def worker(count):
+        latencies, resumed, failed, session = [], 0, 0, None
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                sock = socket.create_connection((host, port), timeout=5.0)
+                # Like real clients; otherwise Nagle + delayed ACK add ~40 ms to full handshakes
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with context.wrap_socket(sock, server_hostname=sni, session=session if resume else None) as tls:
+                    for i in range(requests_per_connection):
+                        _request(tls, sni, close=i == requests_per_connection - 1)
+                    # TLS 1.3 tickets arrive after the handshake, so read the session last
+                    session = tls.session
+                    resumed += tls.session_reused
+            except (OSError, ssl.SSLError):
+                failed += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies, resumed, failed
+
+    shares = [connections // concurrency + (i < connections % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, shares))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(ms for r in results for ms in r[0])
+    done = len(latencies)
+    return {
+        'connections': done,
+        'failed': sum(r[2] for r in results),
+        'connections_per_s': done / elapsed if elapsed else 0.0,
+        'latency_p50_ms': statistics.median(latencies) if latencies else None,
+        'latency_p95_ms': latencies[max(0, int(done * 0.95) - 1)] if latencies else None,
+        'resumed_share': sum(r[1] for r in results) / done if done else 0.0,
+    }
+
+
+class StandInServer:
+    def __init__(self, certfile, keyfile, session_resumption=True, upstream_keepalive=True, upstream_delay=0.002):
+        """
+        Local nginx stand-in for comparing the old and new configs without a VPS
+
+        It reproduces the two behaviours the tuning changes: TLS session
+        resumption (the old config had no session cache, so TLS 1.3 clients
+        got no tickets) and upstream keepalive (the old config opened a new
+        connection to xray for every proxied request). The "upstream" is a
+        TCP connect to a local backend plus upstream_delay.
+
+        Args:
+            certfile, keyfile: PEM certificate and key to serve
+            session_resumption: Issue session tickets
+            upstream_keepalive: Reuse upstream connections from a pool
+            upstream_delay: Simulated backend processing time in seconds
+        """
+        import ssl
+
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(certfile, keyfile)
+        if not session_resumption:
+            self.context.num_tickets = 0
+            self.context.options |= ssl.OP_NO_TICKET
+        self.upstream_keepalive = upstream_keepalive
+        self.upstream_delay = upstream_delay
+        self.pool = []
+
+    def __enter__(self):
+        import socket
+        import threading
+
+        self.backend = socket.create_server(('127.0.0.1', 0))
+        self.listener = socket.create_server(('127.0.0.1', 0), backlog=512)
+        self.port = self.listener.getsockname()[1]
+        self.running = True
+        for target in (self._serve_backend, self._serve):
+            threading.Thread(target=target, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.listener.close()
+        self.backend.close()
+
+    def _serve_backend(self):
+        import threading
+
+        def echo(conn):
+            with conn:
+                while conn.recv(1):
+                    conn.sendall(b'.')
+
+        while self.running:
+            try:
+                conn, _ = self.backend.accept()
+            except OSError:
+                return
+            threading.Thread(target=echo, args=(conn,), daemon=True).start()
+
+    def _upstream(self):
+        import socket
+        import time
+
+        try:
+            conn = self.pool.pop() if self.upstream_keepalive else None
+        except IndexError:
+            conn = None
+        if conn is None:
+            conn = socket.create_connection(self.backend.getsockname())
+        conn.sendall(b'.')
+        conn.recv(1)
+        time.sleep(self.upstream_delay)
+        if self.upstream_keepalive:
+            self.pool.append(conn)
+        else:
+            conn.close()
+
+    def _handle(self, conn):
+        import ssl
+
+        try:
+            with self.context.wrap_socket(conn, server_side=True) as tls:
+                while True:
+                    request = b''
+                    while b'\r\n\r\n' not in request:
+                        chunk = tls.recv(4096)
+                        if not chunk:
+                            return
+                        request += chunk
+                    self._upstream()
+                    tls.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+                    if b'connection: close' in request.lower():
+                        return
+        except (OSError, ssl.SSLError):
+            pass
+
+    def _serve(self):
+        import threading
+
+        while self.running:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+def benchmark(certfile, keyfile, connections=300, concurrency=8):
+    """
+    Compare the old and the tuned nginx behaviour on the local stand-in
+
+    Returns:
+        dict: variant -> load_test result
+    """
+    variants = {
+        'old': {'session_resumption': False, 'upstream_keepalive': False},
+        'tuned': {'session_resumption': True, 'upstream_keepalive': True},
+    }
+    results = {}
+    for name, options in variants.items():
+        with StandInServer(certfile, keyfile, **options) as server:
+            load_test('127.0.0.1', server.port, 'localhost', connections=20, concurrency=2)  # warm up
+            results[name] = load_test('127.0.0.1', server.port, 'localhost', connections, concurrency)
+    return results
+
+
+def print_load_test(name, result):
+    p50, p95 = result['latency_p50_ms'], result['latency_p95_ms']
+    if p50 is None:
+        print(f"  ✗ {name:<8} every connection failed")
+        return
+    print(f"  ✓ {name:<8} {result['connections_per_s']:>8.1f} conn/s  latency p50 {p50:>6.2f} ms  "
+          f"p95 {p95:>6.2f} ms  resumed {result['resumed_share']:>4.0%}  failed {result['failed']}")
+
+
+if __name__ == '__main__':
+    import sys
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show nginx sizing for a host, or load-test TLS reuse')
+    parser.add_argument('--cores', type=int, help='Override detected cores')
+    parser.add_argument('--memory-mb', type=int, help='Override detected RAM')
+    parser.add_argument('--nofile', type=int, help='Override the detected fd limit')
+    parser.add_argument('--target', metavar='HOST:PORT', help='Load-test a running nginx')
+    parser.add_argument('--sni', default='localhost')
+    parser.add_argument('--bench', nargs=2, metavar=('CERT', 'KEY'),
+                        help='Compare old vs tuned behaviour on a local stand-in server')
+    parser.add_argument('--connections', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.bench:
+        for name, result in benchmark(*args.bench, args.connections, args.concurrency).items():
+            print_load_test(name, result)
+    elif args.target:
+        host, _, port = args.target.rpartition(':')
+        for resume in (False, True):
+            result = load_test(host, int(port), args.sni, args.connections, args.concurrency, resume=resume)
+            print_load_test('resume' if resume else 'full', result)
+    else:
+        local = HostResources.local()
+        host = HostResources(args.cores or local.cores, args.memory_mb or local.memory_mb,
+                             args.nofile or local.nofile)
+        print(json.dumps(nginx_sizing(host), indent=2))
+    sys.exit(0)
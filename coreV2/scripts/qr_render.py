@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+QR Render - Render QR codes as PNG, SVG or terminal text straight from the module matrix
+"""
+
+import sys
+import zlib
+import struct
+from functools import lru_cache
+from pathlib import Path
+
+
+ERROR_LEVELS = {'L': 1, 'M': 0, 'Q': 3, 'H': 2}  # qrcode.constants values
+_DRAWERS = 'qrcode.image.styles.moduledrawers'
+
+
+def _import_qrcode():
+    """
+    Import qrcode without pulling in Pillow
+
+    `import qrcode` reaches qrcode/image/styles/moduledrawers/__init__.py,
+    which imports the PIL module drawers for backwards compatibility; the
+    matrix code only needs moduledrawers.base. That package is registered
+    first with its __init__ deferred: submodules still load from its
+    directory, and the real __init__ runs on the first attribute lookup
+    (e.g. render_pil, or anything else asking for the PIL drawers).
+    """
+    if 'qrcode' in sys.modules:
+        return sys.modules['qrcode']
+
+    import importlib.util
+
+    package = importlib.util.find_spec('qrcode')
+    if package is None:
+        raise ImportError("qrcode is not installed (pip install qrcode)")
+    directory = Path(package.origin).parent / 'image' / 'styles' / 'moduledrawers'
+    spec = importlib.util.spec_from_file_location(
+        _DRAWERS, directory / '__init__.py', submodule_search_locations=[str(directory)])
+    drawers = importlib.util.module_from_spec(spec)
+
+    def load_init(name):
+        del drawers.__getattr__
+        spec.loader.exec_module(drawers)
+        return getattr(drawers, name)
+
+    drawers.__getattr__ = load_init
+    sys.modules[_DRAWERS] = drawers
+
+    import qrcode
+    return qrcode
+
+
+@lru_cache(maxsize=64)
+def qr_matrix(data, error_correction='L', border=4):
+    """
+    Encode data into a QR module matrix
+
+    Encoding (mostly qrcode's mask search) costs far more than any renderer,
+    so the result is cached for links drawn in several formats. Treat the
+    returned rows as read-only.
+
+    Args:
+        data: Text to encode
+        error_correction: 'L', 'M', 'Q' or 'H'
+        border: Quiet-zone width in modules
+
+    Returns:
+        list: Rows of bools (True = dark), quiet zone included
+    """
+    # Imported lazily so deploy scripts that never draw a QR don't pay for it
+    qrcode = _import_qrcode()
+
+    qr = qrcode.QRCode(version=None, error_correction=ERROR_LEVELS[error_correction], border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _png_chunk(kind, payload):
+    return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+
+def render_png(matrix, box_size=10):
+    """
+    1-bit grayscale PNG, one box_size x box_size square per module
+
+    Every module row is packed once and repeated box_size times, so the
+    cost is proportional to the module count rather than the pixel count.
+    """
+    size = len(matrix) * box_size
+    dark, light = '0' * box_size, '1' * box_size
+    pad = -size % 8
+    lines = []
+    for row in matrix:
+        bits = ''.join(dark if module else light for module in row) + '1' * pad
+        lines.append((b'\x00' + int(bits, 2).to_bytes((size + pad) // 8, 'big')) * box_size)
+
+    header = struct.pack('>IIBBBBB', size, size, 1, 0, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + _png_chunk(b'IHDR', header)
+        + _png_chunk(b'IDAT', zlib.compress(b''.join(lines), 9))
+        + _png_chunk(b'IEND', b'')
+    )
+
+
+def render_svg(matrix, box_size=10):
+    """SVG with a single path; horizontal runs of dark modules become one rectangle each"""
+    size = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                path.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    pixels = size * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(path)}"/></svg>\n'
+    )
+
+
+def render_terminal(matrix, ansi=False):
+    """
+    Text QR for headless servers
+
+    Unicode mode packs two module rows per line with half blocks and assumes
+    the usual light-on-dark terminal, so the drawn cells are the light
+    modules. ANSI mode paints explicit black/white background cells and
+    works on any terminal theme.
+    """
+    if ansi:
+        cells = {True: '\x1b[40m  ', False: '\x1b[47m  '}
+        return ''.join(''.join(cells[m] for m in row) + '\x1b[0m\n' for row in matrix)
+
+    blocks = {(False, False): '█', (False, True): '▀', (True, False): '▄', (True, True): ' '}
+    rows = matrix + [[False] * len(matrix)] if len(matrix) % 2 else matrix
+    return ''.join(
+        ''.join(blocks[pair] for pair in zip(top, bottom)) + '\n'
+        for top, bottom in zip(rows[0::2], rows[1::2])
+    )
+
+
+def render_pil(data, box_size=10, border=4):
+    """The original Pillow rasteriser (needs Pillow installed); returns PNG bytes"""
+    import io
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L,
+                       box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer)
+    return buffer.getvalue()
+
+
+# format -> (file extension, renders to bytes)
+FORMATS = {
+    'png': ('png', lambda data, box_size: render_png(qr_matrix(data), box_size)),
+    'svg': ('svg', lambda data, box_size: render_svg(qr_matrix(data), box_size).encode()),
+    'terminal': ('qr.txt', lambda data, box_size: render_terminal(qr_matrix(data)).encode()),
+    'pil': ('png', lambda data, box_size: render_pil(data, box_size)),
+}
+
+
+def write_qr(data, path, fmt='png', box_size=10):
+    """
+    Render data as a QR code file
+
+    Args:
+        data: Text to encode
+        path: Output path without extension
+        fmt: 'png', 'svg', 'terminal' or 'pil'
+        box_size: Pixels per module (png/svg/pil)
+
+    Returns:
+        Path: The written file (extension added)
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown QR format '{fmt}' (choose from {', '.join(FORMATS)})")
+    extension, render = FORMATS[fmt]
+    output = Path(f"{path}.{extension}")
+    output.write_bytes(render(data, box_size))
+    return output
+
+
+def _bench_one(fmt, count, data):
+    """Run in a fresh interpreter so import cost and peak RSS belong to one renderer"""
+    import json
+    import time
+    import resource
+
+    started = time.perf_counter()
+    render = FORMATS[fmt][1]
+    render(data, 10)
+    first = time.perf_counter() - started
+
+    encode = qr_matrix.__wrapped__
+    started = time.perf_counter()
+    for _ in range(count):
+        encode(data)
+    encode_s = (time.perf_counter() - started) / count
+
+    started = time.perf_counter()
+    for _ in range(count):
+        qr_matrix.cache_clear()
+        size = len(render(data, 10))
+    per_qr = (time.perf_counter() - started) / count
+    print(json.dumps({
+        'first_ms': first * 1000,
+        'per_qr_ms': per_qr * 1000,
+        'render_ms': (per_qr - encode_s) * 1000,
+        'bytes': size,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def benchmark(count=50, data=None):
+    """
+    Compare every renderer in its own interpreter
+
+    Reports time per QR (encode + render), the render share alone, the first
+    call including imports, peak RSS and output size.
+    """
+    import sys
+    import json
+    import subprocess
+
+    data = data or ('vless://2f3c1e2a-8b4d-4c2e-9f1a-0d6b7e8c9a10@vpn.example.com:443?type=tcp'
+                    '&security=reality&pbk=Z84J2IelR9ch3k8VtlVhhs5ycBUlXA7wHBWcBrjqnAw&fp=chrome'
+                    '&sni=www.microsoft.com&sid=6ba85179e30d4fc2&flow=xtls-rprx-vision#CustomVPN-Reality')
+    baseline = subprocess.run([sys.executable, '-c',
+                               'import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'],
+                              capture_output=True, text=True).stdout.strip()
+
+    print(f"\n  {'format':<10} {'per QR':>10} {'render':>10} {'first call':>11} {'peak RSS':>10} {'output':>9}")
+    print(f"  {'(python)':<10} {'':>10} {'':>10} {'':>11} {int(baseline) / 1024:>8.1f}MB")
+    for fmt in FORMATS:
+        proc = subprocess.run([sys.executable, __file__, '--bench-one', fmt, str(count), data],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"  ✗ {fmt:<8} {proc.stderr.strip().splitlines()[-1]}")
+            continue
+        result = json.loads(proc.stdout)
+        print(f"  {fmt:<10} {result['per_qr_ms']:>8.2f}ms {result['render_ms']:>8.2f}ms {result['first_ms']:>9.1f}ms "
+              f"{result['max_rss_kb'] / 1024:>8.1f}MB {result['bytes'] / 1024:>7.1f}KB")
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    if len(sys.argv) == 5 and sys.argv[1] == '--bench-one':
+        _bench_one(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='Render a QR code without Pillow')
+    parser.add_argument('data', nargs='?', help='Text to encode')
+    parser.add_argument('--format', choices=FORMATS, default='terminal')
+    parser.add_argument('--ansi', action='store_true', help='Terminal output with ANSI colours')
+    parser.add_argument('--output', help='Output path without extension (default: print to stdout)')
+    parser.add_argument('--bench', type=int, nargs='?', const=50, metavar='COUNT',
+                        help='Compare renderers over COUNT QR codes')
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.bench, args.data)
+    elif not args.data:
+        parser.error('data is required')
+    elif args.output:
+        print(f"  ✓ {write_qr(args.data, args.output, args.format)}")
+    elif args.format == 'terminal':
+        print(render_terminal(qr_matrix(args.data), ansi=args.ansi), end='')
+    else:
+        sys.stdout.buffer.write(FORMATS[args.format][1](args.data, 10))
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Shaping - Per-tier bandwidth limits: Xray policy levels, socket marks and tc HTB classes
+"""
+
+import re
+import json
+import shlex
+
+
+# fwmark of a tier's outbound traffic: MARK_BASE + level
+MARK_BASE = 0x100
+# HTB class minor ids: 1:10 is the unshaped default, 1:<CLASS_BASE + level> a tier
+CLASS_BASE = 100
+DEFAULT_CLASS = 10
+IFB_DEVICE = 'ifb0'
+
+_RATE_RE = re.compile(r'\d+(?:\.\d+)?(?:[kmg]?bit|[kmg]?bps)', re.I)
+_SIZE_RE = re.compile(r'\d+(?:[kmg]b?|b)?', re.I)
+# Linux interface names: up to 15 characters, no whitespace or '/'
+_INTERFACE_RE = re.compile(r'[A-Za-z0-9_.:@-]{1,15}')
+
+
+class Tier:
+    def __init__(self, level, rate, ceil=None, burst='256k'):
+        """
+        Bandwidth tier for every user on one Xray policy level
+
+        Args:
+            level: Xray policy level (users.level in the user store)
+            rate: Guaranteed rate, tc syntax (e.g. '20mbit')
+            ceil: Rate the tier may borrow up to when the link is idle (default: rate)
+            burst: Bytes sent at full link speed before the rate applies (e.g. '256k')
+        """
+        if int(level) <= 0:
+            raise ValueError("Level 0 is the unshaped default; tiers start at level 1")
+        for name, value, pattern in (('rate', rate, _RATE_RE), ('ceil', ceil or rate, _RATE_RE),
+                                     ('burst', burst, _SIZE_RE)):
+            if not pattern.fullmatch(str(value)):
+                raise ValueError(f"Invalid {name} '{value}' for level {level}")
+        self.level = int(level)
+        self.rate = rate
+        self.ceil = ceil or rate
+        self.burst = burst
+
+    @property
+    def mark(self):
+        return MARK_BASE + self.level
+
+    @property
+    def classid(self):
+        return f"1:{CLASS_BASE + self.level}"
+
+    @property
+    def outbound_tag(self):
+        return f"direct-l{self.level}"
+
+    def as_dict(self):
+        return {'level': self.level, 'rate': self.rate, 'ceil': self.ceil, 'burst': self.burst}
+
+
+def parse_tiers(spec):
+    """
+    Parse "level=rate[:ceil[:burst]],..." e.g. "1=50mbit:100mbit:512k,2=10mbit"
+
+    Returns:
+        list: Tier objects ordered by level
+    """
+    tiers = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        level, _, limits = item.partition('=')
+        rate, ceil, burst = (limits.split(':') + [None, None])[:3]
+        tiers.append(Tier(int(level), rate, ceil or None, burst or '256k'))
+    return sorted(tiers, key=lambda t: t.level)
+
+
+class ShapingPlan:
+    def __init__(self, tiers, interface='eth0', link_rate='1gbit'):
+        """
+        Everything needed to shape users by policy level
+
+        Xray can't rate-limit, but a freedom outbound can mark its sockets
+        (sockopt.mark). Routing sends each tier's users to its own marked
+        outbound; tc then classifies by mark into one HTB class per tier on
+        the uplink (uploads) and, via connmark restored on ingress and an IFB
+        device, on the downlink (downloads). Each class has fq_codel, so
+        flows inside a tier share it fairly. Level 0 stays unshaped.
+
+        Marking needs CAP_NET_ADMIN and host networking (a mark doesn't
+        survive leaving a container's network namespace). The compose
+        override ConfigGenerator writes while tiers are set runs xray that
+        way; the blue/green colors always do.
+
+        Args:
+            tiers: List of Tier
+            interface: Public network interface on the VPS
+            link_rate: Uplink speed; the parent class every tier borrows from
+        """
+        if not _INTERFACE_RE.fullmatch(interface):
+            raise ValueError(f"Invalid interface '{interface}'")
+        if not _RATE_RE.fullmatch(link_rate):
+            raise ValueError(f"Invalid link rate '{link_rate}'")
+        self.tiers = sorted(tiers, key=lambda t: t.level)
+        self.interface = interface
+        self.link_rate = link_rate
+
+    # -- Xray side -------------------------------------------------------------
+
+    def tier_for(self, level):
+        for tier in self.tiers:
+            if tier.level == level:
+                return tier
+        return None
+
+    def policy_levels(self, enable_stats=False):
+        """policy.levels entries for level 0 and every tier"""
+        entry = {'statsUserUplink': True, 'statsUserDownlink': True} if enable_stats else {}
+        return {str(level): dict(entry) for level in [0] + [t.level for t in self.tiers]}
+
+    def outbounds(self):
+        return [
+            {'protocol': 'freedom', 'tag': tier.outbound_tag, 'streamSettings': {'sockopt': {'mark': tier.mark}}}
+            for tier in self.tiers
+        ]
+
+    def routing_rules(self, users):
+        """
+        One rule per tier that has users, matching them by email
+
+        Users on a level without a tier fall through to the default outbound.
+        """
+        emails = {}
+        for user in users:
+            tier = self.tier_for(int(user.get('level') or 0))
+            if tier and user.get('email'):
+                emails.setdefault(tier, []).append(user['email'])
+        return [
+            {'type': 'field', 'user': emails[tier], 'outboundTag': tier.outbound_tag}
+            for tier in self.tiers if tier in emails
+        ]
+
+    # -- kernel side -----------------------------------------------------------
+
+    def _htb(self, device):
+        commands = [
+            f"tc qdisc replace dev {device} root handle 1: htb default {DEFAULT_CLASS}",
+            f"tc class replace dev {device} parent 1: classid 1:1 htb rate {self.link_rate}",
+            f"tc class replace dev {device} parent 1:1 classid 1:{DEFAULT_CLASS} htb rate {self.link_rate}",
+            f"tc qdisc replace dev {device} parent 1:{DEFAULT_CLASS} fq_codel",
+        ]
+        for tier in self.tiers:
+            commands += [
+                f"tc class replace dev {device} parent 1:1 classid {tier.classid} htb "
+                f"rate {tier.rate} ceil {tier.ceil} burst {tier.burst} cburst {tier.burst}",
+                f"tc qdisc replace dev {device} parent {tier.classid} fq_codel",
+                f"tc filter replace dev {device} parent 1: protocol all prio {tier.level} "
+                f"handle {tier.mark} fw flowid {tier.classid}",
+            ]
+        return commands
+
+    def commands(self):
+        """
+        Idempotent commands that install the plan (run as root)
+
+        `replace` everywhere, so re-applying after a tier change updates the
+        classes in place instead of failing or duplicating them.
+        """
+        mark_rule = "OUTPUT -m mark ! --mark 0 -j CONNMARK --save-mark"
+        commands = [
+            "modprobe ifb numifbs=1",
+            f"ip link set dev {IFB_DEVICE} up",
+            # Copy each marked socket's mark to its connection, so replies can be classified
+            f"iptables -t mangle -C {mark_rule} 2>/dev/null || iptables -t mangle -A {mark_rule}",
+        ]
+        commands += self._htb(self.interface)
+        commands += [
+            f"tc qdisc replace dev {self.interface} handle ffff: ingress",
+            f"tc filter replace dev {self.interface} parent ffff: protocol all prio 1 matchall "
+            f"action connmark action mirred egress redirect dev {IFB_DEVICE}",
+        ]
+        commands += self._htb(IFB_DEVICE)
+        return commands
+
+    def teardown_commands(self):
+        return [
+            f"tc qdisc del dev {self.interface} root 2>/dev/null || true",
+            f"tc qdisc del dev {self.interface} ingress 2>/dev/null || true",
+            f"tc qdisc del dev {IFB_DEVICE} root 2>/dev/null || true",
+        ]
+
+    def apply(self, run, sudo=True):
+        """
+        Run commands() through `run`
+
+        Args:
+            run: Callable(command) -> (stdout, stderr, code), e.g. a Deployer
+                 command or RecordingRunner
+            sudo: Prefix each command with sudo
+
+        Returns:
+            list: (command, stderr) for every command that failed
+        """
+        failed = []
+        for command in self.commands():
+            _, stderr, code = run(f"sudo sh -c {shlex.quote(command)}" if sudo else command)
+            if code != 0:
+                failed.append((command, stderr.strip()))
+        return failed
+
+    def verify(self, run):
+        """
+        Compare the live tc state with the plan
+
+        Returns:
+            list: Problems (empty when every tier class and filter is active)
+        """
+        problems = []
+        for device in (self.interface, IFB_DEVICE):
+            stdout, _, code = run(f"tc class show dev {device}")
+            if code != 0:
+                problems.append(f"{device}: tc class show failed")
+                continue
+            classes = {m.group(1): m.group(2) for m in re.finditer(r'class htb (\S+) .*?rate (\S+)', stdout)}
+            for tier in self.tiers:
+                if tier.classid not in classes:
+                    problems.append(f"{device}: class {tier.classid} (level {tier.level}) missing")
+                elif not _same_rate(classes[tier.classid], tier.rate):
+                    problems.append(f"{device}: class {tier.classid} rate {classes[tier.classid]}, expected {tier.rate}")
+
+            stdout, _, _ = run(f"tc filter show dev {device} parent 1:")
+            for tier in self.tiers:
+                if not re.search(rf'handle {tier.mark:#x}\b.*?classid {tier.classid}\b|'
+                                 rf'handle {tier.mark}\b.*?flowid {tier.classid}\b', stdout, re.S):
+                    problems.append(f"{device}: no fw filter for mark {tier.mark} → {tier.classid}")
+
+        stdout, _, _ = run(f"tc filter show dev {self.interface} parent ffff:")
+        if f"redirect dev {IFB_DEVICE}" not in stdout and f"to device {IFB_DEVICE}" not in stdout:
+            problems.append(f"{self.interface}: ingress is not redirected to {IFB_DEVICE}")
+        return problems
+
+
+def shaping_from_config(config):
+    """
+    ShapingPlan from SHAPING_TIERS/SHAPING_INTERFACE/SHAPING_LINK_RATE, or None
+
+    Raises:
+        ValueError: SHAPING_TIERS, SHAPING_INTERFACE or SHAPING_LINK_RATE is malformed
+    """
+    if not config.get('SHAPING_TIERS'):
+        return None
+    return ShapingPlan(parse_tiers(config['SHAPING_TIERS']),
+                       interface=config.get('SHAPING_INTERFACE') or 'eth0',
+                       link_rate=config.get('SHAPING_LINK_RATE') or '1gbit')
+
+
+_UNITS = {'': 1, 'k': 1e3, 'm': 1e6, 'g': 1e9}
+
+
+def _bits(rate):
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([kmg]?)(bit|bps)', rate.lower())
+    if not match:
+        return None
+    value = float(match.group(1)) * _UNITS[match.group(2)]
+    return value * 8 if match.group(3) == 'bps' else value
+
+
+def _same_rate(shown, expected):
+    """tc prints rates in its own units (20Mbit for 20mbit)"""
+    shown_bits, expected_bits = _bits(shown), _bits(expected)
+    return shown_bits is not None and expected_bits is not None and abs(shown_bits - expected_bits) < 1
+
+
+class RecordingRunner:
+    def __init__(self):
+        """
+        Fake command runner: records commands and answers `tc ... show` from them
+
+        Stands in for Deployer/Verifier runners, so a plan can be applied and
+        verified without root or a VPS.
+        """
+        self.commands = []
+        self.classes = {}
+        self.filters = {}
+        self.ingress = {}
+
+    def __call__(self, command, check=False):
+        self.commands.append(command)
+        words = shlex.split(command)
+        inner = words[3] if words[:3] == ['sudo', 'sh', '-c'] else command
+
+        match = re.match(r'tc class replace dev (\S+) parent \S+ classid (\S+) htb rate (\S+)', inner)
+        if match:
+            self.classes.setdefault(match.group(1), {})[match.group(2)] = match.group(3)
+        match = re.match(r'tc filter replace dev (\S+) parent 1: .*handle (\d+) fw flowid (\S+)', inner)
+        if match:
+            self.filters.setdefault(match.group(1), []).append(
+                f"filter parent 1: protocol all pref 1 fw chain 0 handle {int(match.group(2)):#x} classid {match.group(3)}")
+        match = re.match(r'tc filter replace dev (\S+) parent ffff: .*redirect dev (\S+)', inner)
+        if match:
+            self.ingress[match.group(1)] = f"action order 2: mirred (Egress Redirect to device {match.group(2)}) stolen"
+
+        match = re.match(r'tc class show dev (\S+)', inner)
+        if match:
+            classes = self.classes.get(match.group(1), {})
+            return ''.join(f"class htb {cid} parent 1:1 prio 0 rate {rate} ceil {rate}\n"
+                           for cid, rate in classes.items()), '', 0
+        match = re.match(r'tc filter show dev (\S+) parent (\S+)', inner)
+        if match:
+            if match.group(2) == 'ffff:':
+                return self.ingress.get(match.group(1), ''), '', 0
+            return '\n'.join(self.filters.get(match.group(1), [])), '', 0
+        return '', '', 0
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show the shaping plan for a tier spec (dry run)')
+    parser.add_argument('tiers', help='level=rate[:ceil[:burst]],... e.g. 1=50mbit:100mbit:512k,2=10mbit')
+    parser.add_argument('--interface', default='eth0')
+    parser.add_argument('--link-rate', default='1gbit')
+    parser.add_argument('--xray', action='store_true', help='Print the Xray outbounds instead of tc commands')
+    args = parser.parse_args()
+
+    try:
+        plan = ShapingPlan(parse_tiers(args.tiers), args.interface, args.link_rate)
+    except ValueError as e:
+        print(f"  ✗ {e}")
+        sys.exit(1)
+
+    if args.xray:
+        print(json.dumps({'policy': {'levels': plan.policy_levels()}, 'outbounds': plan.outbounds()}, indent=2))
+        sys.exit(0)
+
+    runner = RecordingRunner()
+    plan.apply(runner, sudo=False)
+    print('\n'.join(runner.commands))
+    problems = plan.verify(runner)
+    print(f"\n  {'✓' if not problems else '✗'} Verified against the recorded rules" +
+          ''.join(f"\n    {p}" for p in problems))
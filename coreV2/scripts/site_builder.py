@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Site Builder - Minify, fingerprint and precompress the camouflage website
+"""
+
+import os
+import re
+import gzip
+import json
+import hashlib
+from pathlib import Path
+
+
+HASH_LENGTH = 10
+# Below this a compressed variant rarely pays for the extra file (nginx's gzip_min_length idea)
+COMPRESS_MIN_BYTES = 256
+# Local CSS/JS up to this size is inlined; larger inline scripts move to a cached file
+INLINE_LIMIT = 4096
+TEXT_TYPES = {'.html', '.css', '.js', '.svg', '.json', '.txt', '.xml'}
+
+# name.0123456789.ext - nginx.conf.j2 marks these immutable
+HASHED_NAME_RE = r'\.[0-9a-f]{%d}\.' % HASH_LENGTH
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(rel_path, data):
+    path = Path(rel_path)
+    return str(path.with_name(f"{path.stem}.{content_hash(data)}{path.suffix}"))
+
+
+# -- minifiers -------------------------------------------------------------------
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    """
+    Conservative: drops indentation, blank lines and whole-line // comments
+
+    Line breaks are kept so automatic semicolon insertion still applies;
+    multi-line template literals would lose their indentation.
+    """
+    lines = (line.strip() for line in js.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+_RAW_BLOCK_RE = re.compile(r'(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2>)', re.S | re.I)
+
+
+def minify_html(html, on_script=None):
+    """
+    Minify markup plus inline <style> and <script> blocks
+
+    Whitespace between tags is only dropped when it spans a line break
+    (source indentation), so spaces between inline elements survive.
+
+    Args:
+        html: Page source
+        on_script: Optional callable(open_tag, minified_js) returning the
+            replacement markup for an inline script, e.g. to move it out
+
+    Returns:
+        str: Minified page
+    """
+    blocks = []
+
+    def stash(match):
+        open_tag, tag, body, close_tag = match.groups()
+        tag = tag.lower()
+        if tag == 'style':
+            block = open_tag + minify_css(body) + close_tag
+        elif tag == 'script' and 'src=' not in open_tag.lower():
+            body = minify_js(body)
+            block = on_script(open_tag, body) if on_script else None
+            block = block or open_tag + body + close_tag
+        else:
+            block = match.group(0)
+        blocks.append(block)
+        # Looks like a tag, so the whitespace rules below treat it as one
+        return f"<\x00{len(blocks) - 1}\x00>"
+
+    html = _RAW_BLOCK_RE.sub(stash, html)
+    html = re.sub(r'<!--(?!\[if).*?-->', '', html, flags=re.S)
+    html = re.sub(r'>\s*\n\s*<', '><', html)
+    html = re.sub(r'\s+', ' ', html).strip()
+    return re.sub(r'<\x00(\d+)\x00>', lambda m: blocks[int(m.group(1))], html)
+
+
+# -- build -----------------------------------------------------------------------
+
+class SiteBuilder:
+    def __init__(self, sources, output_dir, manifest_path, brotli_quality=11):
+        """
+        Build the static site into output_dir
+
+        HTML pages keep their names (nginx serves them with no-cache); every
+        other asset gets a content-hashed name so it can be cached forever.
+        Each output also gets .gz and, if the brotli module is installed,
+        .br siblings for nginx's gzip_static/brotli_static.
+
+        Args:
+            sources: dict of site-relative name -> source Path
+            output_dir: Web root to write (e.g. generated/www)
+            manifest_path: Build manifest; keep it outside the web root
+            brotli_quality: 0-11
+        """
+        self.sources = {name: Path(path) for name, path in sources.items()}
+        self.output_dir = Path(output_dir)
+        self.brotli_quality = brotli_quality
+        self.manifest_path = Path(manifest_path)
+        try:
+            self.manifest = json.loads(self.manifest_path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.manifest = {}
+        self.stats = {'built': 0, 'skipped': 0, 'removed': 0, 'bytes': 0, 'gzip_bytes': 0, 'br_bytes': 0}
+
+    @staticmethod
+    def brotli():
+        """The optional brotli module, or None"""
+        try:
+            import brotli
+        except ImportError:
+            return None
+        return brotli
+
+    def _fresh(self, name, key):
+        entry = self.manifest.get(name)
+        return (entry is not None and entry['key'] == key
+                and all((self.output_dir / output).exists() for output in entry['outputs']))
+
+    def _write(self, rel_path, data):
+        """Write one output plus its precompressed variants; returns every file written"""
+        path = self.output_dir / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        written = [rel_path]
+        self.stats['bytes'] += len(data)
+        if len(data) < COMPRESS_MIN_BYTES or Path(rel_path).suffix not in TEXT_TYPES:
+            return written
+
+        # mtime=0 keeps the .gz byte-identical across builds
+        compressed = {'gz': gzip.compress(data, 9, mtime=0)}
+        brotli = self.brotli()
+        if brotli:
+            compressed['br'] = brotli.compress(data, quality=self.brotli_quality)
+        for extension, payload in compressed.items():
+            if len(payload) < len(data):
+                Path(f"{path}.{extension}").write_bytes(payload)
+                written.append(f"{rel_path}.{extension}")
+                self.stats['gzip_bytes' if extension == 'gz' else 'br_bytes'] += len(payload)
+        return written
+
+    @staticmethod
+    def asset_data(name, data):
+        """What a non-HTML asset is served as (minified if CSS/JS)"""
+        suffix = Path(name).suffix
+        if suffix == '.css':
+            return minify_css(data.decode()).encode()
+        if suffix == '.js':
+            return minify_js(data.decode()).encode()
+        return data
+
+    def _build_page(self, name, html, assets):
+        """Inline small local CSS/JS, point the rest at hashed names, move big inline scripts out"""
+        directory = Path(name).parent
+        outputs = []
+
+        def local(ref):
+            ref = ref.split('?')[0].split('#')[0]
+            if '://' in ref or ref.startswith(('//', 'data:')):
+                return None
+            rel = os.path.normpath(ref.lstrip('/') if ref.startswith('/') else str(directory / ref))
+            return rel if rel in assets else None
+
+        def inline(match):
+            tag, ref = match.group(0), match.group(2)
+            rel = local(ref)
+            if rel is None:
+                return tag
+            data = self.sources[rel].read_bytes()
+            if len(data) <= INLINE_LIMIT and rel.endswith('.css') and match.group(1) == 'href':
+                return f"<style>{minify_css(data.decode())}</style>"
+            if len(data) <= INLINE_LIMIT and rel.endswith('.js') and match.group(1) == 'src':
+                return f"<script>{minify_js(data.decode())}</script>"
+            return tag.replace(ref, '/' + assets[rel])
+
+        html = re.sub(r'<link\b[^>]*\brel=["\']?stylesheet[^>]*\b(href)=["\']([^"\']+)["\'][^>]*>', inline, html)
+        html = re.sub(r'<script\b[^>]*\b(src)=["\']([^"\']+)["\'][^>]*>\s*</script>', inline, html)
+        # Other references (images, icons, downloads) just follow the renamed files
+        html = re.sub(r'\b(src|href)=["\']([^"\']+)["\']', lambda m: (
+            m.group(0).replace(m.group(2), '/' + assets[local(m.group(2))]) if local(m.group(2)) else m.group(0)
+        ), html)
+
+        def externalize(open_tag, body):
+            if len(body) <= INLINE_LIMIT:
+                return None
+            data = body.encode()
+            script = str(directory / f"{Path(name).stem}.{content_hash(data)}.js")
+            outputs.extend(self._write(os.path.normpath(script), data))
+            # Scripts that ran at the end of <body> behave the same deferred
+            return f'<script src="/{os.path.normpath(script)}" defer></script>'
+
+        html = minify_html(html, on_script=externalize)
+        outputs.extend(self._write(name, html.encode()))
+        return outputs
+
+    def build(self, force=False):
+        """
+        Build every source, redoing only those whose inputs changed
+
+        An asset's key is its content hash. A page's key also covers the
+        asset names it links to, so changing a stylesheet rebuilds the pages
+        that inline or reference it. Outputs of the previous build that are
+        no longer produced are deleted.
+
+        Returns:
+            dict: built/skipped/removed counts and output byte totals
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        pages = {name: path for name, path in self.sources.items() if path.suffix == '.html'}
+        contents = {name: path.read_bytes() for name, path in self.sources.items()}
+        served = {name: self.asset_data(name, contents[name]) for name in self.sources if name not in pages}
+        # Named after the served bytes, so a comment-only edit keeps the cached URL
+        assets = {name: hashed_name(name, data) for name, data in served.items()}
+        settings = f"{INLINE_LIMIT}:{COMPRESS_MIN_BYTES}:{self.brotli() is not None}"
+
+        manifest = {}
+        for name in list(assets) + list(pages):
+            digest = hashlib.sha256(contents[name])
+            digest.update(settings.encode())
+            if name in pages:
+                digest.update(json.dumps(assets, sort_keys=True).encode())
+            key = digest.hexdigest()
+
+            if not force and self._fresh(name, key):
+                manifest[name] = self.manifest[name]
+                self.stats['skipped'] += 1
+                continue
+            if name in pages:
+                outputs = self._build_page(name, contents[name].decode(), assets)
+            else:
+                outputs = self._write(assets[name], served[name])
+            manifest[name] = {'key': key, 'outputs': outputs}
+            self.stats['built'] += 1
+
+        current = {output for entry in manifest.values() for output in entry['outputs']}
+        for entry in self.manifest.values():
+            for output in entry['outputs']:
+                if output not in current and (self.output_dir / output).exists():
+                    (self.output_dir / output).unlink()
+                    self.stats['removed'] += 1
+
+        self.manifest = manifest
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(manifest, indent=1))
+        os.replace(tmp, self.manifest_path)
+        return self.stats
+
+
+def site_sources(config_dir):
+    """
+    configs/index.html plus everything under configs/site/
+
+    Returns:
+        dict: site-relative name -> source Path
+    """
+    config_dir = Path(config_dir)
+    sources = {}
+    site_dir = config_dir / 'site'
+    if site_dir.is_dir():
+        for path in sorted(site_dir.rglob('*')):
+            if path.is_file():
+                sources[str(path.relative_to(site_dir))] = path
+    if (config_dir / 'index.html').exists():
+        sources['index.html'] = config_dir / 'index.html'
+    return sources
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    config_dir = Path(sys.argv[1] if len(sys.argv) > 1 else '../configs')
+    output_dir = Path(sys.argv[2] if len(sys.argv) > 2 else '../generated/www')
+
+    started = time.perf_counter()
+    builder = SiteBuilder(site_sources(config_dir), output_dir, output_dir.parent / '.cache' / 'site.json')
+    stats = builder.build(force='--force' in sys.argv)
+    original = sum(path.stat().st_size for path in site_sources(config_dir).values())
+    print(f"  ✓ {stats['built']} built, {stats['skipped']} unchanged, {stats['removed']} removed "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+    if stats['built']:
+        print(f"  Source {original} B → minified {stats['bytes']} B, gzip {stats['gzip_bytes']} B"
+              + (f", brotli {stats['br_bytes']} B" if stats['br_bytes'] else ''))
+    if SiteBuilder.brotli() is None:
+        print("  Install the 'brotli' package to also write .br files")
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Stats Collector - Poll Xray traffic counters, aggregate per user and roll up to SQLite
+"""
+
+import json
+import time
+import sqlite3
+import subprocess
+from array import array
+from pathlib import Path
+from urllib.request import urlopen
+
+
+UPLINK = 0
+DOWNLINK = 1
+
+
+def parse_stat_name(name):
+    """
+    Split an Xray counter name
+
+    'user>>>alice@vpn>>>traffic>>>uplink' -> ('user', 'alice@vpn', UPLINK)
+
+    Returns:
+        tuple or None: (kind, name, direction) for traffic counters
+    """
+    parts = name.split('>>>')
+    if len(parts) != 4 or parts[2] != 'traffic':
+        return None
+    direction = UPLINK if parts[3] == 'uplink' else DOWNLINK if parts[3] == 'downlink' else None
+    if direction is None:
+        return None
+    return parts[0], parts[1], direction
+
+
+def parse_statsquery(payload):
+    """
+    Parse `xray api statsquery` JSON output into {counter_name: value}
+
+    Args:
+        payload: str/bytes JSON like {"stat": [{"name": ..., "value": ...}]}
+    """
+    data = json.loads(payload) if payload else {}
+    return {item['name']: int(item.get('value', 0)) for item in data.get('stat') or []}
+
+
+class CommandStatsSource:
+    def __init__(self, api_server='127.0.0.1:10085', command_prefix=None, timeout=30):
+        """
+        Query all counters in one batch via `xray api statsquery`
+
+        Args:
+            api_server: Address of the StatsService API inbound
+            command_prefix: Argument list prepended to the xray call, e.g.
+                ['ssh', 'customvpn', 'docker', 'exec', 'xray'] (default: run locally;
+                see over_ssh for the VPS)
+            timeout: Seconds before the query is abandoned
+        """
+        self.api_server = api_server
+        self.command_prefix = list(command_prefix or [])
+        self.timeout = timeout
+
+    @classmethod
+    def over_ssh(cls, ssh_alias, base_dir='/home/shaun/vpn', timeout=30):
+        """
+        Query the xray container serving the VPS via `ssh <alias> docker exec`
+
+        The container and its API port are read from the blue/green state
+        file on every query (see blue_green.active_xray_shell), so polling
+        follows swaps; ssh hands the joined words to the remote shell.
+        """
+        from blue_green import active_xray_shell
+
+        prefix = ['ssh', ssh_alias, f"{active_xray_shell(base_dir)};", 'docker', 'exec', '"$XRAY"']
+        return cls('127.0.0.1:$XRAY_API', command_prefix=prefix, timeout=timeout)
+
+    def query(self, reset=True):
+        """
+        Fetch every counter in a single call (empty pattern matches all)
+
+        Returns:
+            tuple: ({counter_name: value}, values_are_deltas)
+        """
+        # '-pattern=' rather than '-pattern', '': ssh joins its arguments with spaces, which
+        # would drop the empty value and make -reset the pattern
+        cmd = self.command_prefix + ['xray', 'api', 'statsquery', f'--server={self.api_server}', '-pattern=']
+        if reset:
+            cmd.append('-reset')
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=self.timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"statsquery failed: {result.stderr.strip()}")
+        return parse_statsquery(result.stdout), reset
+
+
+class HttpStatsSource:
+    def __init__(self, url, timeout=10):
+        """
+        Read counters from an HTTP endpoint returning statsquery-format JSON
+
+        Used for a local fake endpoint in development, or a sidecar that
+        proxies the gRPC API. A `reset=1` query parameter asks for reset-on-read.
+
+        Args:
+            url: Endpoint URL
+            timeout: Request timeout in seconds
+        """
+        self.url = url
+        self.timeout = timeout
+
+    def query(self, reset=True):
+        url = self.url + ('&' if '?' in self.url else '?') + f"reset={int(reset)}"
+        with urlopen(url, timeout=self.timeout) as response:
+            return parse_statsquery(response.read()), reset
+
+
+class TrafficAggregator:
+    def __init__(self, bucket_seconds=60, buckets=30):
+        """
+        Per-entity traffic counters in time-bucketed flat arrays
+
+        Each (kind, name) entity owns one row of `buckets` slots in two flat
+        array('Q') columns (uplink/downlink), so 50k users at 30 buckets cost
+        ~24 MB with no per-sample Python objects.
+
+        Args:
+            bucket_seconds: Width of a time bucket
+            buckets: Slots kept in memory per entity (ring)
+        """
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.index = {}
+        self.keys = []
+        self.columns = (array('Q'), array('Q'))
+        self.slot_start = array('q', [-1] * buckets)
+        self.pending = []
+        self._zero_row = array('Q', bytes(8 * buckets))
+
+    def _row(self, kind, name):
+        key = (kind, name)
+        row = self.index.get(key)
+        if row is None:
+            row = self.index[key] = len(self.keys)
+            self.keys.append(key)
+            for column in self.columns:
+                column.extend(self._zero_row)
+        return row
+
+    def _slot(self, timestamp):
+        bucket_start = int(timestamp // self.bucket_seconds) * self.bucket_seconds
+        slot = (bucket_start // self.bucket_seconds) % self.buckets
+        if self.slot_start[slot] != bucket_start:
+            if self.slot_start[slot] >= 0:
+                # Ring wrapped before a flush: move the old bucket to pending
+                self.pending.extend(self._collect_slot(slot))
+            self.slot_start[slot] = bucket_start
+        return slot
+
+    def _collect_slot(self, slot):
+        """Collect and zero every non-empty counter in one slot"""
+        up, down = self.columns
+        start = self.slot_start[slot]
+        rows = []
+        for row in range(len(self.keys)):
+            i = row * self.buckets + slot
+            if up[i] or down[i]:
+                kind, name = self.keys[row]
+                rows.append((kind, name, start, up[i], down[i]))
+                up[i] = down[i] = 0
+        return rows
+
+    def add_counters(self, counters, timestamp=None):
+        """
+        Add a batch of delta counters {counter_name: bytes}
+
+        Returns:
+            int: Number of traffic counters applied
+        """
+        slot = self._slot(time.time() if timestamp is None else timestamp)
+        applied = 0
+        for counter_name, value in counters.items():
+            if not value:
+                continue
+            parsed = parse_stat_name(counter_name)
+            if parsed is None:
+                continue
+            kind, name, direction = parsed
+            self.columns[direction][self._row(kind, name) * self.buckets + slot] += value
+            applied += 1
+        return applied
+
+    def drain_completed(self, now=None, include_current=False):
+        """
+        Remove and return all buckets that ended before `now`
+
+        Args:
+            now: Reference time (default: time.time())
+            include_current: Also drain the still-open bucket (shutdown)
+
+        Returns:
+            list: (kind, name, bucket_start, uplink, downlink) tuples
+        """
+        now = time.time() if now is None else now
+        current = int(now // self.bucket_seconds) * self.bucket_seconds
+        if include_current:
+            current += self.bucket_seconds
+        rows, self.pending = self.pending, []
+        for slot in range(self.buckets):
+            if 0 <= self.slot_start[slot] < current:
+                rows.extend(self._collect_slot(slot))
+                self.slot_start[slot] = -1
+        return rows
+
+    def totals(self, kind='user'):
+        """
+        In-memory (not yet flushed) totals per entity
+
+        Returns:
+            dict: name -> (uplink, downlink)
+        """
+        up, down = self.columns
+        out = {}
+        for row, (row_kind, name) in enumerate(self.keys):
+            if row_kind == kind:
+                base = row * self.buckets
+                out[name] = (sum(up[base:base + self.buckets]), sum(down[base:base + self.buckets]))
+        return out
+
+
+class RollupStore:
+    def __init__(self, db_path):
+        """
+        SQLite rollups of bucketed traffic
+
+        Args:
+            db_path: Database file (':memory:' for tests)
+        """
+        self.db_path = str(db_path)
+        if self.db_path != ':memory:':
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS traffic (
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                uplink INTEGER NOT NULL DEFAULT 0,
+                downlink INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (kind, name, bucket_start)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_traffic_time ON traffic (kind, bucket_start);
+        """)
+
+    def write(self, rows):
+        """Upsert rollup rows in one transaction"""
+        if not rows:
+            return 0
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO traffic (kind, name, bucket_start, uplink, downlink)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (kind, name, bucket_start) DO UPDATE SET
+                    uplink = uplink + excluded.uplink,
+                    downlink = downlink + excluded.downlink
+            """, rows)
+        return len(rows)
+
+    def top(self, kind='user', since=0, limit=20):
+        """
+        Heaviest entities since a timestamp
+
+        Returns:
+            list: (name, uplink, downlink) ordered by total bytes
+        """
+        return self.conn.execute("""
+            SELECT name, SUM(uplink) AS up, SUM(downlink) AS down
+            FROM traffic WHERE kind = ? AND bucket_start >= ?
+            GROUP BY name ORDER BY up + down DESC LIMIT ?
+        """, (kind, since, limit)).fetchall()
+
+    def history(self, name, kind='user', since=0):
+        """Per-bucket (bucket_start, uplink, downlink) rows for one entity"""
+        return self.conn.execute("""
+            SELECT bucket_start, uplink, downlink FROM traffic
+            WHERE kind = ? AND name = ? AND bucket_start >= ? ORDER BY bucket_start
+        """, (kind, name, since)).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class StatsCollector:
+    def __init__(self, source, store, aggregator=None, interval=60):
+        """
+        Initialize the collector
+
+        Args:
+            source: CommandStatsSource / HttpStatsSource (anything with query(reset))
+            store: RollupStore receiving completed buckets
+            aggregator: TrafficAggregator (default: 1-minute buckets)
+            interval: Seconds between polls
+        """
+        self.source = source
+        self.store = store
+        self.aggregator = aggregator or TrafficAggregator()
+        self.interval = interval
+        self._previous = {}
+
+    def _to_deltas(self, counters):
+        # Sources without reset-on-read report cumulative values
+        deltas = {}
+        for name, value in counters.items():
+            previous = self._previous.get(name, 0)
+            deltas[name] = value - previous if value >= previous else value
+        self._previous = counters
+        return deltas
+
+    def poll_once(self, now=None):
+        """
+        Fetch all counters in one batch and aggregate them
+
+        Returns:
+            int: Traffic counters applied
+        """
+        counters, is_delta = self.source.query(reset=True)
+        if not is_delta:
+            counters = self._to_deltas(counters)
+        return self.aggregator.add_counters(counters, now)
+
+    def flush(self, now=None, final=False):
+        """Persist completed buckets (all buckets when final); returns rows written"""
+        return self.store.write(self.aggregator.drain_completed(now, include_current=final))
+
+    def run(self, rounds=None):
+        """Poll every `interval` seconds, flushing completed buckets as they close"""
+        done = 0
+        while rounds is None or done < rounds:
+            started = time.monotonic()
+            try:
+                applied = self.poll_once()
+                written = self.flush()
+                print(f"  ✓ {applied} counters, {written} rollup rows")
+            except (OSError, RuntimeError, subprocess.TimeoutExpired, ValueError) as e:
+                print(f"  ✗ Stats poll failed: {e}")
+            done += 1
+            if rounds is None or done < rounds:
+                time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Collect Xray per-user traffic stats')
+    parser.add_argument('--db', default='stats/traffic.db')
+    parser.add_argument('--api-server', default='127.0.0.1:10085')
+    parser.add_argument('--ssh-alias', help='Query via `ssh <alias> docker exec <active xray> ...`')
+    parser.add_argument('--remote-dir', default='/home/shaun/vpn', help='Deployment directory on the VPS')
+    parser.add_argument('--url', help='Read from an HTTP statsquery-format endpoint instead')
+    parser.add_argument('--interval', type=float, default=60)
+    parser.add_argument('--top', type=int, metavar='N', help='Print the top N users and exit')
+    args = parser.parse_args()
+
+    store = RollupStore(args.db)
+
+    if args.top:
+        for name, up, down in store.top(limit=args.top):
+            print(f"  {name:<40} ↑{up / 1e6:>10.1f} MB  ↓{down / 1e6:>10.1f} MB")
+    else:
+        if args.url:
+            source = HttpStatsSource(args.url)
+        elif args.ssh_alias:
+            source = CommandStatsSource.over_ssh(args.ssh_alias, args.remote_dir)
+        else:
+            source = CommandStatsSource(args.api_server)
+
+        collector = StatsCollector(source, store, interval=args.interval)
+        try:
+            collector.run()
+        except KeyboardInterrupt:
+            collector.flush(final=True)
+            print("\nCollector stopped.")
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Subscription Server - Cached per-user subscription documents over asyncio HTTP
+"""
+
+import gzip
+import hmac
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+from client_formats import RENDERERS, ServerProfile
+
+
+GZIP_MIN_BYTES = 256
+MAX_HEADER_LINES = 64
+
+
+def user_token(secret, user_uuid):
+    """Stable, unguessable subscription token for a user"""
+    return hmac.new(secret.encode(), user_uuid.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+class CachedDocument:
+    __slots__ = ('body', 'gzipped', 'etag', 'gzip_etag', 'content_type')
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.gzipped = gzip.compress(body, 6) if len(body) >= GZIP_MIN_BYTES else None
+        digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+        # Each encoding is its own representation, so it gets its own validator
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gz"'
+        self.content_type = content_type
+
+
+class SubscriptionServer:
+    def __init__(self, store, server_profile, secret, refresh_interval=5.0, cache_size=100000, traffic=None):
+        """
+        Initialize the subscription server
+
+        Args:
+            store: UserStore with the users
+            server_profile: ServerProfile (domain, SNI, public key...)
+            secret: HMAC secret used to derive per-user tokens
+            refresh_interval: Seconds between store revision checks
+            cache_size: Maximum cached documents (LRU)
+            traffic: stats_collector.RollupStore with per-user usage for the
+                subscription-userinfo header (default: the header only carries the quota)
+        """
+        self.store = store
+        self.server = server_profile
+        self.secret = secret
+        self.refresh_interval = refresh_interval
+        self.cache_size = cache_size
+        self.traffic = traffic
+
+        self.cache = OrderedDict()
+        self.tokens = {}
+        self.users = {}
+        self.usage = {}
+        self.revision = -1
+        self.stats = {'requests': 0, 'hits': 0, 'misses': 0, 'not_modified': 0}
+
+    # -- data ----------------------------------------------------------------
+
+    def load(self):
+        """Full (re)load of the token index from the store"""
+        self.tokens.clear()
+        self.users.clear()
+        self.cache.clear()
+        for user in self.store.active_users():
+            self._index(user)
+        self.revision = self.store.revision
+        self.refresh_usage()
+
+    def _index(self, user):
+        token = user_token(self.secret, user['uuid'])
+        self.tokens[token] = user['uuid']
+        self.users[user['uuid']] = user
+        return token
+
+    def refresh(self):
+        """
+        Apply store changes since the last refresh, dropping affected cache entries
+
+        Returns:
+            int: Number of users changed
+        """
+        revision = self.store.revision
+        if revision == self.revision:
+            return 0
+        changed = self.store.changed_since(self.revision)
+        for user in changed:
+            token = user_token(self.secret, user['uuid'])
+            for fmt in RENDERERS:
+                self.cache.pop((token, fmt), None)
+            if user['deleted'] or not user['enabled']:
+                self.tokens.pop(token, None)
+                self.users.pop(user['uuid'], None)
+            else:
+                self._index(user)
+        self.revision = revision
+        return len(changed)
+
+    def refresh_usage(self):
+        """Reload per-user (uplink, downlink) totals from the traffic rollups"""
+        if self.traffic is not None:
+            self.usage = {name: (up, down) for name, up, down in self.traffic.top('user', limit=-1)}
+
+    def userinfo(self, token):
+        """
+        subscription-userinfo header line for a token ('' without a quota)
+
+        Understood by Clash/Shadowrocket/sing-box GUIs. Usage changes between
+        renders, so the line is built per response rather than cached.
+        """
+        user = self.users.get(self.tokens.get(token))
+        if not user or not user.get('quota_bytes'):
+            return ''
+        fields = []
+        if self.traffic is not None:
+            upload, download = self.usage.get(user['email'], (0, 0))
+            fields = [f"upload={upload}", f"download={download}"]
+        fields.append(f"total={user['quota_bytes']}")
+        return f"subscription-userinfo: {'; '.join(fields)}\r\n"
+
+    def precompute(self, formats=('base64',)):
+        """Render documents for every user ahead of the first request"""
+        for token in list(self.tokens):
+            for fmt in formats:
+                self.document(token, fmt)
+
+    def document(self, token, fmt):
+        """
+        Cached document for a token/format (rendered on miss)
+
+        Returns:
+            CachedDocument or None: None for unknown tokens
+        """
+        key = (token, fmt)
+        doc = self.cache.get(key)
+        if doc is not None:
+            self.cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return doc
+
+        user_uuid = self.tokens.get(token)
+        if user_uuid is None:
+            return None
+        user = self.users[user_uuid]
+        render, content_type = RENDERERS[fmt]
+
+        doc = CachedDocument(render(self.server, user).encode(), content_type)
+        self.cache[key] = doc
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        self.stats['misses'] += 1
+        return doc
+
+    # -- HTTP ----------------------------------------------------------------
+
+    @staticmethod
+    def _response(status, headers='', body=b'', keep_alive=True):
+        head = (
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"{headers}\r\n"
+        )
+        return head.encode() + body
+
+    def handle_request(self, method, target, headers, keep_alive=True):
+        """
+        Build the raw response for one request
+
+        Routes: GET /sub/<token>?format=base64|clash|singbox|xray (or /sub/<token>/<format>)
+
+        Args:
+            keep_alive: The connection stays open after this response
+        """
+        self.stats['requests'] += 1
+        if method not in ('GET', 'HEAD'):
+            return self._response('405 Method Not Allowed', keep_alive=keep_alive)
+
+        url = urlsplit(target)
+        parts = [p for p in url.path.split('/') if p]
+        if url.path == '/healthz':
+            return self._response('200 OK', 'Content-Type: text/plain\r\n', b'ok\n', keep_alive)
+        if len(parts) not in (2, 3) or parts[0] != 'sub':
+            return self._response('404 Not Found', keep_alive=keep_alive)
+
+        fmt = parts[2] if len(parts) == 3 else parse_qs(url.query).get('format', ['base64'])[0]
+        if fmt not in RENDERERS:
+            return self._response('400 Bad Request', 'Content-Type: text/plain\r\n', b'unknown format\n', keep_alive)
+
+        doc = self.document(parts[1], fmt)
+        if doc is None:
+            return self._response('404 Not Found', keep_alive=keep_alive)
+
+        body, etag, encoding = doc.body, doc.etag, ''
+        if doc.gzipped is not None and 'gzip' in headers.get('accept-encoding', ''):
+            body, etag, encoding = doc.gzipped, doc.gzip_etag, 'Content-Encoding: gzip\r\n'
+
+        common = f"ETag: {etag}\r\nCache-Control: no-cache\r\nVary: Accept-Encoding\r\n{self.userinfo(parts[1])}"
+        if etag in headers.get('if-none-match', ''):
+            self.stats['not_modified'] += 1
+            return self._response('304 Not Modified', common, keep_alive=keep_alive)
+
+        response = self._response('200 OK', f"Content-Type: {doc.content_type}\r\n{encoding}{common}", body,
+                                  keep_alive)
+        if method == 'HEAD':
+            return response[:len(response) - len(body)]
+        return response
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), 30)
+                if not request_line:
+                    break
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await asyncio.wait_for(reader.readline(), 10)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    writer.write(self._response('400 Bad Request', keep_alive=False))
+                    break
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and parts[2] != 'HTTP/1.0'
+                writer.write(self.handle_request(parts[0], parts[1], headers, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            changed = self.refresh()
+            self.refresh_usage()
+            if changed:
+                print(f"  ↻ {changed} user(s) changed, cache invalidated")
+
+    async def start(self, host='0.0.0.0', port=8443):
+        """Load users and start listening; returns the asyncio Server"""
+        if self.revision < 0:
+            self.load()
+        server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        self._refresher = asyncio.ensure_future(self._refresh_loop())
+        return server
+
+    async def serve_forever(self, host='0.0.0.0', port=8443):
+        server = await self.start(host, port)
+        print(f"Serving {len(self.tokens)} subscriptions on http://{host}:{port}/sub/<token>")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+    from pathlib import Path
+
+    from env_config import load_env_file
+    from user_store import UserStore
+
+    parser = argparse.ArgumentParser(description='Serve per-user subscription documents')
+    parser.add_argument('--config', default=str(Path(__file__).parent.parent.parent / 'config.env'))
+    parser.add_argument('--db', help='User database (default: USER_DB from config.env)')
+    parser.add_argument('--listen', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--traffic-db', help='Stats collector database for the usage in subscription-userinfo')
+    parser.add_argument('--tokens', action='store_true', help='Print each user\'s subscription token and exit')
+    args = parser.parse_args()
+
+    config = load_env_file(args.config)
+    secret = config.get('SUBSCRIPTION_SECRET')
+    if not secret:
+        print("Error: SUBSCRIPTION_SECRET must be set in config.env")
+        sys.exit(1)
+
+    store = UserStore(args.db or Path(__file__).parent.parent / config.get('USER_DB', 'users.db'))
+    if args.tokens:
+        for user in store.active_users():
+            print(f"  {user['email']:<32} /sub/{user_token(secret, user['uuid'])}")
+        sys.exit(0)
+
+    profile = ServerProfile(
+        domain=config['DOMAIN'],
+        sni=config['REALITY_SERVER_NAMES'].split(',')[0],
+        public_key=config.get('REALITY_PUBLIC_KEY', ''),
+        xudp_concurrency=int(config.get('XUDP_CONCURRENCY') or 0)
+    )
+    traffic = None
+    if args.traffic_db:
+        from stats_collector import RollupStore
+        traffic = RollupStore(args.traffic_db)
+    server = SubscriptionServer(store, profile, secret, traffic=traffic)
+    server.load()
+    started = time.perf_counter()
+    server.precompute()
+    print(f"  ✓ Precomputed {len(server.cache)} documents in {time.perf_counter() - started:.2f}s")
+
+    try:
+        asyncio.run(server.serve_forever(args.listen, args.port))
+    except KeyboardInterrupt:
+        print("\nSubscription server stopped.")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Template Cache - Compiled Jinja2 templates and skip-if-unchanged rendering
+"""
+
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from jinja2.bccache import Bucket
+
+
+class ContentHashBytecodeCache(FileSystemBytecodeCache):
+    """
+    On-disk bytecode cache keyed by the template source hash
+
+    Jinja's default key is the template name, so an edited template
+    overwrites its entry; keying by content lets several versions (e.g. a
+    checkout per node) share one cache directory without thrashing.
+    """
+
+    def __init__(self, directory):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        super().__init__(str(directory), '%s.jinja')
+
+    def get_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        bucket = Bucket(environment, checksum, checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+
+@lru_cache(maxsize=None)
+def template_environment(config_dir, cache_dir=None):
+    """
+    Shared Environment per template/cache directory
+
+    The Environment keeps compiled templates in memory, so every
+    ConfigGenerator in a process reuses them; the bytecode cache carries
+    them across processes.
+    """
+    return Environment(
+        loader=FileSystemLoader(str(config_dir)),
+        bytecode_cache=ContentHashBytecodeCache(cache_dir) if cache_dir else None,
+        autoescape=False,
+    )
+
+
+def precompile(env):
+    """
+    Compile every *.j2 template so later runs load bytecode only
+
+    Returns:
+        list: Template names compiled
+    """
+    names = env.list_templates(extensions=['j2'])
+    for name in names:
+        env.get_template(name)
+    return names
+
+
+class RenderCache:
+    def __init__(self, manifest_path):
+        """
+        Remember what each output was rendered from
+
+        An output is fresh when its inputs hash (template source + context)
+        matches the last render and the file still has the size and mtime
+        recorded then, so a half-finished or hand-edited output is re-rendered.
+
+        Args:
+            manifest_path: JSON file holding output -> [inputs hash, size, mtime_ns]
+        """
+        self.manifest_path = Path(manifest_path)
+        try:
+            self.entries = json.loads(self.manifest_path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+        self.dirty = False
+        self.stats = {'rendered': 0, 'skipped': 0}
+        self._depth = 0
+
+    @staticmethod
+    def inputs_hash(source, context):
+        """
+        SHA-256 of the template source and context
+
+        String values (e.g. a pre-serialized 10 MB clients list) go into the
+        digest as they are; re-encoding them as JSON would escape every quote
+        and cost nearly as much as the render being skipped.
+        """
+        digest = hashlib.sha256(source.encode())
+        for key in sorted(context):
+            value = context[key]
+            if isinstance(value, str):
+                kind, data = 's', value.encode()
+            else:
+                kind, data = 'j', json.dumps(value, sort_keys=True, default=str).encode()
+            # Tagged and length-prefixed, so different contexts can't feed the same bytes
+            digest.update(f"\0{key}\0{kind}{len(data)}\0".encode())
+            digest.update(data)
+        return digest.hexdigest()
+
+    def is_fresh(self, output, key):
+        entry = self.entries.get(str(output))
+        if entry is None or entry[0] != key:
+            return False
+        try:
+            stat = os.stat(output)
+        except FileNotFoundError:
+            return False
+        return entry[1] == stat.st_size and entry[2] == stat.st_mtime_ns
+
+    def record(self, output, key):
+        stat = os.stat(output)
+        self.entries[str(output)] = [key, stat.st_size, stat.st_mtime_ns]
+        self.dirty = True
+
+    @contextmanager
+    def batch(self):
+        """Save the manifest once when the outermost batch ends, not after every render"""
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.save()
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.entries))
+        os.replace(tmp, self.manifest_path)
+        self.dirty = False
+
+    def render(self, env, template_name, output, context):
+        """
+        Render template_name to output unless the same inputs produced it last time
+
+        Returns:
+            bool: True if the file was (re)written
+        """
+        source, _, _ = env.loader.get_source(env, template_name)
+        key = self.inputs_hash(source, context)
+        if self.is_fresh(output, key):
+            self.stats['skipped'] += 1
+            return False
+
+        Path(output).write_text(env.get_template(template_name).render(**context))
+        self.record(output, key)
+        self.stats['rendered'] += 1
+        return True
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    config_dir = Path(sys.argv[1] if len(sys.argv) > 1 else '../configs').resolve()
+    cache_dir = Path(sys.argv[2] if len(sys.argv) > 2 else config_dir.parent / 'generated' / '.cache')
+
+    started = time.perf_counter()
+    names = precompile(template_environment(config_dir, cache_dir / 'bytecode'))
+    for name in names:
+        print(f"  ✓ {name}")
+    print(f"  Precompiled {len(names)} template(s) into {cache_dir / 'bytecode'} "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
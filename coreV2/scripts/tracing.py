@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Tracing - Lightweight spans, Chrome trace export and optional profiling
+"""
+
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class Span:
+    __slots__ = ('name', 'category', 'start', 'end', 'attrs', 'tid', 'depth', 'error')
+
+    def __init__(self, name, category, start, attrs, tid, depth):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = None
+        self.attrs = attrs
+        self.tid = tid
+        self.depth = depth
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attrs):
+        """Attach attributes discovered while the span is open"""
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    def __init__(self, enabled=True):
+        """
+        Initialize the tracer
+
+        Args:
+            enabled: Record spans (when False, span() is a cheap no-op)
+        """
+        self.enabled = enabled
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def reset(self):
+        """Drop recorded spans and restart the clock"""
+        with self._lock:
+            self.spans = []
+        self.origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, category='deploy', **attrs):
+        """
+        Record a timed span around a block
+
+        Args:
+            name: Span name (e.g. 'docker pull nginx:alpine')
+            category: Group used in exports (stage, remote, upload, check...)
+            **attrs: Extra attributes stored with the span
+
+        Yields:
+            Span: The open span (use span.set() to add attributes)
+        """
+        if not self.enabled:
+            yield Span(name, category, 0.0, attrs, 0, 0)
+            return
+
+        depth = getattr(self._local, 'depth', 0)
+        span = Span(name, category, time.perf_counter(), attrs, threading.get_ident(), depth)
+        self._local.depth = depth + 1
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.perf_counter()
+            self._local.depth = depth
+            with self._lock:
+                self.spans.append(span)
+
+    def traced(self, name=None, category='deploy'):
+        """Decorator form of span(); defaults the name to Class.method"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, category):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def to_chrome_trace(self):
+        """
+        Build a Chrome trace / Perfetto compatible document
+
+        Returns:
+            dict: {'traceEvents': [...]} with complete ('X') events in microseconds
+        """
+        pid = os.getpid()
+        events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+            'args': {'name': 'customvpn deploy'}
+        }]
+        for span in sorted(self.spans, key=lambda s: s.start):
+            args = {k: v if isinstance(v, (int, float, bool, str)) or v is None else str(v)
+                    for k, v in span.attrs.items()}
+            if span.error:
+                args['error'] = span.error
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': round((span.start - self.origin) * 1e6, 3),
+                'dur': round(span.duration * 1e6, 3),
+                'pid': pid,
+                'tid': span.tid,
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        """Write the Chrome trace JSON (open in chrome://tracing or ui.perfetto.dev)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_chrome_trace()))
+        return path
+
+    def summary(self):
+        """
+        Aggregate spans by (category, name)
+
+        Returns:
+            list: Dicts with count, total, mean and max seconds, slowest first
+        """
+        groups = {}
+        for span in self.spans:
+            key = (span.category, span.name)
+            entry = groups.setdefault(key, {
+                'category': span.category, 'name': span.name,
+                'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0
+            })
+            entry['count'] += 1
+            entry['total'] += span.duration
+            entry['max'] = max(entry['max'], span.duration)
+            entry['errors'] += 1 if span.error else 0
+
+        rows = sorted(groups.values(), key=lambda e: e['total'], reverse=True)
+        for row in rows:
+            row['mean'] = row['total'] / row['count']
+        return rows
+
+    def format_summary(self, limit=30):
+        """Render summary() as a fixed-width text table"""
+        rows = self.summary()[:limit]
+        wall = max((s.end for s in self.spans), default=self.origin) - self.origin
+
+        lines = [
+            f"{'category':<10} {'span':<44} {'n':>4} {'total':>9} {'mean':>9} {'max':>9}",
+            "-" * 90,
+        ]
+        for row in rows:
+            name = row['name'] if len(row['name']) <= 44 else row['name'][:41] + '...'
+            err = f"  ({row['errors']} err)" if row['errors'] else ''
+            lines.append(
+                f"{row['category']:<10} {name:<44} {row['count']:>4} "
+                f"{row['total']:>8.3f}s {row['mean']:>8.3f}s {row['max']:>8.3f}s{err}"
+            )
+        lines.append("-" * 90)
+        lines.append(f"wall clock: {wall:.3f}s, spans: {len(self.spans)}")
+        return '\n'.join(lines)
+
+
+# Process-wide tracer used by the deployment modules
+tracer = Tracer()
+
+
+def span(name, category='deploy', **attrs):
+    """Shortcut for tracer.span() on the global tracer"""
+    return tracer.span(name, category, **attrs)
+
+
+def traced(name=None, category='deploy'):
+    """Shortcut for tracer.traced() on the global tracer"""
+    return tracer.traced(name, category)
+
+
+@contextmanager
+def profiled(output_path=None, sort='cumulative', limit=25):
+    """
+    Profile the enclosed block with cProfile
+
+    Args:
+        output_path: Optional .prof file (load with snakeviz / pstats)
+        sort: pstats sort key for the printed report
+        limit: Number of rows printed
+
+    Yields:
+        cProfile.Profile: The active profiler
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if output_path:
+            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(str(output_path))
+        print(f"\nTop {limit} functions by {sort} time:")
+        pstats.Stats(profiler).strip_dirs().sort_stats(sort).print_stats(limit)
+
+
+def add_trace_arguments(parser):
+    """Register the shared --trace/--profile flags on an argparse parser"""
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Write a Chrome trace / Perfetto JSON of all spans to FILE')
+    parser.add_argument('--profile', nargs='?', const='deploy.prof', metavar='FILE',
+                        help='Profile the local Python side with cProfile (default: deploy.prof)')
+
+
+def report(trace_file=None):
+    """Print the span summary and optionally write the Chrome trace"""
+    if not tracer.spans:
+        return
+    print("\nTiming summary:")
+    print(tracer.format_summary())
+    if trace_file:
+        path = tracer.write_chrome_trace(trace_file)
+        print(f"\nTrace written to {path} (open in https://ui.perfetto.dev)")
@@ -3,12 +3,18 @@
 Uploader - Upload files to VPS via SSH
 """
 
+import shlex
+import tarfile
 import subprocess
 from pathlib import Path
 
+from command_stream import CommandTimeout
+from tracing import span, traced
+
 
 class Uploader:
-    def __init__(self, ssh_alias, remote_user, remote_host=None):
+    def __init__(self, ssh_alias, remote_user, remote_host=None, command_timeout=300,
+                 delta=False, delta_min_size=None):
         """
         Initialize the uploader
 
@@ -16,10 +22,20 @@ class Uploader:
             ssh_alias: SSH config alias (e.g., 'customvpn')
             remote_user: Remote username
             remote_host: Optional remote host (used if ssh_alias not in config)
+            command_timeout: Seconds before an ssh/scp command is killed
+            delta: Update files of at least delta_min_size bytes rsync-style,
+                sending only changed blocks (needs python3 on the VPS)
+            delta_min_size: Smallest file sent as a delta (default: DELTA_MIN_SIZE)
         """
         self.ssh_alias = ssh_alias
         self.remote_user = remote_user
         self.remote_host = remote_host
+        self.command_timeout = command_timeout
+        self.delta = delta
+        if delta_min_size is None:
+            from delta_sync import DELTA_MIN_SIZE
+            delta_min_size = DELTA_MIN_SIZE
+        self.delta_min_size = delta_min_size
 
     def run_ssh_command(self, command):
         """
@@ -33,11 +49,17 @@ class Uploader:
         """
         ssh_cmd = ['ssh', self.ssh_alias, command]
 
-        result = subprocess.run(
-            ssh_cmd,
-            capture_output=True,
-            text=True
-        )
+        with span(command, 'remote', host=self.ssh_alias) as sp:
+            try:
+                result = subprocess.run(
+                    ssh_cmd,
+                    capture_output=True,
+                    text=True,
+                    timeout=self.command_timeout
+                )
+            except subprocess.TimeoutExpired:
+                raise CommandTimeout(f"Command timed out after {self.command_timeout}s: {command}")
+            sp.set(returncode=result.returncode)
 
         return result.stdout, result.stderr, result.returncode
 
@@ -56,13 +78,24 @@ class Uploader:
         if not local_path.exists():
             raise FileNotFoundError(f"Local file not found: {local_path}")
 
+        if self.delta and local_path.stat().st_size >= self.delta_min_size:
+            if self.upload_file_delta(local_path, remote_path):
+                return True
+
         scp_cmd = [
             'scp',
             str(local_path),
             f"{self.ssh_alias}:{remote_path}"
         ]
 
-        result = subprocess.run(scp_cmd, capture_output=True, text=True)
+        with span(local_path.name, 'upload', remote_path=remote_path, bytes=local_path.stat().st_size) as sp:
+            try:
+                result = subprocess.run(scp_cmd, capture_output=True, text=True, timeout=self.command_timeout)
+            except subprocess.TimeoutExpired:
+                print(f"Error uploading {local_path}: timed out after {self.command_timeout}s")
+                sp.set(timed_out=True)
+                return False
+            sp.set(returncode=result.returncode)
 
         if result.returncode != 0:
             print(f"Error uploading {local_path}: {result.stderr}")
@@ -70,6 +103,53 @@ class Uploader:
 
         return True
 
+    def upload_file_delta(self, local_path, remote_path):
+        """
+        Update a remote file from its old copy, sending only changed blocks
+
+        Returns:
+            dict: delta_upload stats, or None when the file should be sent
+            whole (no remote copy yet, mostly new content, or the delta failed)
+        """
+        from delta_sync import delta_upload, DeltaError
+
+        local_path = Path(local_path)
+        with span(local_path.name, 'upload', remote_path=remote_path, bytes=local_path.stat().st_size,
+                  mode='delta') as sp:
+            try:
+                stats = delta_upload(self.ssh_alias, local_path, remote_path, timeout=self.command_timeout)
+            except DeltaError as e:
+                print(f"Delta upload of {local_path} failed ({e}); sending it whole")
+                return None
+            if stats:
+                sp.set(sent=stats['sent'] + stats['received'], result=stats['mode'])
+        return stats
+
+    def _upload_tree(self, local_dir, remote_dir, files):
+        """Stream files (paths under local_dir) as one tar into remote_dir"""
+        proc = subprocess.Popen(['ssh', self.ssh_alias, f"tar -xf - -C {remote_dir}"],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode='w|') as tar:
+                for path in files:
+                    tar.add(path, arcname=path.relative_to(local_dir).as_posix(), recursive=False)
+        except BrokenPipeError:
+            pass
+        try:
+            # communicate() closes stdin, which ends the remote tar's input
+            _, stderr = proc.communicate(timeout=self.command_timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            print(f"Error uploading directory {local_dir}: timed out after {self.command_timeout}s")
+            return False
+
+        if proc.returncode != 0:
+            print(f"Error uploading directory {local_dir}: {stderr.decode(errors='replace')}")
+            return False
+        return True
+
+    @traced(category='upload')
     def upload_directory(self, local_dir, remote_dir):
         """
         Upload an entire directory to the VPS
@@ -88,15 +168,33 @@ class Uploader:
         # Create remote directory
         self.run_ssh_command(f"mkdir -p {remote_dir}")
 
+        if self.delta:
+            files = sorted(path for path in local_dir.rglob('*') if path.is_file())
+            large = [path for path in files if path.stat().st_size >= self.delta_min_size]
+            if large:
+                # Small files go in one tar stream, large ones as deltas against their old copies
+                parents = {f"{remote_dir}/{path.parent.relative_to(local_dir).as_posix()}" for path in large}
+                self.run_ssh_command(f"mkdir -p {' '.join(sorted(parents))}")
+                small = [path for path in files if path.stat().st_size < self.delta_min_size]
+                ok = self._upload_tree(local_dir, remote_dir, small) if small else True
+                for path in large:
+                    ok = self.upload_file(path, f"{remote_dir}/{path.relative_to(local_dir).as_posix()}") and ok
+                return ok
+
         # Upload directory recursively
         scp_cmd = [
             'scp',
             '-r',
-            str(local_dir) + '/*',
+            # No shell to expand a glob; "dir/." copies the contents
+            str(local_dir) + '/.',
             f"{self.ssh_alias}:{remote_dir}/"
         ]
 
-        result = subprocess.run(scp_cmd, capture_output=True, text=True)
+        try:
+            result = subprocess.run(scp_cmd, capture_output=True, text=True, timeout=self.command_timeout)
+        except subprocess.TimeoutExpired:
+            print(f"Error uploading directory {local_dir}: timed out after {self.command_timeout}s")
+            return False
 
         if result.returncode != 0:
             print(f"Error uploading directory {local_dir}: {result.stderr}")
@@ -104,6 +202,42 @@ class Uploader:
 
         return True
 
+    @traced(category='upload')
+    def prune_remote_directory(self, local_dir, remote_dir):
+        """
+        Delete files under remote_dir that local_dir no longer has
+
+        The site build renames assets by content hash and drops the old
+        names locally; without this their remote copies pile up.
+
+        Args:
+            local_dir: Local directory the remote one mirrors
+            remote_dir: Remote directory to prune
+
+        Returns:
+            list: Removed paths relative to remote_dir, or None if the
+            remote listing or removal failed
+        """
+        local_dir = Path(local_dir)
+        keep = {path.relative_to(local_dir).as_posix() for path in local_dir.rglob('*') if path.is_file()}
+
+        stdout, stderr, code = self.run_ssh_command(f"cd {remote_dir} && find . -type f")
+        if code != 0:
+            print(f"Error listing {remote_dir}: {stderr}")
+            return None
+
+        stale = sorted({line[2:] for line in stdout.splitlines() if line.startswith('./')} - keep)
+        if stale:
+            _, stderr, code = self.run_ssh_command(
+                f"cd {remote_dir} && rm -f -- {' '.join(shlex.quote(name) for name in stale)} && "
+                f"find . -mindepth 1 -type d -empty -delete"
+            )
+            if code != 0:
+                print(f"Error pruning {remote_dir}: {stderr}")
+                return None
+        return stale
+
+    @traced(category='upload')
     def upload_configs(self, generated_dir, remote_base_dir='/home/shaun/vpn'):
         """
         Upload all generated config files to VPS
@@ -115,6 +249,8 @@ class Uploader:
         Returns:
             dict: Status of each upload
         """
+        from config_generator import COMPOSE_OVERRIDE
+
         generated_dir = Path(generated_dir)
 
         # Create remote directories
@@ -133,6 +269,26 @@ class Uploader:
             'index.html': f"{remote_base_dir}/www/index.html",
         }
 
+        # A multi-user store with several shards writes one config per shard instead
+        shard_configs = sorted(generated_dir.glob('xray-config.shard-*.json'))
+        if shard_configs:
+            del config_files['xray-config.json']
+        for path in shard_configs:
+            config_files[path.name] = f"{remote_base_dir}/configs/{path.name}"
+
+        # Trimmed geo data mounted into the xray container
+        if (generated_dir / 'geo').is_dir():
+            results['geo/'] = self.upload_directory(generated_dir / 'geo', f"{remote_base_dir}/geo")
+
+        # A built site (generated/www) replaces the bare index.html
+        site_dir = generated_dir / 'www'
+        if site_dir.is_dir():
+            del config_files['index.html']
+            results['www/'] = self.upload_directory(site_dir, f"{remote_base_dir}/www")
+            # Outputs of earlier builds (old content-hashed names) that nginx would keep serving
+            if results['www/']:
+                results['www/'] = self.prune_remote_directory(site_dir, f"{remote_base_dir}/www") is not None
+
         for local_file, remote_file in config_files.items():
             local_path = generated_dir / local_file
             if local_path.exists():
@@ -141,6 +297,14 @@ class Uploader:
                 print(f"Warning: {local_file} not found, skipping")
                 results[local_file] = False
 
+        # Host-networking override, only generated while bandwidth shaping is on;
+        # removing a stale one puts xray back on the bridged network
+        override = generated_dir / COMPOSE_OVERRIDE
+        if override.exists():
+            results[COMPOSE_OVERRIDE] = self.upload_file(override, f"{remote_base_dir}/{COMPOSE_OVERRIDE}")
+        else:
+            self.run_ssh_command(f"rm -f {remote_base_dir}/{COMPOSE_OVERRIDE}")
+
         return results
 
 
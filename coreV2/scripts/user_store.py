@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+User Store - SQLite-backed VLESS users with change tracking for incremental builds
+"""
+
+import time
+import uuid as uuid_lib
+import secrets
+import sqlite3
+import zlib
+from pathlib import Path
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    uuid        TEXT PRIMARY KEY,
+    email       TEXT NOT NULL UNIQUE,
+    level       INTEGER NOT NULL DEFAULT 0,
+    short_id    TEXT NOT NULL,
+    shard       INTEGER NOT NULL,
+    quota_bytes INTEGER NOT NULL DEFAULT 0,
+    enabled     INTEGER NOT NULL DEFAULT 1,
+    deleted     INTEGER NOT NULL DEFAULT 0,
+    revision    INTEGER NOT NULL,
+    modified_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_users_revision ON users (revision);
+CREATE INDEX IF NOT EXISTS idx_users_shard ON users (shard, deleted, enabled);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS builds (
+    artifact TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL,
+    built_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+USER_COLUMNS = ('uuid', 'email', 'level', 'short_id', 'shard', 'quota_bytes',
+                'enabled', 'deleted', 'revision', 'modified_at')
+
+
+def default_email(user_uuid):
+    """Stats identity used when a user has no explicit email (the full UUID, so it stays unique)"""
+    return f"{user_uuid}@customvpn"
+
+
+class UserStore:
+    def __init__(self, db_path, shard_count=None):
+        """
+        Open (or create) the user database
+
+        Every change bumps a store-wide revision number and stamps it on the
+        user row, so "what changed since build X" is an indexed range scan.
+        Deletions are kept as tombstones until purge() so builders can remove
+        the matching artifacts.
+
+        Args:
+            db_path: SQLite file (':memory:' for tests)
+            shard_count: Number of config shards (stored on first use)
+        """
+        self.db_path = str(db_path)
+        if self.db_path != ':memory:':
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        stored = self._meta('shard_count')
+        if stored is None:
+            self._set_meta('shard_count', shard_count or 1)
+            self.conn.commit()
+        elif shard_count and int(stored) != shard_count:
+            raise ValueError(f"Store was created with {stored} shards, not {shard_count}; shard assignment is fixed")
+
+    # -- meta ----------------------------------------------------------------
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+
+    @property
+    def shard_count(self):
+        return int(self._meta('shard_count'))
+
+    @property
+    def revision(self):
+        """Current store revision (0 for an empty store)"""
+        return int(self._meta('revision') or 0)
+
+    def _next_revision(self):
+        revision = self.revision + 1
+        self._set_meta('revision', revision)
+        return revision
+
+    def shard_for(self, user_uuid):
+        """Stable shard assignment from the UUID"""
+        return zlib.crc32(user_uuid.encode()) % self.shard_count
+
+    # -- writes --------------------------------------------------------------
+
+    def add_user(self, user_uuid=None, email=None, level=0, short_id=None, quota_bytes=0, shard=None):
+        """
+        Add a user (or revive a deleted one)
+
+        Args:
+            user_uuid: VLESS UUID (generated if omitted)
+            email: Stats identity (defaults to '<uuid>@customvpn')
+            level: Xray policy level
+            short_id: Reality shortId (generated if omitted)
+            quota_bytes: Traffic quota (0 = unlimited)
+            shard: Explicit shard (defaults to a hash of the UUID)
+
+        Returns:
+            dict: The stored user
+        """
+        return self.add_users([{
+            'uuid': user_uuid, 'email': email, 'level': level,
+            'short_id': short_id, 'quota_bytes': quota_bytes, 'shard': shard,
+        }])[0]
+
+    def add_users(self, users):
+        """
+        Bulk insert/update users in one transaction under one revision
+
+        A user whose UUID exists is updated in place. An email already used
+        by another live user is an error; a tombstoned user's email is moved
+        aside so the tombstone survives until its artifacts are rebuilt.
+
+        Args:
+            users: Iterable of dicts with the add_user() keys
+
+        Returns:
+            list: Stored user dicts
+
+        Raises:
+            ValueError: An email belongs to another user (nothing is stored)
+        """
+        now = time.time()
+        rows = []
+        with self.conn:
+            revision = self._next_revision()
+            for user in users:
+                user_uuid = user.get('uuid') or str(uuid_lib.uuid4())
+                shard = user.get('shard')
+                rows.append({
+                    'uuid': user_uuid,
+                    'email': user.get('email') or default_email(user_uuid),
+                    'level': int(user.get('level') or 0),
+                    'short_id': user.get('short_id') or secrets.token_hex(8),
+                    'shard': self.shard_for(user_uuid) if shard is None else int(shard),
+                    'quota_bytes': int(user.get('quota_bytes') or 0),
+                    'enabled': 1,
+                    'deleted': 0,
+                    'revision': revision,
+                    'modified_at': now,
+                })
+            self.conn.executemany("""
+                UPDATE users SET email = uuid || '@deleted'
+                WHERE email = :email AND uuid != :uuid AND deleted = 1
+            """, rows)
+            try:
+                self.conn.executemany(f"""
+                    INSERT INTO users ({', '.join(USER_COLUMNS)})
+                    VALUES ({', '.join(':' + c for c in USER_COLUMNS)})
+                    ON CONFLICT (uuid) DO UPDATE SET
+                        {', '.join(f"{c} = excluded.{c}" for c in USER_COLUMNS if c != 'uuid')}
+                """, rows)
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Email already belongs to another user ({e})") from None
+        return rows
+
+    def update_user(self, user_uuid, **changes):
+        """
+        Change fields of one user (level, short_id, quota_bytes, enabled, email)
+
+        Returns:
+            bool: True if the user exists
+
+        Raises:
+            ValueError: Unknown field, or the email belongs to another user
+        """
+        allowed = {'email', 'level', 'short_id', 'quota_bytes', 'enabled'}
+        unknown = set(changes) - allowed
+        if unknown:
+            raise ValueError(f"Unknown user fields: {', '.join(sorted(unknown))}")
+
+        with self.conn:
+            revision = self._next_revision()
+            assignments = ', '.join(f"{key} = :{key}" for key in changes)
+            params = dict(changes, uuid=user_uuid, revision=revision, modified_at=time.time())
+            if 'enabled' in params:
+                params['enabled'] = int(bool(params['enabled']))
+            try:
+                cursor = self.conn.execute(f"""
+                    UPDATE users SET {assignments + ', ' if assignments else ''}
+                        revision = :revision, modified_at = :modified_at
+                    WHERE uuid = :uuid AND deleted = 0
+                """, params)
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"Email already belongs to another user ({e})") from None
+        return cursor.rowcount == 1
+
+    def remove_user(self, user_uuid):
+        """Tombstone a user so incremental builds drop its artifacts"""
+        with self.conn:
+            revision = self._next_revision()
+            cursor = self.conn.execute(
+                "UPDATE users SET deleted = 1, revision = ?, modified_at = ? WHERE uuid = ? AND deleted = 0",
+                (revision, time.time(), user_uuid)
+            )
+        return cursor.rowcount == 1
+
+    def purge(self, before_revision=None):
+        """Drop tombstones that every artifact has already been rebuilt past"""
+        if before_revision is None:
+            row = self.conn.execute("SELECT MIN(revision) FROM builds").fetchone()
+            before_revision = row[0] if row and row[0] is not None else 0
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM users WHERE deleted = 1 AND revision <= ?", (before_revision,)
+            )
+        return cursor.rowcount
+
+    # -- reads ---------------------------------------------------------------
+
+    def get_user(self, user_uuid):
+        row = self.conn.execute("SELECT * FROM users WHERE uuid = ?", (user_uuid,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_email(self, email):
+        row = self.conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        return dict(row) if row else None
+
+    def active_users(self, shard=None):
+        """Enabled, non-deleted users (optionally one shard), ordered by email"""
+        if shard is None:
+            cursor = self.conn.execute(
+                "SELECT * FROM users WHERE deleted = 0 AND enabled = 1 ORDER BY email")
+        else:
+            cursor = self.conn.execute(
+                "SELECT * FROM users WHERE shard = ? AND deleted = 0 AND enabled = 1 ORDER BY email", (shard,))
+        return [dict(row) for row in cursor]
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM users WHERE deleted = 0").fetchone()[0]
+
+    def active_count(self):
+        """Users that end up in a server config (enabled, not deleted)"""
+        return self.conn.execute("SELECT COUNT(*) FROM users WHERE deleted = 0 AND enabled = 1").fetchone()[0]
+
+    def changed_since(self, revision):
+        """Users (including tombstones and disabled) modified after a revision"""
+        cursor = self.conn.execute(
+            "SELECT * FROM users WHERE revision > ? ORDER BY revision", (revision,))
+        return [dict(row) for row in cursor]
+
+    def changed_shards(self, revision):
+        """
+        Shards containing users modified after a revision
+
+        Returns:
+            dict: shard -> newest revision among its changed users
+        """
+        # Plain row scan so SQLite walks idx_users_revision instead of the shard index
+        cursor = self.conn.execute(
+            "SELECT shard, revision FROM users INDEXED BY idx_users_revision WHERE revision > ?", (revision,))
+        shards = {}
+        for shard, row_revision in cursor:
+            if row_revision > shards.get(shard, -1):
+                shards[shard] = row_revision
+        return shards
+
+    # -- build bookkeeping ---------------------------------------------------
+
+    def last_built(self, artifact):
+        """Revision an artifact was last built at (-1 if never)"""
+        row = self.conn.execute("SELECT revision FROM builds WHERE artifact = ?", (artifact,)).fetchone()
+        return row[0] if row else -1
+
+    def mark_built(self, artifact, revision):
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO builds (artifact, revision, built_at) VALUES (?, ?, ?)
+                ON CONFLICT (artifact) DO UPDATE SET revision = excluded.revision, built_at = excluded.built_at
+            """, (artifact, revision, time.time()))
+
+    def reset_builds(self):
+        """Forget build state so the next build is a full rebuild"""
+        with self.conn:
+            self.conn.execute("DELETE FROM builds")
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Manage VLESS users')
+    parser.add_argument('--db', default='users.db')
+    parser.add_argument('--shards', type=int, help='Shard count (only when creating the store)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    add = sub.add_parser('add')
+    add.add_argument('--uuid')
+    add.add_argument('--email')
+    add.add_argument('--level', type=int, default=0)
+    add.add_argument('--quota-gb', type=float, default=0)
+
+    update = sub.add_parser('update')
+    update.add_argument('uuid')
+    update.add_argument('--level', type=int)
+    update.add_argument('--quota-gb', type=float)
+    update.add_argument('--disable', action='store_true')
+    update.add_argument('--enable', action='store_true')
+
+    remove = sub.add_parser('remove')
+    remove.add_argument('uuid')
+
+    sub.add_parser('list')
+
+    args = parser.parse_args()
+    store = UserStore(args.db, shard_count=args.shards)
+
+    if args.command == 'add':
+        user = store.add_user(args.uuid, args.email, args.level, quota_bytes=int(args.quota_gb * 1e9))
+        print(f"  ✓ {user['email']} {user['uuid']} (shard {user['shard']}, shortId {user['short_id']})")
+    elif args.command == 'update':
+        changes = {}
+        if args.level is not None:
+            changes['level'] = args.level
+        if args.quota_gb is not None:
+            changes['quota_bytes'] = int(args.quota_gb * 1e9)
+        if args.disable or args.enable:
+            changes['enabled'] = args.enable
+        ok = store.update_user(args.uuid, **changes)
+        print("  ✓ Updated" if ok else "  ✗ No such user")
+        sys.exit(0 if ok else 1)
+    elif args.command == 'remove':
+        ok = store.remove_user(args.uuid)
+        print("  ✓ Removed" if ok else "  ✗ No such user")
+        sys.exit(0 if ok else 1)
+    elif args.command == 'list':
+        for user in store.active_users():
+            quota = f"{user['quota_bytes'] / 1e9:.0f} GB" if user['quota_bytes'] else 'unlimited'
+            print(f"  {user['email']:<32} {user['uuid']}  level={user['level']} shard={user['shard']} quota={quota}")
+        print(f"\n  {store.count()} users, revision {store.revision}")
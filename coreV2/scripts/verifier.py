@@ -3,38 +3,215 @@
 Verifier - Health check and verification
 """
 
-import subprocess
+import time
+import struct
+import select
 import socket
-import ssl
-import requests
+import threading
+import subprocess
 from urllib.parse import urlparse
 
+from tracing import span, traced
+
+
+# Probe datagram: sequence number + send time (ns), padded to the probe size
+_PROBE = struct.Struct('!QQ')
+
+
+def _socks_udp_associate(proxy):
+    """
+    Open a SOCKS5 UDP association (no auth)
+
+    Returns:
+        tuple: (control TCP socket, relay (host, port)); the association
+        lives as long as the control socket stays open
+    """
+    control = socket.create_connection(proxy, timeout=5)
+    control.sendall(b'\x05\x01\x00')
+    if control.recv(2) != b'\x05\x00':
+        raise ConnectionError(f"SOCKS proxy {proxy[0]}:{proxy[1]} wants authentication")
+    control.sendall(b'\x05\x03\x00\x01' + bytes(4) + bytes(2))
+    reply = control.recv(262)
+    if len(reply) < 10 or reply[1] != 0:
+        raise ConnectionError(f"SOCKS UDP ASSOCIATE refused (code {reply[1] if len(reply) > 1 else '?'})")
+    if reply[3] == 1:
+        host, port = socket.inet_ntoa(reply[4:8]), struct.unpack('!H', reply[8:10])[0]
+    elif reply[3] == 3:
+        length = reply[4]
+        host, port = reply[5:5 + length].decode(), struct.unpack('!H', reply[5 + length:7 + length])[0]
+    else:
+        raise ConnectionError('SOCKS relay address is IPv6; not supported')
+    # A wildcard relay address means "the proxy's own address"
+    return control, (proxy[0] if host in ('0.0.0.0', '') else host, port)
+
+
+def _socks_strip(datagram):
+    """Payload of a SOCKS5 UDP reply (drops RSV/FRAG/address header)"""
+    atyp = datagram[3]
+    offset = {1: 10, 4: 22}.get(atyp, 7 + datagram[4] if atyp == 3 else 0)
+    return datagram[offset:]
+
+
+def measure_udp(host, port, count=20, interval=0.02, timeout=1.0, size=64, socks=None):
+    """
+    Round-trip latency, jitter and loss of datagrams sent to a UDP echo service
+
+    Args:
+        host: Echo host
+        port: Echo port
+        count: Datagrams to send
+        interval: Seconds between sends (0.02 = 50 pps, a VoIP-like rate)
+        timeout: Seconds to wait for stragglers after the last send
+        size: Datagram payload bytes (>= 16)
+        socks: (host, port) of a SOCKS5 proxy, e.g. a local Xray client with
+            XUDP, to measure through the tunnel instead of directly
+
+    Returns:
+        dict: sent, received, loss, and rtt_min/avg/p95/max/jitter in ms (None if nothing came back)
+    """
+    control = None
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        if socks:
+            control, relay = _socks_udp_associate(socks)
+            encoded = host.encode()
+            header = b'\x00\x00\x00\x03' + bytes([len(encoded)]) + encoded + struct.pack('!H', port)
+            sock.connect(relay)
+        else:
+            header = b''
+            sock.connect((host, port))
+
+        sent, rtts = {}, {}
+        deadline = None
+        seq = 0
+        next_send = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if seq < count and now >= next_send:
+                sent[seq] = time.perf_counter_ns()
+                sock.send(header + _PROBE.pack(seq, sent[seq]).ljust(size, b'\x00'))
+                seq += 1
+                next_send += interval
+                if seq == count:
+                    deadline = time.perf_counter() + timeout
+                continue
+            if deadline is not None and (now >= deadline or len(rtts) == count):
+                break
+            wait = (next_send if seq < count else deadline) - now
+            readable, _, _ = select.select([sock], [], [], max(0.0, wait))
+            if not readable:
+                continue
+            try:
+                datagram = sock.recv(65535)
+            except ConnectionRefusedError:
+                # ICMP port unreachable: nothing listens there
+                continue
+            received_at = time.perf_counter_ns()
+            payload = _socks_strip(datagram) if socks else datagram
+            if len(payload) < _PROBE.size:
+                continue
+            number, stamp = _PROBE.unpack_from(payload)
+            if sent.get(number) == stamp and number not in rtts:
+                rtts[number] = (received_at - stamp) / 1e6
+    finally:
+        sock.close()
+        if control:
+            control.close()
+
+    result = {'sent': count, 'received': len(rtts), 'loss': 1 - len(rtts) / count if count else 0.0,
+              'rtt_min': None, 'rtt_avg': None, 'rtt_p95': None, 'rtt_max': None, 'jitter': None}
+    if rtts:
+        ordered = sorted(rtts.values())
+        in_order = [rtts[n] for n in sorted(rtts)]
+        result.update(
+            rtt_min=ordered[0],
+            rtt_avg=sum(ordered) / len(ordered),
+            rtt_p95=ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            rtt_max=ordered[-1],
+            # Mean change between consecutive RTTs (RFC 3550's jitter idea, unsmoothed)
+            jitter=(sum(abs(b - a) for a, b in zip(in_order, in_order[1:])) / (len(in_order) - 1)
+                    if len(in_order) > 1 else 0.0),
+        )
+    return result
+
+
+class UdpEchoServer:
+    def __init__(self, host='127.0.0.1', port=0, drop_every=0, delay=0.0):
+        """
+        UDP echo stand-in for check_udp (also runnable on the VPS: verifier.py --udp-echo PORT)
+
+        Args:
+            host: Bind address
+            port: Bind port (0 = any free port)
+            drop_every: Drop every Nth datagram to simulate loss (0 = none)
+            delay: Seconds to hold each reply, to simulate path latency
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.port = self.sock.getsockname()[1]
+        self.drop_every = drop_every
+        self.delay = delay
+        self.received = 0
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def _serve(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(65535)
+            except OSError:
+                return
+            self.received += 1
+            if self.drop_every and self.received % self.drop_every == 0:
+                continue
+            if self.delay:
+                threading.Timer(self.delay, self._reply, (data, address)).start()
+            else:
+                self._reply(data, address)
+
+    def _reply(self, data, address):
+        try:
+            self.sock.sendto(data, address)
+        except OSError:
+            pass
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.sock.close()
+
 
 class Verifier:
-    def __init__(self, ssh_alias, domain):
+    def __init__(self, ssh_alias, domain, remote_base_dir='/home/shaun/vpn'):
         """
         Initialize the verifier
 
         Args:
             ssh_alias: SSH config alias
             domain: Domain name to verify
+            remote_base_dir: Deployment directory on the VPS (holds the blue/green state)
         """
         self.ssh_alias = ssh_alias
         self.domain = domain
+        self.remote_base_dir = remote_base_dir
 
     def run_remote_command(self, command):
         """Run command on remote server"""
         ssh_cmd = ['ssh', self.ssh_alias, command]
-        result = subprocess.run(ssh_cmd, capture_output=True, text=True)
+        with span(command, 'remote', host=self.ssh_alias) as sp:
+            result = subprocess.run(ssh_cmd, capture_output=True, text=True)
+            sp.set(returncode=result.returncode)
         return result.stdout, result.stderr, result.returncode
 
+    @traced(category='check')
     def check_docker_containers(self):
-        """Check if all containers are running"""
+        """Check if all containers are running (after a blue/green swap, xray is the active color)"""
+        from blue_green import container_status_command
+
         print("Checking Docker containers...")
 
-        stdout, stderr, code = self.run_remote_command(
-            "docker ps --format '{{.Names}}\t{{.Status}}' | grep -E '(xray|shadowsocks|nginx)'"
-        )
+        stdout, stderr, code = self.run_remote_command(container_status_command(self.remote_base_dir))
 
         if code == 0:
             containers = stdout.strip().split('\n')
@@ -44,7 +221,7 @@ class Verifier:
             for line in containers:
                 if '\t' in line:
                     name, status = line.split('\t', 1)
-                    if 'Up' in status:
+                    if name in expected and 'Up' in status:
                         running.add(name)
                         print(f"  ✓ {name}: {status}")
 
@@ -60,6 +237,12 @@ class Verifier:
 
     def check_port(self, port, protocol='tcp'):
         """Check if a port is open"""
+        with span(f"port {port}/{protocol}", 'check', host=self.domain) as sp:
+            is_open = self._check_port(port, protocol)
+            sp.set(open=is_open)
+        return is_open
+
+    def _check_port(self, port, protocol):
         try:
             if protocol == 'tcp':
                 sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -67,11 +250,13 @@ class Verifier:
                 result = sock.connect_ex((self.domain, port))
                 sock.close()
                 return result == 0
-            return False
+            # UDP has no handshake; only an echo proves something answers
+            return measure_udp(self.domain, port, count=3, timeout=2.0)['received'] > 0
         except Exception as e:
             print(f"  ✗ Port check error: {e}")
             return False
 
+    @traced(category='check')
     def check_ports(self):
         """Check if required ports are accessible"""
         print("\nChecking ports...")
@@ -91,9 +276,44 @@ class Verifier:
 
         return all(results.values())
 
+    @traced(category='check')
+    def check_udp(self, port, count=50, interval=0.02, max_loss=0.02, max_rtt_ms=None, socks=None):
+        """
+        Check a UDP echo service answers with acceptable loss (and latency)
+
+        Args:
+            port: UDP echo port on the domain
+            count: Datagrams to send
+            interval: Seconds between datagrams
+            max_loss: Highest acceptable loss fraction
+            max_rtt_ms: Highest acceptable p95 RTT (None = don't judge latency)
+            socks: (host, port) of a local SOCKS5 client (Xray with XUDP) to test the tunnelled path
+
+        Returns:
+            bool: True if loss (and p95 RTT) are within limits
+        """
+        path = f" via SOCKS {socks[0]}:{socks[1]}" if socks else ''
+        print(f"\nChecking UDP round trip to {self.domain}:{port}{path}...")
+        try:
+            result = measure_udp(self.domain, port, count=count, interval=interval, socks=socks)
+        except OSError as e:
+            print(f"  ✗ UDP check failed: {e}")
+            return False
+
+        if not result['received']:
+            print(f"  ✗ No replies to {count} datagrams")
+            return False
+        ok = result['loss'] <= max_loss and (max_rtt_ms is None or result['rtt_p95'] <= max_rtt_ms)
+        print(f"  {'✓' if ok else '✗'} {result['received']}/{result['sent']} replies "
+              f"({result['loss']:.0%} loss), RTT min/avg/p95 {result['rtt_min']:.1f}/{result['rtt_avg']:.1f}/"
+              f"{result['rtt_p95']:.1f} ms, jitter {result['jitter']:.1f} ms")
+        return ok
+
+    @traced(category='check')
     def check_ssl_certificate(self):
         """Check if SSL certificate is valid"""
         print("\nChecking SSL certificate...")
+        import ssl
 
         try:
             context = ssl.create_default_context()
@@ -111,9 +331,12 @@ class Verifier:
             print(f"  ✗ Certificate check failed: {e}")
             return False
 
+    @traced(category='check')
     def check_website(self):
         """Check if the fake website is accessible"""
         print("\nChecking website...")
+        # requests is the slowest import in the tree; only the HTTP checks need it
+        import requests
 
         try:
             # Check HTTPS
@@ -132,9 +355,11 @@ class Verifier:
             print(f"  ✗ Website check failed: {e}")
             return False
 
+    @traced(category='check')
     def check_http_redirect(self):
         """Check if HTTP redirects to HTTPS"""
         print("\nChecking HTTP to HTTPS redirect...")
+        import requests
 
         try:
             response = requests.get(
@@ -152,10 +377,70 @@ class Verifier:
             print(f"  ✗ Redirect check failed: {e}")
             return False
 
-    def verify_all(self):
+    @traced(category='check')
+    def check_shaping(self, plan):
+        """Check the bandwidth tiers' tc classes and filters are active"""
+        print("Checking bandwidth shaping...")
+
+        problems = plan.verify(self.run_remote_command)
+        for problem in problems:
+            print(f"  ✗ {problem}")
+        if not problems:
+            print(f"  ✓ {len(plan.tiers)} tiers active on {plan.interface} and its ingress")
+        return not problems
+
+    def create_monitor(self, interval=30.0, sni=None, **kwargs):
+        """
+        Build a continuous HealthMonitor probing the same targets
+
+        Args:
+            interval: Seconds between probe rounds
+            sni: TLS server name (defaults to the domain)
+            **kwargs: Extra HealthMonitor options
+
+        Returns:
+            HealthMonitor: Monitor ready for serve_forever()
+        """
+        from monitor import HealthMonitor
+        from blue_green import container_status_command
+
+        options = {
+            'ports': (443,),
+            # The same page check_website fetches
+            'http_url': f"https://{self.domain}/",
+            # Resolved on the VPS every round, so `xray` follows blue/green swaps
+            'container_command': ['ssh', self.ssh_alias, container_status_command(self.remote_base_dir)],
+        }
+        options.update(kwargs)
+        return HealthMonitor(self.domain, sni=sni, interval=interval, **options)
+
+    def create_load_tester(self, server_names=None, port=443, **kwargs):
+        """
+        Build a LoadTester aimed at the deployed server
+
+        Args:
+            server_names: Reality serverNames used as SNI (defaults to the domain)
+            port: Target port
+            **kwargs: Extra LoadTester options (connections, concurrency, ramp...)
+
+        Returns:
+            LoadTester: Tester ready for run()
+        """
+        from load_tester import LoadTester
+
+        return LoadTester(self.domain, port, server_names=server_names, **kwargs)
+
+    @traced(category='verifier')
+    def verify_all(self, shaping=None, udp_port=None, udp_socks=None, history=None):
         """
         Run all verification checks
 
+        Args:
+            shaping: ShapingPlan to check, if bandwidth shaping is deployed
+            udp_port: UDP echo port to check round trips against, if one runs
+            udp_socks: SOCKS5 client to send the UDP check through (see check_udp)
+            history: HistoryStore to append verify.<check>.ok/.ms samples to
+
         Returns:
             dict: Results of all checks
         """
@@ -163,13 +448,21 @@ class Verifier:
         print("Starting Verification")
         print("=" * 60)
 
-        results = {
-            'containers': self.check_docker_containers(),
-            'ports': self.check_ports(),
-            'ssl': self.check_ssl_certificate(),
-            'website': self.check_website(),
-            'redirect': self.check_http_redirect(),
+        checks = {
+            'containers': self.check_docker_containers,
+            'ports': self.check_ports,
+            'ssl': self.check_ssl_certificate,
+            'website': self.check_website,
+            'redirect': self.check_http_redirect,
         }
+        if shaping:
+            checks['shaping'] = lambda: self.check_shaping(shaping)
+        if udp_port:
+            checks['udp'] = lambda: self.check_udp(udp_port, socks=udp_socks)
+
+        from history import run_checks
+
+        results = run_checks(checks, history)
 
         print("\n" + "=" * 60)
         print("Verification Summary")
@@ -196,12 +489,34 @@ if __name__ == '__main__':
     import sys
 
     if len(sys.argv) < 2:
-        print("Usage: verifier.py <domain>")
+        print("Usage: verifier.py <domain> [--monitor [interval]] | --udp-echo PORT")
         sys.exit(1)
 
+    if sys.argv[1] == '--udp-echo':
+        # Echo service to run on the VPS for `verify --udp`
+        server = UdpEchoServer('0.0.0.0', int(sys.argv[2]) if len(sys.argv) > 2 else 9000).start()
+        print(f"  ✓ UDP echo on 0.0.0.0:{server.port} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.close()
+        sys.exit(0)
+
     domain = sys.argv[1]
 
     verifier = Verifier(ssh_alias='customvpn', domain=domain)
+
+    if '--monitor' in sys.argv:
+        import asyncio
+        idx = sys.argv.index('--monitor')
+        interval = float(sys.argv[idx + 1]) if len(sys.argv) > idx + 1 else 30.0
+        try:
+            asyncio.run(verifier.create_monitor(interval=interval).serve_forever())
+        except KeyboardInterrupt:
+            print("\nMonitor stopped.")
+        sys.exit(0)
+
     results = verifier.verify_all()
 
     sys.exit(0 if all(results.values()) else 1)
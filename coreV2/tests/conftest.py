@@ -0,0 +1,40 @@
+"""
+Shared test setup: scripts/ on sys.path (its modules import each other as top-level modules)
+"""
+
+import os
+import sys
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+
+@pytest.fixture(scope='session')
+def self_signed_cert(tmp_path_factory):
+    """(certfile, keyfile) for 127.0.0.1, for TLS stand-ins"""
+    if not shutil.which('openssl'):
+        pytest.skip('openssl not installed')
+    directory = tmp_path_factory.mktemp('cert')
+    cert, key = directory / 'cert.pem', directory / 'key.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-keyout', str(key), '-out', str(cert)],
+                   check=True, capture_output=True)
+    return str(cert), str(key)
+
+
+@pytest.fixture
+def fake_bin(tmp_path, monkeypatch):
+    """Directory first on PATH; fake(name, source) writes a Python executable there"""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    def fake(name, source):
+        path = bin_dir / name
+        path.write_text(f"#!{sys.executable}\n{source}")
+        path.chmod(0o755)
+    return fake
@@ -0,0 +1,103 @@
+"""
+Blue/green swap on the process stand-in, and the Docker backend's shell pieces run locally
+"""
+
+import json
+import socket
+
+import pytest
+
+from blue_green import (COLOR_API_PORTS, COLOR_PORTS, BlueGreenSwap, DockerBackend, GapProbe, ProcessBackend,
+                        container_status_command, run_local, stand_in_demo)
+
+
+@pytest.fixture
+def backend():
+    backend = ProcessBackend(startup_delay=0.2)
+    yield backend
+    backend.close()
+
+
+def echo_once(sock, data=b'ping'):
+    sock.sendall(data)
+    return sock.recv(len(data))
+
+
+def test_stand_in_swaps_without_failed_probes():
+    results = stand_in_demo(drain_timeout=3.0, tunnel_seconds=0.5)
+
+    assert [result['to'] for result, _ in results] == ['green', 'blue']
+    for result, gap in results:
+        assert result['ok'] and result['connections_left'] == 0
+        assert gap['probes'] > 0 and gap['failures'] == 0
+
+
+def test_tunnel_opened_before_the_swap_keeps_its_color(backend):
+    swap = BlueGreenSwap(backend, ready_timeout=10, drain_timeout=0.5, stop_grace=1, poll_interval=0.05)
+    assert swap.run()['to'] == 'blue'
+
+    with socket.create_connection(('127.0.0.1', backend.front_port), timeout=2) as tunnel:
+        assert echo_once(tunnel) == b'ping'
+        probe = GapProbe('127.0.0.1', backend.front_port, mode='echo').start()
+        result = swap.run()
+        gap = probe.stop()
+
+        # Cut at the drain timeout, since the tunnel was still open
+        assert (result['from'], result['to']) == ('blue', 'green')
+        assert result['connections_left'] == 1
+    assert backend.active() == 'green'
+    assert gap['failures'] == 0
+
+    with socket.create_connection(('127.0.0.1', backend.front_port), timeout=2) as fresh:
+        assert echo_once(fresh) == b'ping'
+
+
+def test_new_color_that_never_listens_keeps_the_old_one(backend):
+    BlueGreenSwap(backend, ready_timeout=10).run()
+    backend.startup_delay = 30
+
+    with pytest.raises(RuntimeError, match='not ready'):
+        BlueGreenSwap(backend, ready_timeout=0.5, poll_interval=0.05).run()
+    assert backend.active() == 'blue'
+    assert 'green' not in backend.processes
+
+
+def write_xray_config(base_dir, inbounds):
+    (base_dir / 'configs').mkdir()
+    (base_dir / 'configs' / 'xray-config.json').write_text(json.dumps({'inbounds': inbounds}))
+
+
+def test_color_config_moves_public_and_api_ports(tmp_path):
+    write_xray_config(tmp_path, [
+        {'tag': 'vless-reality', 'port': 443},
+        {'tag': 'api', 'port': 10085, 'listen': '127.0.0.1'},
+        {'tag': 'other', 'port': 8080},
+    ])
+    backend = DockerBackend(run_local, tmp_path, use_sudo=False)
+
+    path = backend.write_config('green')
+
+    ports = {inbound['tag']: inbound['port'] for inbound in json.loads(open(path).read())['inbounds']}
+    assert ports == {'vless-reality': COLOR_PORTS['green'], 'api': COLOR_API_PORTS['green'], 'other': 8080}
+
+
+def test_color_config_without_public_inbound_fails(tmp_path):
+    write_xray_config(tmp_path, [{'tag': 'api', 'port': 10085}])
+
+    with pytest.raises(RuntimeError, match='no inbound on port 443'):
+        DockerBackend(run_local, tmp_path, use_sudo=False).write_config('blue')
+
+
+@pytest.mark.parametrize('state, expected', [
+    (None, ['xray\tUp 1 hour', 'nginx\tUp 1 hour']),
+    ('green', ['xray\tUp 2 minutes', 'nginx\tUp 1 hour']),
+])
+def test_container_status_lists_the_active_color_as_xray(tmp_path, fake_bin, state, expected):
+    fake_bin('docker', "print('xray\\tUp 1 hour\\nxray-blue\\tUp 5 minutes\\nxray-green\\tUp 2 minutes\\nnginx\\tUp 1 hour')\n")
+    if state:
+        (tmp_path / DockerBackend.STATE_FILE).write_text(state + '\n')
+
+    stdout, _, code = run_local(container_status_command(tmp_path))
+
+    assert code == 0
+    assert stdout.splitlines() == expected
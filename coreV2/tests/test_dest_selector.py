@@ -0,0 +1,129 @@
+"""
+DestSelector against local TLS stand-ins with and without the features Reality needs
+"""
+
+import ssl
+import socket
+import threading
+
+import pytest
+
+from dest_selector import DestProbe, DestSelector, apply_best
+
+
+class DestStandIn:
+    """TLS server playing a candidate dest site"""
+
+    def __init__(self, cert, alpn=('h2', 'http/1.1'), max_version=None, curve=None):
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.context.load_cert_chain(*cert)
+        self.context.set_alpn_protocols(list(alpn))
+        if max_version:
+            self.context.maximum_version = max_version
+        if curve:
+            self.context.set_ecdh_curve(curve)
+        self.sock = socket.create_server(('127.0.0.1', 0), backlog=64)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            with self.context.wrap_socket(conn, server_side=True) as tls:
+                tls.recv(1)
+        except (OSError, ssl.SSLError):
+            pass
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+
+
+@pytest.fixture
+def sites(self_signed_cert):
+    sites = {
+        'good.test': DestStandIn(self_signed_cert),
+        'h1.test': DestStandIn(self_signed_cert, alpn=('http/1.1',)),
+        'tls12.test': DestStandIn(self_signed_cert, max_version=ssl.TLSVersion.TLSv1_2),
+        'p256.test': DestStandIn(self_signed_cert, curve='prime256v1'),
+    }
+    yield sites
+    for site in sites.values():
+        site.close()
+
+
+def selector_for(sites, names, **options):
+    overrides = {name: ('127.0.0.1', sites[name].port) for name in names if name in sites}
+    return DestSelector(names, timeout=2, address_overrides=overrides, **options)
+
+
+def test_capabilities_of_each_stand_in(sites):
+    selector = selector_for(sites, list(sites), samples=2, verify_tls=False)
+    probes = {p.server_name: p.as_dict() for p in selector.select()}
+
+    assert probes['good.test']['eligible']
+    assert probes['h1.test']['h2'] is False and not probes['h1.test']['eligible']
+    assert probes['tls12.test']['tls13'] is False and probes['tls12.test']['error']
+    assert (probes['p256.test']['tls13'], probes['p256.test']['x25519']) == (True, False)
+    assert all(p['cert_valid'] for p in probes.values())
+
+
+def test_samples_are_collected_for_reachable_candidates(sites):
+    [probe] = selector_for(sites, ['good.test'], samples=3, verify_tls=False).select()
+
+    assert len(probe.handshake_ms) == 3 and len(probe.connect_ms) == 3
+    assert all(h >= c for c, h in zip(probe.connect_ms, probe.handshake_ms))
+
+
+def test_untrusted_certificate_is_not_eligible(sites):
+    [probe] = selector_for(sites, ['good.test'], verify_tls=True).select()
+
+    assert probe.reachable and not probe.cert_valid
+    assert probe.error.startswith('certificate:')
+
+
+def test_unreachable_candidate_ranks_last(sites):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        closed = sock.getsockname()[1]
+    selector = selector_for(sites, ['h1.test', 'good.test', 'gone.test'], verify_tls=False)
+    selector.address_overrides['gone.test'] = ('127.0.0.1', closed)
+
+    ranking = selector.select()
+
+    assert [p.server_name for p in ranking][0] == 'good.test'
+    assert not ranking[-1].reachable and ranking[-1].as_dict()['handshake_ms'] is None
+
+
+def test_rank_prefers_eligible_then_fastest():
+    def probe(name, eligible, handshake_ms):
+        p = DestProbe(name)
+        p.tls13 = p.x25519 = p.cert_valid = True
+        p.h2 = eligible
+        p.handshake_ms = handshake_ms
+        return p
+
+    ranking = DestSelector.rank([probe('slow', True, [30.0]), probe('fast-h1', False, [1.0]),
+                                 probe('fast', True, [10.0, 12.0, 50.0])])
+
+    assert [p.server_name for p in ranking] == ['fast', 'slow', 'fast-h1']
+
+
+def test_apply_best_writes_config_env(tmp_path):
+    env = tmp_path / 'config.env'
+    env.write_text("# Reality\nREALITY_DEST=old:443\nDOMAIN=vpn.example\n")
+    best = DestProbe('www.example.com', 8443)
+    best.tls13 = best.x25519 = best.h2 = best.cert_valid = True
+    worse = DestProbe('h1.example')
+
+    assert apply_best([worse], env) is None
+    assert apply_best([best, worse], env) is best
+    assert env.read_text() == ("# Reality\nREALITY_DEST=www.example.com:8443\nDOMAIN=vpn.example\n"
+                               "REALITY_SERVER_NAMES=www.example.com\n")
@@ -0,0 +1,36 @@
+"""
+Bulk profile export with users whose emails share a local part
+"""
+
+import json
+
+from client_formats import ServerProfile
+from exporters import export_profiles
+
+SERVER = ServerProfile('vpn.example.com', 'www.example.com', 'A' * 43)
+USERS = [
+    {'uuid': '11111111-0000-0000-0000-000000000001', 'short_id': 'aa', 'email': 'alice@x'},
+    {'uuid': '22222222-0000-0000-0000-000000000002', 'short_id': 'bb', 'email': 'alice@y'},
+    {'uuid': '33333333-0000-0000-0000-000000000003', 'short_id': 'cc', 'email': 'bob@x'},
+]
+
+
+def test_colliding_local_parts_get_distinct_names(tmp_path):
+    export_profiles(USERS, SERVER, tmp_path, formats=('singbox', 'clash'))
+
+    outbounds = json.loads((tmp_path / 'singbox.json').read_text())['outbounds']
+    tags = [o['tag'] for o in outbounds if o['type'] == 'vless']
+    assert tags == ['CustomVPN-alice', 'CustomVPN-22222222-alice', 'CustomVPN-bob']
+    selector = next(o for o in outbounds if o['type'] == 'selector')
+    assert selector['outbounds'] == tags
+
+    clash = (tmp_path / 'clash.yaml').read_text()
+    assert '"CustomVPN-22222222-alice"' in clash.split('proxy-groups:')[0]
+    assert 'proxies: ["CustomVPN-alice", "CustomVPN-22222222-alice", "CustomVPN-bob"]' in clash
+
+
+def test_per_user_documents_keep_plain_names(tmp_path):
+    export_profiles(USERS, SERVER, tmp_path, formats=('singbox',), per_user=True)
+
+    document = json.loads((tmp_path / 'singbox' / f"{USERS[1]['uuid']}.json").read_text())
+    assert document['outbounds'][0]['tag'] == 'CustomVPN-alice'
@@ -0,0 +1,146 @@
+"""
+Layer-deduplicating image transfer between synthetic `docker save` archives and a directory store
+"""
+
+import io
+import json
+import hashlib
+import tarfile
+
+import pytest
+
+from image_transfer import DirectoryImageStore, DockerHost, ImageArchive, ImageTransferError, chain_ids, transfer
+
+
+def sha256(data):
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+def make_archive(path, images):
+    """docker save layout for {tag: [layer bytes, ...]} (base layer first)"""
+    with tarfile.open(path, 'w') as tar:
+        def add(name, data):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+        manifest = []
+        for tag, layers in images.items():
+            config = json.dumps({'rootfs': {'type': 'layers', 'diff_ids': [sha256(l) for l in layers]}}).encode()
+            config_name = sha256(config).split(':')[1] + '.json'
+            add(config_name, config)
+            paths = []
+            for layer in layers:
+                paths.append(f"{sha256(layer).split(':')[1]}/layer.tar")
+                add(paths[-1], layer)
+            manifest.append({'Config': config_name, 'RepoTags': [tag], 'Layers': paths})
+        add('manifest.json', json.dumps(manifest).encode())
+    return ImageArchive(path)
+
+
+BASE = b'alpine rootfs' * 1000
+XRAY = b'xray binary' * 1000
+NGINX = b'nginx binary' * 1000
+
+
+def test_chain_ids_depend_on_the_layers_below():
+    assert chain_ids(['sha256:a']) == ['sha256:a']
+    assert chain_ids(['sha256:a', 'sha256:b'])[1] == sha256(b'sha256:a sha256:b')
+    assert chain_ids(['sha256:x', 'sha256:b'])[1] != chain_ids(['sha256:a', 'sha256:b'])[1]
+
+
+def test_only_missing_layers_are_sent(tmp_path):
+    store = DirectoryImageStore(tmp_path / 'store')
+
+    first = transfer(make_archive(tmp_path / 'xray.tar', {'xray:latest': [BASE, XRAY]}), store)
+    assert (first['layers_sent'], first['layers_skipped']) == (2, 0)
+    assert first['loaded'] == ['Loaded image: xray:latest']
+
+    # nginx shares the base layer
+    second = transfer(make_archive(tmp_path / 'nginx.tar', {'nginx:alpine': [BASE, NGINX]}), store)
+    assert (second['layers_sent'], second['layers_skipped']) == (1, 1)
+    assert second['raw_sent'] == len(NGINX) and second['raw_skipped'] == len(BASE)
+    assert second['sent_bytes'] < first['sent_bytes']
+
+    again = transfer(make_archive(tmp_path / 'both.tar', {'xray:latest': [BASE, XRAY], 'nginx:alpine': [BASE, NGINX]}),
+                     store)
+    assert again['layers_sent'] == 0
+    assert sorted(again['loaded']) == ['Loaded image: nginx:alpine', 'Loaded image: xray:latest']
+
+
+def test_same_layer_on_another_base_is_sent(tmp_path):
+    store = DirectoryImageStore(tmp_path / 'store')
+    transfer(make_archive(tmp_path / 'a.tar', {'a': [BASE, XRAY]}), store)
+
+    stats = transfer(make_archive(tmp_path / 'b.tar', {'b': [b'debian rootfs', XRAY]}), store)
+
+    assert stats['layers_sent'] == 2
+
+
+def test_full_sends_everything(tmp_path):
+    store = DirectoryImageStore(tmp_path / 'store')
+    archive = make_archive(tmp_path / 'xray.tar', {'xray:latest': [BASE, XRAY]})
+    transfer(archive, store)
+
+    assert transfer(archive, store, full=True)['layers_sent'] == 2
+
+
+def test_store_rejects_bundles_missing_layers(tmp_path):
+    store = DirectoryImageStore(tmp_path / 'store')
+    archive = make_archive(tmp_path / 'xray.tar', {'xray:latest': [BASE, XRAY]})
+    claimed = set(chain_ids([sha256(BASE), sha256(XRAY)]))
+
+    with pytest.raises(ImageTransferError, match='neither in the store nor the bundle'):
+        store.load(lambda fileobj: archive.write_bundle(fileobj, claimed))
+
+
+def test_store_rejects_corrupted_layers(tmp_path):
+    make_archive(tmp_path / 'xray.tar', {'xray:latest': [BASE]})
+    with tarfile.open(tmp_path / 'xray.tar') as source, tarfile.open(tmp_path / 'bad.tar', 'w') as bad:
+        for member in source:
+            data = source.extractfile(member).read()
+            if member.name.endswith('layer.tar'):
+                data = data[:-1] + b'!'
+            bad.addfile(member, io.BytesIO(data))
+
+    with pytest.raises(ImageTransferError, match='does not match its DiffID'):
+        transfer(ImageArchive(tmp_path / 'bad.tar'), DirectoryImageStore(tmp_path / 'store'))
+
+
+def test_archive_without_manifest(tmp_path):
+    with tarfile.open(tmp_path / 'plain.tar', 'w'):
+        pass
+
+    with pytest.raises(ImageTransferError, match='no manifest.json'):
+        ImageArchive(tmp_path / 'plain.tar')
+
+
+def test_docker_host_reads_layers_and_streams_into_docker_load(tmp_path, fake_bin):
+    received = tmp_path / 'received.tar.gz'
+    fake_bin('docker', f"""import sys, json
+args = sys.argv[1:]
+if args[:2] == ['image', 'ls']:
+    print('img1')
+elif args[:2] == ['image', 'inspect']:
+    print(json.dumps({[sha256(BASE)]!r}))
+elif args == ['load']:
+    open({str(received)!r}, 'wb').write(sys.stdin.buffer.read())
+    print('Loaded image: xray:latest')
+""")
+    archive = make_archive(tmp_path / 'xray.tar', {'xray:latest': [BASE, XRAY]})
+
+    stats = transfer(archive, DockerHost())
+
+    assert (stats['layers_sent'], stats['layers_skipped']) == (1, 1)
+    assert stats['loaded'] == ['Loaded image: xray:latest']
+    assert received.stat().st_size == stats['sent_bytes']
+    with tarfile.open(received, 'r:gz') as bundle:
+        assert f"{sha256(BASE).split(':')[1]}/layer.tar" not in bundle.getnames()
+
+
+def test_docker_load_failure(tmp_path, fake_bin):
+    fake_bin('docker', "import sys\nsys.stdin.buffer.read()\nif sys.argv[1:] == ['load']:\n"
+                       "    sys.exit('open /var/lib/docker/tmp: no space left on device')\n")
+
+    with pytest.raises(ImageTransferError, match='no space left'):
+        transfer(make_archive(tmp_path / 'x.tar', {'x': [BASE]}), DockerHost())
@@ -0,0 +1,140 @@
+"""
+LoadTester against a local TLS stand-in (and ports that refuse or never answer)
+"""
+
+import ssl
+import json
+import socket
+import threading
+from collections import Counter
+
+import pytest
+
+from load_tester import LoadTester, classify_error, server_names_from_config
+
+
+class TlsServer:
+    """Completes TLS handshakes and records the SNI of each; handshake=False only accepts"""
+
+    def __init__(self, cert, handshake=True):
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.context.load_cert_chain(*cert)
+        self.context.sni_callback = lambda sock, name, context: self.names.update([name])
+        self.names = Counter()
+        self.handshake = handshake
+        self.held = []
+        self.sock = socket.create_server(('127.0.0.1', 0), backlog=128)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            with self.context.wrap_socket(conn, server_side=True) as tls:
+                tls.recv(1)
+        except (OSError, ssl.SSLError):
+            pass
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            if self.handshake:
+                threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+            else:
+                self.held.append(conn)
+
+    def close(self):
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+        for conn in self.held:
+            conn.close()
+
+
+@pytest.fixture
+def server(self_signed_cert):
+    servers = []
+
+    def start(**options):
+        servers.append(TlsServer(self_signed_cert, **options))
+        return servers[-1]
+
+    yield start
+    for s in servers:
+        s.close()
+
+
+def test_handshakes_rotate_server_names(server):
+    target = server()
+    tester = LoadTester('127.0.0.1', target.port, server_names=['a.example', 'b.example'],
+                        connections=20, concurrency=5, timeout=5)
+
+    report = tester.run()
+
+    assert (report['attempted'], report['succeeded'], report['failed']) == (20, 20, 0)
+    assert target.names == {'a.example': 10, 'b.example': 10}
+    hs = report['handshake_ms']
+    assert 0 < hs['min'] <= hs['p50'] <= hs['p95'] <= hs['p99'] <= hs['max']
+    assert report['connections_per_second'] > 0
+
+
+def test_worker_processes_split_the_connections(server):
+    target = server()
+
+    report = LoadTester('127.0.0.1', target.port, connections=9, concurrency=3, timeout=5).run(workers=2)
+
+    assert report['workers'] == 2
+    assert report['succeeded'] == 9
+    assert sum(target.names.values()) == 9
+
+
+def test_refused_connections_are_counted():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    report = LoadTester('127.0.0.1', port, connections=4, timeout=1).run()
+
+    assert report['succeeded'] == 0
+    assert report['errors'] == {'refused': 4}
+    assert report['handshake_ms']['p50'] is None
+
+
+def test_stalled_handshakes_time_out(server):
+    target = server(handshake=False)
+
+    report = LoadTester('127.0.0.1', target.port, connections=3, timeout=0.2).run()
+
+    assert report['errors'] == {'timeout': 3}
+
+
+def test_summarize_merges_worker_samples():
+    tester = LoadTester('h', connections=5)
+    report = tester.summarize([
+        {'latencies': [0.003, 0.001], 'errors': {'refused': 1}, 'wall': 1.0, 'cpu': 0.1},
+        {'latencies': [0.002, 0.004], 'errors': {'refused': 1, 'timeout': 1}, 'wall': 2.0, 'cpu': 0.3},
+    ])
+
+    assert report['succeeded'] == 4 and report['failed'] == 3
+    assert report['errors'] == {'refused': 2, 'timeout': 1}
+    assert report['wall_seconds'] == 2.0 and report['connections_per_second'] == 2.0
+    assert report['handshake_ms']['min'] == 1.0 and report['handshake_ms']['max'] == 4.0
+    assert report['client_cpu_percent'] == 20.0
+
+
+def test_classify_error():
+    assert classify_error(ConnectionResetError()) == 'reset'
+    assert classify_error(ssl.SSLError(1, 'boom')) == 'ssl:SSLError'
+    assert classify_error(OSError(113, 'No route to host')) == 'os:113'
+    assert classify_error(ValueError()) == 'ValueError'
+
+
+def test_server_names_from_config(tmp_path):
+    path = tmp_path / 'xray-config.json'
+    path.write_text(json.dumps({'inbounds': [
+        {'tag': 'api'},
+        {'streamSettings': {'realitySettings': {'serverNames': ['www.example.com', 'example.com']}}},
+    ]}))
+
+    assert server_names_from_config(path) == ['www.example.com', 'example.com']
@@ -0,0 +1,171 @@
+"""
+HealthMonitor rounds against local TCP, TLS, HTTP and container-list stand-ins
+"""
+
+import ssl
+import sys
+import socket
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from history import HistoryStore, quantile
+from monitor import HealthMonitor, LatencyHistogram, RingBuffer
+
+
+class Listener:
+    """TCP (optionally TLS) server that completes the handshake and closes"""
+
+    def __init__(self, context=None):
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.context = context
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            try:
+                if self.context:
+                    conn = self.context.wrap_socket(conn, server_side=True)
+            except (OSError, ssl.SSLError):
+                pass
+            conn.close()
+
+    def close(self):
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """GET /<status> answers with that status"""
+
+    def do_GET(self):
+        self.send_response(int(self.path.strip('/') or 200))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_ins(self_signed_cert):
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(*self_signed_cert)
+    tcp, tls = Listener(), Listener(context)
+    http = ThreadingHTTPServer(('127.0.0.1', 0), StatusHandler)
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    yield tcp.port, tls.port, f"http://127.0.0.1:{http.server_address[1]}"
+    http.shutdown()
+    http.server_close()
+    tcp.close()
+    tls.close()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def containers(*lines):
+    return [sys.executable, '-c', f"print({chr(10).join(lines)!r})"]
+
+
+def test_healthy_round(stand_ins, tmp_path):
+    tcp_port, tls_port, http = stand_ins
+    history = HistoryStore(tmp_path)
+    monitor = HealthMonitor('127.0.0.1', ports=[tcp_port], tls_port=tls_port, http_url=f"{http}/200",
+                            container_command=containers('xray\tUp 2 hours', 'nginx\tUp 2 hours'),
+                            expected_containers=('xray', 'nginx'), verify_tls=False, timeout=5, history=history)
+
+    results = asyncio.run(monitor.run_once())
+
+    assert set(results) == {f"port_{tcp_port}", 'tls_handshake', 'http', 'containers'}
+    assert all(result.ok for result in results.values()), {n: r.error for n, r in results.items()}
+    assert history.metrics() == sorted(f"{name}.{kind}" for name in results for kind in ('latency_ms', 'up'))
+
+    metrics = monitor.render_metrics()
+    assert f'customvpn_probe_up{{probe="port_{tcp_port}",host="127.0.0.1"}} 1' in metrics
+    assert 'customvpn_probe_latency_seconds_count{probe="tls_handshake",host="127.0.0.1"} 1' in metrics
+    assert 'customvpn_monitor_rounds_total 1' in metrics
+
+
+def test_failed_probes(stand_ins):
+    _, _, http = stand_ins
+    port = closed_port()
+    monitor = HealthMonitor('127.0.0.1', ports=[port], tls_port=None, http_url=f"{http}/502",
+                            container_command=containers('xray\tExited (1) 3 minutes ago', 'nginx\tUp 2 hours'),
+                            timeout=5)
+
+    results = asyncio.run(monitor.run_once())
+
+    assert not any(result.ok for result in results.values())
+    assert results['http'].error == 'HTTP status 502'
+    assert results['containers'].error == 'not running: xray'
+    assert results[f"port_{port}"].error.startswith('ConnectionRefusedError')
+    # A refused connect has no latency to record
+    assert monitor.histograms[f"port_{port}"].total == 0
+    assert f'customvpn_probe_failures_total{{probe="port_{port}",host="127.0.0.1"}} 1' in monitor.render_metrics()
+
+
+def test_timeout_is_a_failure_not_a_sample():
+    monitor = HealthMonitor('127.0.0.1', ports=[], tls_port=None, timeout=0.2,
+                            container_command=[sys.executable, '-c', 'import time; time.sleep(5)'])
+
+    result = asyncio.run(monitor.run_once())['containers']
+
+    assert not result.ok and result.error == 'timeout after 0.2s'
+    assert monitor.histograms['containers'].total == 0
+
+
+def test_run_stops_after_rounds(stand_ins):
+    tcp_port, _, _ = stand_ins
+    monitor = HealthMonitor('127.0.0.1', ports=[tcp_port], tls_port=None, interval=0.01)
+
+    asyncio.run(monitor.run(rounds=3))
+
+    assert monitor.rounds == 3
+    assert monitor.histograms[f"port_{tcp_port}"].total == 3
+
+
+def test_metrics_endpoint():
+    async def fetch(path):
+        monitor = HealthMonitor('127.0.0.1', ports=[], tls_port=None)
+        server = await monitor.serve_metrics(port=0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+        return response.decode()
+
+    assert asyncio.run(fetch('/metrics')).startswith('HTTP/1.1 200 OK')
+    assert 'customvpn_monitor_rounds_total 0' in asyncio.run(fetch('/metrics?x=1'))
+    assert asyncio.run(fetch('/')).startswith('HTTP/1.1 404')
+
+
+def test_histogram_buckets():
+    hist = LatencyHistogram(buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.05, 0.05, 3.0):
+        hist.observe(seconds)
+
+    assert list(hist.counts) == [1, 2, 1]
+    assert hist.total == 4
+    assert hist.sum == pytest.approx(3.105)
+
+
+def test_recent_quantiles_match_history():
+    ring = RingBuffer(4)
+    for value in (9.0, 1.0, 2.0, 3.0, 4.0):
+        ring.append(value)
+
+    assert ring.values() == [1.0, 2.0, 3.0, 4.0]
+    assert [ring.quantile(q) for q in (0.5, 0.95)] == [2.0, 4.0]
+    assert [ring.quantile(q) for q in (0.5, 0.95)] == [quantile([1.0, 2.0, 3.0, 4.0], q) for q in (0.5, 0.95)]
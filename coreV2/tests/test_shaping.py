@@ -0,0 +1,114 @@
+"""
+Shaping plans applied and verified against RecordingRunner (a dry run), and the Xray side they render
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from config_generator import COMPOSE_OVERRIDE, ConfigGenerator
+from shaping import IFB_DEVICE, RecordingRunner, ShapingPlan, parse_tiers, shaping_from_config
+
+CONFIG_DIR = Path(__file__).resolve().parent.parent / 'configs'
+
+
+@pytest.fixture
+def plan():
+    return ShapingPlan(parse_tiers('2=10mbit,1=50mbit:100mbit:512k'), interface='ens3', link_rate='1gbit')
+
+
+def test_parse_tiers_orders_by_level_and_defaults_ceil_and_burst():
+    tiers = parse_tiers('2=10mbit, 1=50mbit:100mbit:512k,')
+
+    assert [t.as_dict() for t in tiers] == [
+        {'level': 1, 'rate': '50mbit', 'ceil': '100mbit', 'burst': '512k'},
+        {'level': 2, 'rate': '10mbit', 'ceil': '10mbit', 'burst': '256k'},
+    ]
+
+
+@pytest.mark.parametrize('spec', ['0=10mbit', '1=fast', '1=10mbit:lots', '1=10mbit:20mbit:1x'])
+def test_parse_tiers_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_tiers(spec)
+
+
+@pytest.mark.parametrize('options', [{'interface': 'eth0; reboot'}, {'interface': ''}, {'link_rate': '1 gbit'}])
+def test_plan_rejects_values_that_reach_the_shell(options):
+    with pytest.raises(ValueError):
+        ShapingPlan(parse_tiers('1=10mbit'), **options)
+
+
+def test_shaping_from_config():
+    assert shaping_from_config({}) is None
+    plan = shaping_from_config({'SHAPING_TIERS': '1=20mbit', 'SHAPING_INTERFACE': 'ens3'})
+    assert (plan.interface, plan.link_rate, [t.level for t in plan.tiers]) == ('ens3', '1gbit', [1])
+
+
+def test_dry_run_applies_and_verifies_clean(plan):
+    runner = RecordingRunner()
+
+    assert plan.apply(runner) == []
+    assert all(command.startswith('sudo sh -c ') for command in runner.commands)
+    assert runner.classes['ens3'] == runner.classes[IFB_DEVICE] == {
+        '1:1': '1gbit', '1:10': '1gbit', '1:101': '50mbit', '1:102': '10mbit'}
+    assert plan.verify(runner) == []
+
+
+def test_reapplying_is_idempotent(plan):
+    runner = RecordingRunner()
+    plan.apply(runner)
+    first = list(runner.commands)
+    plan.apply(runner)
+
+    assert runner.commands == first + first
+    assert plan.verify(runner) == []
+
+
+def test_verify_reports_drift(plan):
+    runner = RecordingRunner()
+    plan.apply(runner, sudo=False)
+    runner.classes['ens3']['1:101'] = '20Mbit'
+    del runner.classes[IFB_DEVICE]['1:102']
+    runner.ingress.clear()
+
+    assert plan.verify(runner) == [
+        'ens3: class 1:101 rate 20Mbit, expected 50mbit',
+        f'{IFB_DEVICE}: class 1:102 (level 2) missing',
+        f'ens3: ingress is not redirected to {IFB_DEVICE}',
+    ]
+
+
+def test_failed_commands_are_reported(plan):
+    def runner(command):
+        return '', 'RTNETLINK answers: Operation not permitted\n', 2 if 'modprobe' in command else 0
+
+    assert plan.apply(runner) == [('modprobe ifb numifbs=1', 'RTNETLINK answers: Operation not permitted')]
+
+
+def test_xray_config_routes_tier_users_to_marked_outbounds(plan, tmp_path):
+    generator = ConfigGenerator(CONFIG_DIR, tmp_path)
+    clients = generator.build_clients([
+        {'uuid': '00000000-0000-0000-0000-000000000001', 'email': 'free@x', 'level': 0},
+        {'uuid': '00000000-0000-0000-0000-000000000002', 'email': 'gold@x', 'level': 1},
+        {'uuid': '00000000-0000-0000-0000-000000000003', 'email': 'slow@x', 'level': 2},
+    ])
+    path = generator.render_xray_config(None, 'example.com:443', ['example.com'], 'key', ['ab'],
+                                        clients=clients, shaping=plan)
+    config = json.loads(Path(path).read_text())
+
+    marks = {o['tag']: o['streamSettings']['sockopt']['mark'] for o in config['outbounds'] if 'streamSettings' in o}
+    assert marks == {'direct-l1': 0x101, 'direct-l2': 0x102}
+    rules = [r for r in config['routing']['rules'] if r.get('outboundTag', '').startswith('direct-l')]
+    assert rules == [{'type': 'field', 'user': ['gold@x'], 'outboundTag': 'direct-l1'},
+                     {'type': 'field', 'user': ['slow@x'], 'outboundTag': 'direct-l2'}]
+    assert set(config['policy']['levels']) == {'0', '1', '2'}
+
+
+def test_compose_override_only_while_shaping(plan, tmp_path):
+    generator = ConfigGenerator(CONFIG_DIR, tmp_path)
+
+    override = generator.write_compose_override(plan)
+    assert 'network_mode: host' in override.read_text()
+    assert generator.write_compose_override(None) is None
+    assert not (tmp_path / COMPOSE_OVERRIDE).exists()
@@ -0,0 +1,162 @@
+"""
+Stats collection from a fake statsquery HTTP endpoint and fake xray/ssh/docker commands
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from blue_green import DockerBackend
+from stats_collector import (DOWNLINK, UPLINK, CommandStatsSource, HttpStatsSource, RollupStore, StatsCollector,
+                             TrafficAggregator, parse_stat_name, parse_statsquery)
+
+T0 = 1_700_000_040  # start of a minute
+
+
+class FakeXrayApi:
+    """statsquery-format endpoint over counters the test bumps; reset=1 zeroes them after reading"""
+
+    def __init__(self):
+        self.counters = {}
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                reset = parse_qs(urlparse(self.path).query).get('reset') == ['1']
+                body = json.dumps({'stat': [{'name': n, 'value': v} for n, v in api.counters.items()]}).encode()
+                if reset:
+                    api.counters = dict.fromkeys(api.counters, 0)
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/stats"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def add(self, user, up=0, down=0):
+        for direction, value in (('uplink', up), ('downlink', down)):
+            name = f"user>>>{user}>>>traffic>>>{direction}"
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CumulativeSource:
+    """Source without reset-on-read"""
+
+    def __init__(self, *batches):
+        self.batches = list(batches)
+
+    def query(self, reset=True):
+        return self.batches.pop(0), False
+
+
+@pytest.fixture
+def api():
+    api = FakeXrayApi()
+    yield api
+    api.close()
+
+
+def test_parse_stat_name():
+    assert parse_stat_name('user>>>alice@vpn>>>traffic>>>uplink') == ('user', 'alice@vpn', UPLINK)
+    assert parse_stat_name('inbound>>>vless-in>>>traffic>>>downlink') == ('inbound', 'vless-in', DOWNLINK)
+    assert parse_stat_name('user>>>alice@vpn>>>online>>>count') is None
+    assert parse_stat_name('user>>>alice@vpn>>>traffic>>>sideways') is None
+    assert parse_statsquery('{}') == {} and parse_statsquery('') == {}
+
+
+def test_http_endpoint_to_rollups(api):
+    store = RollupStore(':memory:')
+    collector = StatsCollector(HttpStatsSource(api.url), store)
+
+    api.add('alice@vpn', up=100, down=1000)
+    api.add('bob@vpn', down=50)
+    assert collector.poll_once(now=T0 + 5) == 3
+    api.add('alice@vpn', up=1, down=2)
+    collector.poll_once(now=T0 + 30)
+    assert collector.aggregator.totals() == {'alice@vpn': (101, 1002), 'bob@vpn': (0, 50)}
+
+    api.add('alice@vpn', down=7)
+    collector.poll_once(now=T0 + 65)
+    # Only the first minute has ended
+    assert collector.flush(now=T0 + 65) == 2
+    assert collector.flush(now=T0 + 65, final=True) == 1
+
+    assert store.top() == [('alice@vpn', 101, 1009), ('bob@vpn', 0, 50)]
+    assert store.history('alice@vpn') == [(T0, 101, 1002), (T0 + 60, 0, 7)]
+
+
+def test_cumulative_counters_become_deltas():
+    name = 'user>>>alice@vpn>>>traffic>>>downlink'
+    # The third batch is lower: xray restarted and its counters started over
+    collector = StatsCollector(CumulativeSource({name: 100}, {name: 250}, {name: 30}), RollupStore(':memory:'))
+
+    for offset in (0, 10, 20):
+        collector.poll_once(now=T0 + offset)
+
+    assert collector.aggregator.totals() == {'alice@vpn': (0, 280)}
+
+
+def test_ring_wrap_keeps_unflushed_buckets():
+    aggregator = TrafficAggregator(bucket_seconds=60, buckets=2)
+    for minute in range(3):
+        aggregator.add_counters({'user>>>a>>>traffic>>>uplink': minute + 1}, T0 + minute * 60)
+
+    rows = aggregator.drain_completed(now=T0 + 180, include_current=True)
+
+    assert sorted(rows) == [('user', 'a', T0 + m * 60, m + 1, 0) for m in range(3)]
+
+
+def test_rollup_upserts_add_up(tmp_path):
+    store = RollupStore(tmp_path / 'stats' / 'traffic.db')
+    store.write([('user', 'a', T0, 1, 2)])
+    store.write([('user', 'a', T0, 10, 20), ('inbound', 'vless-in', T0, 5, 5)])
+
+    assert store.history('a') == [(T0, 11, 22)]
+    assert store.top(kind='inbound') == [('vless-in', 5, 5)]
+    store.close()
+
+
+def test_command_source_runs_one_batched_query(fake_bin, tmp_path):
+    log = tmp_path / 'argv.json'
+    fake_bin('xray', f"import json, sys\njson.dump(sys.argv[1:], open({str(log)!r}, 'w'))\n"
+                     "print(json.dumps({'stat': [{'name': 'user>>>a>>>traffic>>>uplink', 'value': '42'}]}))\n")
+
+    counters, is_delta = CommandStatsSource('127.0.0.1:10085').query()
+
+    assert (counters, is_delta) == ({'user>>>a>>>traffic>>>uplink': 42}, True)
+    assert json.loads(log.read_text()) == ['api', 'statsquery', '--server=127.0.0.1:10085', '-pattern=', '-reset']
+
+
+def test_command_source_failure(fake_bin):
+    fake_bin('xray', "import sys\nsys.exit('failed to dial 127.0.0.1:10085')\n")
+
+    with pytest.raises(RuntimeError, match='failed to dial'):
+        CommandStatsSource().query()
+
+
+@pytest.mark.parametrize('state, container, server', [
+    (None, 'xray', '127.0.0.1:10085'),
+    ('green', 'xray-green', '127.0.0.1:10087'),
+])
+def test_over_ssh_queries_the_active_color(fake_bin, tmp_path, state, container, server):
+    # ssh runs the joined words in a local shell, as the remote login shell would
+    fake_bin('ssh', "import os, sys\nos.execvp('sh', ['sh', '-c', ' '.join(sys.argv[2:])])\n")
+    fake_bin('docker', "import json, sys\nprint(json.dumps({'stat': [{'name': ' '.join(sys.argv[1:]), 'value': 1}]}))\n")
+    if state:
+        (tmp_path / DockerBackend.STATE_FILE).write_text(state)
+
+    counters, _ = CommandStatsSource.over_ssh('vps', tmp_path).query()
+
+    assert list(counters) == [f"exec {container} xray api statsquery --server={server} -pattern= -reset"]
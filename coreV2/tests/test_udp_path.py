@@ -0,0 +1,138 @@
+"""
+UDP path measurement (measure_udp / check_udp) against the UdpEchoServer stand-in
+"""
+
+import socket
+import struct
+import threading
+
+import pytest
+
+from client_formats import ServerProfile, xray_mux
+from verifier import UdpEchoServer, Verifier, measure_udp
+
+
+@pytest.fixture
+def echo():
+    servers = []
+
+    def start(**options):
+        server = UdpEchoServer(**options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+class Socks5UdpRelay:
+    """Minimal SOCKS5 server that only does UDP ASSOCIATE, standing in for an Xray client"""
+
+    def __init__(self):
+        self.control = socket.create_server(('127.0.0.1', 0))
+        self.port = self.control.getsockname()[1]
+        self.relay = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.relay.bind(('127.0.0.1', 0))
+        self.relayed = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+        threading.Thread(target=self._relay, daemon=True).start()
+
+    def _accept(self):
+        try:
+            conn, _ = self.control.accept()
+        except OSError:
+            return
+        conn.recv(3)
+        conn.sendall(b'\x05\x00')
+        conn.recv(10)
+        conn.sendall(b'\x05\x00\x00\x01' + socket.inet_aton('0.0.0.0') + struct.pack('!H', self.relay.getsockname()[1]))
+        conn.recv(1)  # held open for the association's lifetime
+
+    def _relay(self):
+        upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client = None
+        while True:
+            try:
+                data, address = self.relay.recvfrom(65535)
+            except OSError:
+                return
+            if address[1] == self.relay.getsockname()[1]:
+                continue
+            if data[:4] == b'\x00\x00\x00\x03':
+                length = data[4]
+                host = data[5:5 + length].decode()
+                port, = struct.unpack('!H', data[5 + length:7 + length])
+                client, header = address, data[:7 + length]
+                upstream.sendto(data[7 + length:], (host, port))
+                reply = upstream.recv(65535)
+                self.relayed += 1
+                self.relay.sendto(header + reply, client)
+
+    def close(self):
+        self.control.close()
+        self.relay.close()
+
+
+def test_lossless_echo_reports_every_datagram(echo):
+    server = echo()
+    result = measure_udp('127.0.0.1', server.port, count=20, interval=0.001, timeout=0.5)
+
+    assert result['sent'] == result['received'] == 20
+    assert result['loss'] == 0
+    assert 0 < result['rtt_min'] <= result['rtt_avg'] <= result['rtt_p95'] <= result['rtt_max']
+    assert result['jitter'] >= 0
+
+
+def test_dropped_datagrams_count_as_loss(echo):
+    server = echo(drop_every=4)
+    result = measure_udp('127.0.0.1', server.port, count=20, interval=0.001, timeout=0.3)
+
+    assert result['received'] == 15
+    assert result['loss'] == pytest.approx(0.25)
+
+
+def test_reply_delay_shows_in_rtt(echo):
+    server = echo(delay=0.05)
+    result = measure_udp('127.0.0.1', server.port, count=5, interval=0.001, timeout=0.5)
+
+    assert result['received'] == 5
+    assert result['rtt_min'] >= 50
+
+
+def test_nothing_listening_reports_no_rtt():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    result = measure_udp('127.0.0.1', port, count=3, interval=0.001, timeout=0.2)
+
+    assert result['received'] == 0
+    assert result['loss'] == 1
+    assert result['rtt_avg'] is None and result['jitter'] is None
+
+
+def test_measures_through_socks_udp_associate(echo):
+    server = echo()
+    proxy = Socks5UdpRelay()
+    try:
+        result = measure_udp('127.0.0.1', server.port, count=10, interval=0.001, timeout=0.5,
+                             socks=('127.0.0.1', proxy.port))
+    finally:
+        proxy.close()
+
+    assert result['received'] == 10
+    assert proxy.relayed == 10
+
+
+def test_check_udp_judges_loss_and_latency(echo):
+    verifier = Verifier('unused', '127.0.0.1')
+
+    assert verifier.check_udp(echo().port, count=20, interval=0.001)
+    assert not verifier.check_udp(echo(drop_every=2).port, count=20, interval=0.001)
+    assert not verifier.check_udp(echo(delay=0.03).port, count=5, interval=0.001, max_rtt_ms=10)
+
+
+def test_udp_mode_mux_block():
+    assert xray_mux(ServerProfile('d', 'sni', 'pk')) is None
+    assert xray_mux(ServerProfile('d', 'sni', 'pk', xudp_concurrency=8)) == {
+        'enabled': True, 'concurrency': -1, 'xudpConcurrency': 8, 'xudpProxyUDP443': 'reject'}
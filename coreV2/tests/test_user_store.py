@@ -0,0 +1,65 @@
+"""
+Incremental per-shard config generation from the SQLite user store
+"""
+
+from pathlib import Path
+
+import pytest
+
+from config_generator import ConfigGenerator
+from user_store import UserStore
+
+CONFIG_DIR = Path(__file__).resolve().parent.parent / 'configs'
+PRIVATE_KEY = 'A' * 43
+
+
+@pytest.fixture
+def generate(tmp_path):
+    generator = ConfigGenerator(CONFIG_DIR, tmp_path / 'generated')
+
+    def run(store, **options):
+        return generator.generate_from_store(store, 'www.example.com:443', ['www.example.com'], PRIVATE_KEY,
+                                             **options)
+    run.generator = generator
+    return run
+
+
+def uuid(n):
+    return f"00000000-0000-0000-0000-{n:012d}"
+
+
+def test_no_enabled_users_is_an_explicit_error(tmp_path, generate):
+    store = UserStore(tmp_path / 'users.db')
+    with pytest.raises(ValueError, match='No enabled users'):
+        generate(store)
+
+    store.add_user(uuid(1), email='a@x')
+    store.update_user(uuid(1), enabled=0)
+    with pytest.raises(ValueError, match='No enabled users'):
+        generate(store)
+
+
+def test_only_changed_shards_are_rebuilt(tmp_path, generate):
+    store = UserStore(tmp_path / 'users.db', shard_count=4)
+    for n in range(1, 9):
+        store.add_user(uuid(n), email=f"u{n}@x", shard=n % 2)
+
+    assert sorted(generate(store)) == [0, 1]
+    assert [p.name for p in generate.generator.shard_configs(store)] == [
+        'xray-config.shard-0.json', 'xray-config.shard-1.json']
+    assert generate(store) == {}
+
+    store.add_user(uuid(9), email='u9@x', shard=3)
+    assert sorted(generate(store)) == [3]
+
+
+def test_shard_that_loses_its_users_loses_its_config(tmp_path, generate):
+    store = UserStore(tmp_path / 'users.db', shard_count=2)
+    store.add_user(uuid(1), email='a@x', shard=0)
+    store.add_user(uuid(2), email='b@x', shard=1)
+    generate(store)
+
+    store.remove_user(uuid(2))
+
+    assert generate(store) == {}
+    assert [p.name for p in generate.generator.shard_configs(store)] == ['xray-config.shard-0.json']